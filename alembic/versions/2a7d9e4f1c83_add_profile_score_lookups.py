@@ -0,0 +1,70 @@
+"""add profile score lookups
+
+Revision ID: 2a7d9e4f1c83
+Revises: 4e7c2b9d1a60
+Create Date: 2026-10-18 16:02:17.538210
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '2a7d9e4f1c83'
+down_revision = '4e7c2b9d1a60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'profile_score_lookups',
+        sa.Column('profile_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Integer(), nullable=False),
+        sa.Column(
+            'dart',
+            postgresql.ENUM(
+                'one',
+                'two',
+                'three',
+                name='dart_numbers',
+                create_type=False,
+            ),
+            nullable=False,
+        ),
+        sa.Column(
+            'shot_type',
+            postgresql.ENUM(
+                'single',
+                'treble',
+                'bull',
+                'outer_bull',
+                'double',
+                name='shot_types',
+                create_type=False,
+            ),
+            nullable=False,
+        ),
+        sa.Column('hit_points', sa.Integer(), nullable=False),
+        sa.Column('miss_points', sa.Integer(), nullable=True),
+        sa.Column('big_miss_points', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['profile_id'], ['profiles.id'], ),
+        sa.PrimaryKeyConstraint('profile_id', 'score', 'dart'),
+    )
+    for table in ('player_simulations', 'match_simulations'):
+        op.add_column(
+            table,
+            sa.Column(
+                'optimal_lookups',
+                sa.Boolean(),
+                nullable=False,
+                server_default=sa.false(),
+            ),
+        )
+
+
+def downgrade():
+    for table in ('player_simulations', 'match_simulations'):
+        op.drop_column(table, 'optimal_lookups')
+    op.drop_table('profile_score_lookups')
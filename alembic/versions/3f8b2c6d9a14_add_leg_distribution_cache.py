@@ -0,0 +1,54 @@
+"""add leg distribution cache
+
+Revision ID: 3f8b2c6d9a14
+Revises: 9b1e5d7c3f42
+Create Date: 2026-10-18 18:02:37.514208
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '3f8b2c6d9a14'
+down_revision = '9b1e5d7c3f42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'leg_distribution_cache',
+        sa.Column('key', sa.String(length=40), nullable=False),
+        sa.Column('profile_hash', sa.String(length=40), nullable=False),
+        sa.Column('lookups_hash', sa.String(length=40), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.Column(
+            'method',
+            sa.Enum('exact', 'monte_carlo', name='leg_distribution_methods'),
+            nullable=False,
+        ),
+        sa.Column('iterations', sa.Integer(), nullable=True),
+        sa.Column(
+            'visits',
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=False,
+        ),
+        sa.Column('last_updated', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('key'),
+    )
+    op.create_index(
+        op.f('ix_leg_distribution_cache_profile_hash'),
+        'leg_distribution_cache',
+        ['profile_hash'],
+    )
+
+
+def downgrade():
+    op.drop_index(
+        op.f('ix_leg_distribution_cache_profile_hash'),
+        table_name='leg_distribution_cache',
+    )
+    op.drop_table('leg_distribution_cache')
+    sa.Enum(name='leg_distribution_methods').drop(op.get_bind())
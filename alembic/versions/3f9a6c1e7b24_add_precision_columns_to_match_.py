@@ -0,0 +1,42 @@
+"""add precision columns to match simulations table
+
+Revision ID: 3f9a6c1e7b24
+Revises: c2e5b8a4d1f7
+Create Date: 2026-10-18 11:02:17.530914
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '3f9a6c1e7b24'
+down_revision = 'c2e5b8a4d1f7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'match_simulations',
+        sa.Column('tolerance', sa.Float(), nullable=True),
+    )
+    op.add_column(
+        'match_simulations',
+        sa.Column('score_tolerance', sa.Float(), nullable=True),
+    )
+    op.add_column(
+        'match_simulations',
+        sa.Column('iterations_used', sa.Integer(), nullable=True),
+    )
+    op.add_column(
+        'match_simulations',
+        sa.Column('error', sa.Float(), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_column('match_simulations', 'error')
+    op.drop_column('match_simulations', 'iterations_used')
+    op.drop_column('match_simulations', 'score_tolerance')
+    op.drop_column('match_simulations', 'tolerance')
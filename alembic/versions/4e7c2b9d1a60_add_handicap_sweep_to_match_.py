@@ -0,0 +1,32 @@
+"""add handicap sweep column to match simulations table
+
+Revision ID: 4e7c2b9d1a60
+Revises: d61a0f3c9e58
+Create Date: 2026-10-18 15:08:44.162093
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '4e7c2b9d1a60'
+down_revision = 'd61a0f3c9e58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'match_simulations',
+        sa.Column(
+            'handicap_sweep',
+            sa.Boolean(),
+            nullable=False,
+            server_default=sa.false(),
+        ),
+    )
+
+
+def downgrade():
+    op.drop_column('match_simulations', 'handicap_sweep')
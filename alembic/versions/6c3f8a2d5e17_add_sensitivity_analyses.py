@@ -0,0 +1,53 @@
+"""add sensitivity analyses
+
+Revision ID: 6c3f8a2d5e17
+Revises: 2a7d9e4f1c83
+Create Date: 2026-10-18 16:47:32.604118
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '6c3f8a2d5e17'
+down_revision = '2a7d9e4f1c83'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'sensitivity_analyses',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('profile_id', sa.Integer(), nullable=False),
+        sa.Column('opponent_id', sa.Integer(), nullable=True),
+        sa.Column(
+            'match_type',
+            postgresql.ENUM(
+                'match_play',
+                'set_play',
+                'premier_league',
+                name='match_types',
+                create_type=False,
+            ),
+            nullable=True,
+        ),
+        sa.Column('total_legs', sa.Integer(), nullable=True),
+        sa.Column('total_sets', sa.Integer(), nullable=True),
+        sa.Column('step', sa.Float(), nullable=False),
+        sa.Column(
+            'results',
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=True,
+        ),
+        sa.Column('run_time', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['profile_id'], ['profiles.id'], ),
+        sa.ForeignKeyConstraint(['opponent_id'], ['profiles.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade():
+    op.drop_table('sensitivity_analyses')
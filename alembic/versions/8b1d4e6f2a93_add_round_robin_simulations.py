@@ -0,0 +1,55 @@
+"""add round robin simulations
+
+Revision ID: 8b1d4e6f2a93
+Revises: 3f9a6c1e7b24
+Create Date: 2026-10-18 13:41:05.218734
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '8b1d4e6f2a93'
+down_revision = '3f9a6c1e7b24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'round_robin_simulations',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column(
+            'match_type',
+            postgresql.ENUM(
+                'match_play',
+                'set_play',
+                'premier_league',
+                name='match_types',
+                create_type=False,
+            ),
+            nullable=False,
+        ),
+        sa.Column(
+            'profile_ids',
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=False,
+        ),
+        sa.Column('iterations', sa.Integer(), nullable=False),
+        sa.Column('total_legs', sa.Integer(), nullable=True),
+        sa.Column('total_sets', sa.Integer(), nullable=True),
+        sa.Column('seed', sa.Integer(), nullable=True),
+        sa.Column(
+            'results',
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=True,
+        ),
+        sa.Column('run_time', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade():
+    op.drop_table('round_robin_simulations')
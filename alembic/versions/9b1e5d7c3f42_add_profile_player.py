@@ -0,0 +1,39 @@
+"""add profile player
+
+Revision ID: 9b1e5d7c3f42
+Revises: 6c3f8a2d5e17
+Create Date: 2026-10-18 17:21:08.913475
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '9b1e5d7c3f42'
+down_revision = '6c3f8a2d5e17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'profiles',
+        sa.Column('player_id', sa.Integer(), nullable=True),
+    )
+    op.create_foreign_key(
+        'profiles_player_id_fkey',
+        'profiles',
+        'players',
+        ['player_id'],
+        ['id'],
+    )
+
+
+def downgrade():
+    op.drop_constraint(
+        'profiles_player_id_fkey',
+        'profiles',
+        type_='foreignkey',
+    )
+    op.drop_column('profiles', 'player_id')
@@ -0,0 +1,29 @@
+"""add seed column to simulations
+
+Revision ID: c2e5b8a4d1f7
+Revises: 97964be29f94
+Create Date: 2026-10-18 10:12:41.284516
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c2e5b8a4d1f7'
+down_revision = '97964be29f94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('player_simulations', 'match_simulations'):
+        op.add_column(
+            table,
+            sa.Column('seed', sa.Integer(), nullable=True),
+        )
+
+
+def downgrade():
+    for table in ('player_simulations', 'match_simulations'):
+        op.drop_column(table, 'seed')
@@ -0,0 +1,75 @@
+"""add match result cache
+
+Revision ID: d61a0f3c9e58
+Revises: 8b1d4e6f2a93
+Create Date: 2026-10-18 14:26:51.907342
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'd61a0f3c9e58'
+down_revision = '8b1d4e6f2a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'match_result_cache',
+        sa.Column('key', sa.String(length=40), nullable=False),
+        sa.Column(
+            'match_type',
+            postgresql.ENUM(
+                'match_play',
+                'set_play',
+                'premier_league',
+                name='match_types',
+                create_type=False,
+            ),
+            nullable=False,
+        ),
+        sa.Column('profile_a_hash', sa.String(length=40), nullable=False),
+        sa.Column('profile_b_hash', sa.String(length=40), nullable=False),
+        sa.Column('lookups_hash', sa.String(length=40), nullable=False),
+        sa.Column('iterations', sa.Integer(), nullable=True),
+        sa.Column('error', sa.Float(), nullable=False),
+        sa.Column('score_error', sa.Float(), nullable=False),
+        sa.Column(
+            'wins',
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=False,
+        ),
+        sa.Column(
+            'leg_win_probs',
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=True,
+        ),
+        sa.Column('last_updated', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('key'),
+    )
+    op.create_index(
+        op.f('ix_match_result_cache_profile_a_hash'),
+        'match_result_cache',
+        ['profile_a_hash'],
+    )
+    op.create_index(
+        op.f('ix_match_result_cache_profile_b_hash'),
+        'match_result_cache',
+        ['profile_b_hash'],
+    )
+
+
+def downgrade():
+    op.drop_index(
+        op.f('ix_match_result_cache_profile_b_hash'),
+        table_name='match_result_cache',
+    )
+    op.drop_index(
+        op.f('ix_match_result_cache_profile_a_hash'),
+        table_name='match_result_cache',
+    )
+    op.drop_table('match_result_cache')
@@ -0,0 +1,11 @@
+# flake8: noqa
+"""
+Benchmarks for the simulators in :py:mod:`darts.sim`.
+
+Run ``python -m darts.benchmarks run`` to time every entry point of every
+engine with the fixture profiles, and ``python -m darts.benchmarks compare``
+to compare two saved runs, e.g. from different commits or from the PyPy and
+CPython images.
+"""
+from .fixtures import fixture_lookups, fixture_profile, PROFILE_NAMES, SEED
+from .suite import cases, run, run_case
@@ -0,0 +1,168 @@
+"""
+Command line interface for the simulation benchmarks.
+
+Results are written as JSON (the default) or CSV, to stdout or a file::
+
+    python -m darts.benchmarks run --output pypy.json
+    python -m darts.benchmarks run --engine vectorized --scale 0.1
+    python -m darts.benchmarks compare cpython.json pypy.json
+"""
+import argparse
+import csv
+import json
+import logging
+import sys
+
+from .fixtures import PROFILE_NAMES
+from .suite import REPEAT, run
+
+
+RESULT_COLUMNS = [
+    'benchmark',
+    'engine',
+    'profile',
+    'size',
+    'repeat',
+    'seconds',
+    'mean_seconds',
+    'darts',
+    'darts_per_sec',
+    'legs',
+    'legs_per_sec',
+    'matches',
+    'matches_per_sec',
+    'peak_rss_kb',
+    'rss_growth_kb',
+    'error',
+]
+
+ENVIRONMENT_COLUMNS = ['python_implementation', 'commit']
+
+
+def write_json(report, f):
+    json.dump(report, f, indent=2, sort_keys=True)
+    f.write('\n')
+
+
+def write_csv(report, f):
+    # Each row repeats the interpreter and commit, so that CSVs from
+    # several runs can simply be concatenated.
+    writer = csv.DictWriter(f, ENVIRONMENT_COLUMNS + RESULT_COLUMNS)
+    writer.writeheader()
+    for result in report['results']:
+        row = dict(
+            (column, report['environment'][column])
+            for column in ENVIRONMENT_COLUMNS
+        )
+        row.update(result)
+        writer.writerow(row)
+
+
+def rate(result):
+    """
+    Return the headline rate of a result: darts per second if the engine
+    counts darts, otherwise matches per second.
+    """
+    return result.get('darts_per_sec') or result.get('matches_per_sec')
+
+
+def compare(baseline, other, f):
+    """
+    Write a table of the speed of each result in ``other`` relative to the
+    same case in ``baseline``.
+    """
+    key = lambda r: (r['benchmark'], r['engine'], r['profile'])  # noqa
+    baseline_results = dict(
+        (key(result), result) for result in baseline['results']
+    )
+    f.write('baseline: {python_implementation} {commit}\n'.format(
+        **baseline['environment']
+    ))
+    f.write('other:    {python_implementation} {commit}\n'.format(
+        **other['environment']
+    ))
+    row_format = '{:<22}{:<12}{:<10}{:>14}{:>14}{:>9}{:>12}\n'
+    f.write(row_format.format(
+        'benchmark',
+        'engine',
+        'profile',
+        'baseline/s',
+        'other/s',
+        'speedup',
+        'mem ratio',
+    ))
+    for result in other['results']:
+        old = baseline_results.get(key(result))
+        if old is None or not rate(old) or not rate(result):
+            continue
+        f.write(row_format.format(
+            result['benchmark'],
+            result['engine'],
+            result['profile'],
+            int(rate(old)),
+            int(rate(result)),
+            '%.2f' % (rate(result) / rate(old)),
+            '%.2f' % (float(result['peak_rss_kb']) / old['peak_rss_kb']),
+        ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m darts.benchmarks')
+    subparsers = parser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument(
+        '--benchmark',
+        action='append',
+        help='entry point to run, e.g. simulate_leg (default: all)',
+    )
+    run_parser.add_argument(
+        '--engine',
+        action='append',
+        choices=['scalar', 'compiled', 'vectorized', 'parallel'],
+        help='engine to run (default: all)',
+    )
+    run_parser.add_argument(
+        '--profile',
+        action='append',
+        choices=PROFILE_NAMES,
+        help='fixture profile to run (default: all)',
+    )
+    run_parser.add_argument('--scale', type=float, default=1.0)
+    run_parser.add_argument('--repeat', type=int, default=REPEAT)
+    run_parser.add_argument('--processes', type=int, default=None)
+    run_parser.add_argument(
+        '--format',
+        choices=['json', 'csv'],
+        default='json',
+    )
+    run_parser.add_argument('--output', type=argparse.FileType('w'))
+
+    compare_parser = subparsers.add_parser(
+        'compare',
+        help='compare two JSON results files',
+    )
+    compare_parser.add_argument('baseline', type=argparse.FileType('r'))
+    compare_parser.add_argument('other', type=argparse.FileType('r'))
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    if args.command == 'compare':
+        compare(json.load(args.baseline), json.load(args.other), sys.stdout)
+        return
+
+    report = run(
+        benchmarks=args.benchmark,
+        engines=args.engine,
+        profiles=args.profile or PROFILE_NAMES,
+        scale=args.scale,
+        repeat=args.repeat,
+        processes=args.processes,
+    )
+    write = write_json if args.format == 'json' else write_csv
+    write(report, args.output or sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
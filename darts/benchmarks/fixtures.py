@@ -0,0 +1,73 @@
+"""
+Fixed inputs for the simulation benchmarks.
+
+The profiles are unsaved :py:class:`~darts.models.Profile` objects and the
+lookups are read from ``darts_scores.csv``, so no database is needed.
+"""
+from decimal import Decimal
+
+from darts import models, sim
+
+
+SEED = 20170312
+"Seed of every benchmark's random stream"
+
+PROFILE_PCTS = {
+    'weak': dict(
+        treble_hit_pct=20,
+        treble_big_miss_pct=15,
+        double_hit_pct=20,
+        double_miss_outside_pct=25,
+        bullseye_hit_pct=10,
+        outer_bull_hit_pct=30,
+    ),
+    'average': dict(
+        treble_hit_pct=35,
+        treble_big_miss_pct=10,
+        double_hit_pct=35,
+        double_miss_outside_pct=20,
+        bullseye_hit_pct=20,
+        outer_bull_hit_pct=40,
+    ),
+    'elite': dict(
+        treble_hit_pct=45,
+        treble_big_miss_pct=5,
+        double_hit_pct=45,
+        double_miss_outside_pct=15,
+        bullseye_hit_pct=30,
+        outer_bull_hit_pct=50,
+    ),
+}
+"Hit and big miss percentages of the fixture profiles"
+
+PROFILE_NAMES = ['weak', 'average', 'elite']
+
+
+def fixture_profile(name):
+    """
+    Return an unsaved :py:class:`~darts.models.Profile` for one of the
+    `PROFILE_PCTS`, with the miss percentages filled in.
+    """
+    pcts = dict(
+        (key, Decimal(value))
+        for key, value in PROFILE_PCTS[name].items()
+    )
+    return models.Profile(
+        name=name,
+        treble_miss_pct=(
+            100 - pcts['treble_hit_pct'] - pcts['treble_big_miss_pct']
+        ),
+        double_miss_inside_pct=(
+            100 - pcts['double_hit_pct'] - pcts['double_miss_outside_pct']
+        ),
+        bullseye_miss_pct=100 - pcts['bullseye_hit_pct'],
+        outer_bull_miss_pct=100 - pcts['outer_bull_hit_pct'],
+        **pcts
+    )
+
+
+def fixture_lookups():
+    """
+    Return the score lookups from ``darts_scores.csv``.
+    """
+    return sim.load_lookups_csv()
@@ -0,0 +1,462 @@
+"""
+Benchmark cases for every simulation entry point, and the code to run them.
+
+Each case runs one entry point of one engine a fixed number of times, from
+a fixed seed, and counts the darts, legs and matches simulated. Cases run
+in a fresh process each, so that the peak memory reported is the case's
+own.
+"""
+from collections import namedtuple
+import datetime
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import timeit
+
+import numpy as np
+
+from darts import sim
+from darts.sim.streams import RandomStream
+
+from .fixtures import fixture_lookups, fixture_profile, PROFILE_NAMES, SEED
+
+
+log = logging.getLogger(__name__)
+
+
+REPEAT = 3
+"Default number of times each case is timed"
+
+OPPONENT = 'average'
+"Profile that each profile plays in the match benchmarks"
+
+
+class Inputs:
+
+    """
+    The profiles and lookups a case runs with.
+
+    :param str profile_name: name of the profile being benchmarked
+    """
+
+    def __init__(self, profile_name):
+        self.profile_name = profile_name
+        self.profile = fixture_profile(profile_name)
+        self.opponent = fixture_profile(OPPONENT)
+        self.score_shot_types, self.score_points = fixture_lookups()
+        self.context = sim.CompiledSimContext(
+            self.profile,
+            self.score_shot_types,
+            self.score_points,
+        )
+        self.opponent_context = self.context.for_profile(self.opponent)
+
+    def players(self, engine):
+        """
+        Return the profile, opponent and lookups to pass to ``engine``.
+        """
+        if engine == 'scalar':
+            return (
+                self.profile,
+                self.opponent,
+                self.score_shot_types,
+                self.score_points,
+            )
+        return self.context, self.opponent_context, None, None
+
+
+Case = namedtuple('Case', ['benchmark', 'engine', 'size', 'fn'])
+"""
+A benchmark case. ``fn(inputs, size, random_state)`` runs the entry point
+``size`` times and returns a dict of the darts, legs and matches simulated.
+"""
+
+
+def leg_darts(leg):
+    """
+    Return the number of darts counted in a leg.
+    """
+    return sum(len(visit) for visit in leg.all_darts)
+
+
+def match_counts(matches):
+    legs = [
+        leg
+        for match in matches
+        for leg in match.all_legs
+    ]
+    if legs and hasattr(legs[0], 'all_legs'):
+        # Set play; the legs are grouped into sets.
+        legs = [leg for s in legs for leg in s.all_legs]
+    return dict(
+        darts=sum(leg_darts(a) + leg_darts(b) for _, a, b in legs),
+        legs=len(legs),
+        matches=len(matches),
+    )
+
+
+def bench_throw_dart(engine):
+    def fn(inputs, size, random_state):
+        profile, _, score_shot_types, score_points = inputs.players(engine)
+        for i in xrange(size):
+            sim.oneplayer.throw_dart(
+                2 + i % 500,
+                1 + i % 3,
+                profile,
+                score_shot_types,
+                score_points,
+                random_state,
+            )
+        return dict(darts=size)
+    return fn
+
+
+def bench_throw_three_darts(engine):
+    def fn(inputs, size, random_state):
+        profile, _, score_shot_types, score_points = inputs.players(engine)
+        score, darts = 501, 0
+        for _ in xrange(size):
+            score, stats = sim.oneplayer.throw_three_darts(
+                score,
+                profile,
+                score_shot_types,
+                score_points,
+                random_state,
+            )
+            darts += stats.n_darts
+            if score == 0:
+                score = 501
+        return dict(darts=darts)
+    return fn
+
+
+def bench_simulate_leg(engine):
+    def fn(inputs, size, random_state):
+        profile, _, score_shot_types, score_points = inputs.players(engine)
+        legs = [
+            sim.oneplayer.simulate_leg(
+                profile,
+                score_shot_types,
+                score_points,
+                random_state=random_state,
+            )
+            for i in xrange(size)
+        ]
+        return dict(darts=sum(leg_darts(leg) for leg in legs), legs=size)
+    return fn
+
+
+def bench_scalar_match(engine, match_fn):
+    def fn(inputs, size, random_state):
+        a, b, score_shot_types, score_points = inputs.players(engine)
+        return match_counts([
+            match_fn(
+                a,
+                b,
+                score_shot_types,
+                score_points,
+                a_first=i % 2 == 0,
+                random_state=random_state,
+            )
+            for i in xrange(size)
+        ])
+    return fn
+
+
+def bench_lean_match(engine, match_type):
+    def fn(inputs, size, random_state):
+        a, b, score_shot_types, score_points = inputs.players(engine)
+        matches = sim.twoplayer.simulate_match(
+            match_type,
+            profile_a=a,
+            profile_b=b,
+            score_shot_types=score_shot_types,
+            score_points=score_points,
+            iterations=size,
+            random_state=random_state,
+            detail='scores',
+        )
+        counts = dict(matches=len(matches))
+        if match_type == 'match_play':
+            counts['legs'] = sum(sum(match.wins) for match in matches)
+        return counts
+    return fn
+
+
+def bench_scalar_profile(engine):
+    def fn(inputs, size, random_state):
+        profile, _, score_shot_types, score_points = inputs.players(engine)
+        legs = sim.oneplayer.simulate_profile(
+            profile,
+            score_shot_types,
+            score_points,
+            iterations=size,
+            random_state=random_state,
+        )
+        return dict(darts=sum(leg_darts(leg) for leg in legs), legs=size)
+    return fn
+
+
+def bench_batch_profile(module, **kwargs):
+    def fn(inputs, size, random_state):
+        batch = module.simulate_profile(
+            inputs.context,
+            iterations=size,
+            random_state=random_state,
+            **kwargs
+        )
+        return dict(darts=len(batch.darts.points), legs=len(batch))
+    return fn
+
+
+def bench_batch_match(module, match_type, **kwargs):
+    def fn(inputs, size, random_state):
+        matches = module.simulate_match(
+            match_type,
+            inputs.context,
+            inputs.opponent_context,
+            iterations=size,
+            random_state=random_state,
+            **kwargs
+        )
+        counts = dict(matches=len(matches))
+        if match_type == 'match_play':
+            counts['legs'] = sum(sum(match.wins) for match in matches)
+        return counts
+    return fn
+
+
+def cases(processes=None):
+    """
+    Return every benchmark case, at its default size.
+
+    :param int processes: processes for the parallel engine (default: one
+        per CPU).
+    """
+    all_cases = []
+    for engine in ('scalar', 'compiled'):
+        all_cases.extend([
+            Case('throw_dart', engine, 20000, bench_throw_dart(engine)),
+            Case(
+                'throw_three_darts',
+                engine,
+                10000,
+                bench_throw_three_darts(engine),
+            ),
+            Case('simulate_leg', engine, 500, bench_simulate_leg(engine)),
+            Case(
+                'simulate_match_play',
+                engine,
+                50,
+                bench_scalar_match(engine, sim.twoplayer.simulate_match_play),
+            ),
+            Case(
+                'simulate_set_play',
+                engine,
+                20,
+                bench_scalar_match(engine, sim.twoplayer.simulate_set_play),
+            ),
+            Case(
+                'simulate_match_scores',
+                engine,
+                50,
+                bench_lean_match(engine, 'match_play'),
+            ),
+            Case(
+                'simulate_profile',
+                engine,
+                500,
+                bench_scalar_profile(engine),
+            ),
+        ])
+
+    parallel_kwargs = dict(processes=processes)
+    for engine, module, kwargs in (
+            ('vectorized', sim.vectorized, {}),
+            ('parallel', sim.parallel, parallel_kwargs),
+            ):
+        all_cases.extend([
+            Case(
+                'simulate_profile',
+                engine,
+                20000,
+                bench_batch_profile(module, **kwargs),
+            ),
+            Case(
+                'simulate_match_play',
+                engine,
+                10000,
+                bench_batch_match(module, 'match_play', **kwargs),
+            ),
+            Case(
+                'simulate_set_play',
+                engine,
+                5000,
+                bench_batch_match(module, 'set_play', **kwargs),
+            ),
+        ])
+    return all_cases
+
+
+def peak_rss_kb():
+    """
+    Return the peak resident set size of this process, in kilobytes.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def time_case(case, profile_name, size, repeat=REPEAT):
+    """
+    Time a case in this process.
+
+    Every repeat runs from the same seed, so does the same work.
+
+    :return: a result dict; see `run_case`.
+    """
+    inputs = Inputs(profile_name)
+    base_rss = peak_rss_kb()
+    times = []
+    for _ in xrange(repeat):
+        random_state = RandomStream(SEED)
+        start = timeit.default_timer()
+        counts = case.fn(inputs, size, random_state)
+        times.append(timeit.default_timer() - start)
+
+    best = min(times)
+    result = dict(
+        benchmark=case.benchmark,
+        engine=case.engine,
+        profile=profile_name,
+        size=size,
+        repeat=repeat,
+        seconds=best,
+        mean_seconds=sum(times) / len(times),
+        peak_rss_kb=peak_rss_kb(),
+        rss_growth_kb=peak_rss_kb() - base_rss,
+    )
+    for unit in ('darts', 'legs', 'matches'):
+        count = counts.get(unit)
+        result[unit] = count
+        result[unit + '_per_sec'] = count / best if count else None
+    return result
+
+
+def _time_case_in_child(conn, case, profile_name, size, repeat):
+    # Keep the simulators' progress output off stdout, which may be
+    # carrying the results.
+    sys.stdout = sys.stderr
+    try:
+        conn.send(time_case(case, profile_name, size, repeat))
+    except Exception as e:
+        log.exception('benchmark failed')
+        conn.send(dict(
+            benchmark=case.benchmark,
+            engine=case.engine,
+            profile=profile_name,
+            error=repr(e),
+        ))
+    finally:
+        conn.close()
+
+
+def run_case(case, profile_name, scale=1.0, repeat=REPEAT):
+    """
+    Run a case in a fresh process.
+
+    Returns a dict with the case's benchmark, engine and profile, the size
+    and number of repeats, and:
+
+    - ``seconds``: the fastest repeat, and ``mean_seconds``
+    - ``darts``, ``legs``, ``matches``: work done in one repeat (None if
+      the engine doesn't report it), and the same per second of
+      ``seconds``
+    - ``peak_rss_kb``: peak memory of the process running the case, and
+      ``rss_growth_kb``: its growth while running. Worker processes of the
+      parallel engine aren't included.
+
+    :param float scale: multiplier for the case's default size.
+    """
+    size = max(1, int(case.size * scale))
+    parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(
+        target=_time_case_in_child,
+        args=(child_conn, case, profile_name, size, repeat),
+    )
+    process.start()
+    result = parent_conn.recv()
+    process.join()
+    log.info(
+        '%s (%s, %s): %s',
+        case.benchmark,
+        case.engine,
+        profile_name,
+        result.get('seconds', result.get('error')),
+    )
+    return result
+
+
+def git_commit():
+    """
+    Return the current git commit of the working directory, if any.
+    """
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'],
+                cwd=os.path.dirname(__file__),
+                stderr=devnull,
+            ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """
+    Describe the interpreter and machine the benchmarks ran on.
+    """
+    return dict(
+        python_implementation=platform.python_implementation(),
+        python_version=platform.python_version(),
+        numpy_version=np.__version__,
+        platform=platform.platform(),
+        cpu_count=multiprocessing.cpu_count(),
+        commit=git_commit(),
+        timestamp=datetime.datetime.utcnow().isoformat(),
+        seed=SEED,
+    )
+
+
+def run(
+        benchmarks=None,
+        engines=None,
+        profiles=PROFILE_NAMES,
+        scale=1.0,
+        repeat=REPEAT,
+        processes=None,
+        ):
+    """
+    Run the benchmark suite.
+
+    :param list benchmarks: entry points to run (default: all).
+    :param list engines: engines to run (default: all).
+    :param list profiles: fixture profiles to run each case with.
+    :param float scale: multiplier for every case's default size.
+    :param int repeat: number of times each case is timed.
+    :param int processes: processes for the parallel engine.
+
+    :return: a dict with the ``environment`` and a list of ``results``, as
+        returned by `run_case`.
+    """
+    results = []
+    for case in cases(processes):
+        if benchmarks and case.benchmark not in benchmarks:
+            continue
+        if engines and case.engine not in engines:
+            continue
+        for profile_name in profiles:
+            results.append(run_case(case, profile_name, scale, repeat))
+    return dict(environment=environment(), results=results)
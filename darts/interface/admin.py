@@ -1,9 +1,12 @@
+from flask import flash
 from flask_admin import Admin, AdminIndexView
+from flask_admin.actions import action
 from flask_admin.base import MenuLink
 from flask_admin.contrib.sqla import ModelView
 from flask_sqlalchemy_session import current_session
+import rq
 
-from darts import models
+from darts import jobs, models, settings, sim, worker
 
 
 class NonEditableModelView(ModelView):
@@ -47,6 +50,47 @@ class PlayerView(NonEditableModelView):
         'match_results',
     ]
 
+    @action(
+        'fit_profiles',
+        'Fit profiles',
+        "Fit profiles to the selected players' recent results?",
+    )
+    def action_fit_profiles(self, ids):
+        lookups = sim.load_lookups(current_session)
+        rq.Queue(connection=worker.conn).enqueue_call(
+            jobs.fit_player_profiles,
+            kwargs=dict(
+                score_shot_types=lookups[0],
+                score_points=lookups[1],
+                player_ids=[int(player_id) for player_id in ids],
+            ),
+            timeout=settings.JOB_TIMEOUT,
+        )
+        flash('Fitting profiles to {} players.'.format(len(ids)))
+
+
+def solve_profile_lookups(profile_ids=None):
+    """
+    Queue a job to solve the checkout strategies of the given profiles
+    (default: all of them) against the current score lookups.
+    """
+    lookups = sim.load_lookups(current_session)
+    rq.Queue(connection=worker.conn).enqueue_call(
+        jobs.solve_profile_lookups,
+        kwargs=dict(
+            score_shot_types=lookups[0],
+            score_points=lookups[1],
+            profile_ids=profile_ids,
+        ),
+        timeout=settings.JOB_TIMEOUT,
+    )
+
+
+class ProfileView(ModelView):
+
+    def after_model_change(self, form, model, is_created):
+        solve_profile_lookups([model.id])
+
 
 class ScoreLookupView(ModelView):
 
@@ -59,6 +103,12 @@ class ScoreLookupView(ModelView):
         'big_miss_points',
     ]
 
+    def after_model_change(self, form, model, is_created):
+        solve_profile_lookups()
+
+    def after_model_delete(self, model):
+        solve_profile_lookups()
+
 
 class MatchView(NonEditableModelView):
 
@@ -100,7 +150,7 @@ admin = Admin(
     index_view=AdminIndexView(),
 )
 
-admin.add_view(ModelView(
+admin.add_view(ProfileView(
     models.Profile,
     current_session,
     name='Profiles',
@@ -3,3 +3,5 @@
 from .matchsimulation import MatchSimulationForm
 from .profile import ProfileForm
 from .playersimulation import PlayerSimulationForm
+from .roundrobinsimulation import RoundRobinSimulationForm
+from .sensitivityanalysis import SensitivityAnalysisForm
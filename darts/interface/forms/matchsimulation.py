@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from wtforms import BooleanField, IntegerField, SelectField
+from wtforms import BooleanField, FloatField, IntegerField, SelectField
 from wtforms.validators import (
     InputRequired,
     NumberRange,
@@ -40,6 +40,17 @@ class MatchSimulationForm(FlaskForm):
         validators=[NumberRange(100, 50000), InputRequired()],
     )
 
+    tolerance = FloatField(
+        'Stop early once the Player 1 win % is within this margin of error '
+        '(optional)',
+        default=None,
+        validators=[Optional(), NumberRange(0.05, 10)],
+    )
+    tolerance_scores = BooleanField(
+        'Require the margin of error on every score % too',
+        default=False,
+    )
+
     a_handicap = IntegerField(
         'Player 1 handicap',
         default=0,
@@ -50,6 +61,15 @@ class MatchSimulationForm(FlaskForm):
         default=0,
         validators=[NumberRange(-10, 10), InputRequired()],
     )
+    handicap_sweep = BooleanField(
+        'Also work out the result for every pair of handicaps from -10 to 10',
+        default=False,
+    )
+    optimal_lookups = BooleanField(
+        "Use each profile's own checkout strategy instead of the score "
+        'lookups',
+        default=False,
+    )
 
     def validate_profile_b_id(form, field):
         profile_a_id = form.data['profile_a_id']
@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from wtforms import IntegerField, SelectField
+from wtforms import BooleanField, IntegerField, SelectField
 from wtforms.validators import InputRequired, NumberRange
 
 
@@ -12,3 +12,12 @@ class PlayerSimulationForm(FlaskForm):
         default=1000,
         validators=[NumberRange(100, 100000), InputRequired()],
     )
+
+    keep_darts = BooleanField(
+        'Keep every dart thrown (slower, for the darts table)',
+        default=False,
+    )
+    optimal_lookups = BooleanField(
+        "Use the profile's own checkout strategy instead of the score lookups",
+        default=False,
+    )
@@ -0,0 +1,42 @@
+from flask_wtf import FlaskForm
+from wtforms import IntegerField, SelectField, SelectMultipleField
+from wtforms.validators import (
+    InputRequired,
+    NumberRange,
+    Optional,
+    ValidationError,
+)
+
+
+class RoundRobinSimulationForm(FlaskForm):
+
+    match_type = SelectField(
+        'MatchType',
+        choices=[
+            ('match_play', 'Match Play'),
+            ('set_play', 'Set Play'),
+            ('premier_league', 'Premier League'),
+        ],
+    )
+
+    profile_ids = SelectMultipleField('Profiles', coerce=int)
+
+    total_legs = IntegerField(
+        'Match Play only - number of legs per match',
+        default=None,
+        validators=[Optional()],
+    )
+    total_sets = IntegerField(
+        'Set play only - number of sets required to win match',
+        default=5,
+    )
+
+    iterations = IntegerField(
+        'Iterations per pairing',
+        default=1000,
+        validators=[NumberRange(100, 50000), InputRequired()],
+    )
+
+    def validate_profile_ids(form, field):
+        if len(set(field.data)) < 2:
+            raise ValidationError('Choose at least two profiles')
@@ -0,0 +1,36 @@
+from flask_wtf import FlaskForm
+from wtforms import FloatField, IntegerField, SelectField
+from wtforms.validators import InputRequired, NumberRange, Optional
+
+
+class SensitivityAnalysisForm(FlaskForm):
+
+    opponent_id = SelectField(
+        'Opponent, for the match win % (optional)',
+        coerce=int,
+    )
+
+    match_type = SelectField(
+        'MatchType',
+        choices=[
+            ('match_play', 'Match Play'),
+            ('set_play', 'Set Play'),
+            ('premier_league', 'Premier League'),
+        ],
+    )
+
+    total_legs = IntegerField(
+        'Match Play only - number of legs per match',
+        default=None,
+        validators=[Optional()],
+    )
+    total_sets = IntegerField(
+        'Set play only - number of sets required to win match',
+        default=5,
+    )
+
+    step = FloatField(
+        'Step to move each percentage by',
+        default=1.0,
+        validators=[NumberRange(0.1, 5), InputRequired()],
+    )
@@ -6,7 +6,13 @@ import rq
 
 from darts import jobs, models, settings, sim, worker
 from .extensions import nav
-from .forms import MatchSimulationForm, ProfileForm, PlayerSimulationForm
+from .forms import (
+    MatchSimulationForm,
+    PlayerSimulationForm,
+    ProfileForm,
+    RoundRobinSimulationForm,
+    SensitivityAnalysisForm,
+)
 
 
 interface = flask.Blueprint('interface', __name__)
@@ -23,6 +29,7 @@ def add_navigation():
         nav.Item('Home', 'interface.index'),
         nav.Item('Player Simulations', 'interface.list_player_simulations'),
         nav.Item('Match Simulations', 'interface.list_match_simulations'),
+        nav.Item('Round Robins', 'interface.list_round_robin_simulations'),
         nav.Item('Profiles', 'interface.list_profiles'),
         nav.Item('Players', 'interface.list_players')
     ])
@@ -68,8 +75,29 @@ def list_player_simulations():
         simulation = models.PlayerSimulation(
             profile=profile,
             iterations=form_data['iterations'],
+            seed=sim.streams.new_seed(),
+            optimal_lookups=form_data['optimal_lookups'],
         )
 
+        # Simulate small requests straight away, as the job would.
+        accumulator = None
+        if not form_data['optimal_lookups']:
+            accumulator = sim.fastpath.accumulate_within(
+                jobs.compile_profile(profile, *lookups),
+                iterations=form_data['iterations'],
+                random_state=simulation.seed,
+                keep_darts=form_data['keep_darts'],
+            )
+        if accumulator is not None:
+            if form_data['keep_darts']:
+                simulation.results = accumulator.darts.as_dict()
+            simulation.stats = accumulator.stats()
+            current_session.add(simulation)
+            current_session.commit()
+            return flask.redirect(
+                flask.url_for('.view_player_simulation', id=simulation.id)
+            )
+
         current_session.add(simulation)
         current_session.commit()
 
@@ -80,7 +108,10 @@ def list_player_simulations():
                 profile=profile,
                 score_shot_types=lookups[0],
                 score_points=lookups[1],
-                iterations=form_data['iterations']
+                iterations=form_data['iterations'],
+                random_state=simulation.seed,
+                keep_darts=form_data['keep_darts'],
+                optimal_lookups=form_data['optimal_lookups'],
             ),
         )
 
@@ -147,6 +178,27 @@ def list_match_simulations():
             .one()
         )
         lookups = sim.load_lookups(current_session)
+        # The form takes percentages, but stats are stored as probabilities.
+        tolerance = score_tolerance = None
+        if form_data['tolerance'] is not None:
+            tolerance = form_data['tolerance'] / 100.0
+            if form_data['tolerance_scores']:
+                score_tolerance = tolerance
+        match_kwargs = dict(
+            match_type=form_data['match_type'],
+            iterations=form_data['iterations'],
+            a_first=form_data['a_first'],
+            a_handicap=form_data['a_handicap'] or 0,
+            b_handicap=form_data['b_handicap'] or 0,
+            total_sets=form_data['total_sets'],
+            tolerance=tolerance,
+            score_tolerance=score_tolerance,
+            total_legs=(
+                12
+                if form_data['match_type'] == 'premier_league'
+                else form_data['total_legs']
+            ),
+        )
         simulation = models.MatchSimulation(
             match_type=form_data['match_type'],
             profile_a=profile_a,
@@ -155,7 +207,67 @@ def list_match_simulations():
             a_first=form_data['a_first'],
             a_handicap=form_data['a_handicap'] or 0,
             b_handicap=form_data['b_handicap'] or 0,
+            seed=sim.streams.new_seed(),
+            tolerance=tolerance,
+            score_tolerance=score_tolerance,
+            handicap_sweep=form_data['handicap_sweep'],
+            optimal_lookups=form_data['optimal_lookups'],
+        )
+
+        # Serve the simulation straight away if this pairing has already
+        # been simulated precisely enough, or can be solved exactly within
+        # the inline budget.
+        if form_data['optimal_lookups']:
+            lookups_version = sim.strategy.lookups_version(*lookups)
+        else:
+            lookups_version = sim.cache.lookups_hash(*lookups)
+        cache = sim.cache.MatchCache(current_session, lookups_version)
+        cached = cache.get(
+            profile_a=profile_a,
+            profile_b=profile_b,
+            **match_kwargs
         )
+        if (cached is None or not cached.precise_enough(
+                form_data['iterations'],
+                tolerance,
+                score_tolerance)) and not form_data['optimal_lookups']:
+            # Profiles throwing with their own lookups may need them solved
+            # first, which takes too long to wait for.
+            solution = sim.fastpath.solve_match(
+                profile_a=profile_a,
+                profile_b=profile_b,
+                score_shot_types=lookups[0],
+                score_points=lookups[1],
+                **match_kwargs
+            )
+            if solution is not None:
+                cached = cache.put(
+                    solution,
+                    profile_a=profile_a,
+                    profile_b=profile_b,
+                    **match_kwargs
+                )
+        if cached is not None and cached.precise_enough(
+                form_data['iterations'],
+                tolerance,
+                score_tolerance):
+            simulation.results = []
+            simulation.stats = cached.stats(
+                match_kwargs['a_handicap'],
+                match_kwargs['b_handicap'],
+            )
+            if form_data['handicap_sweep']:
+                simulation.stats['handicap_sweep'] = (
+                    sim.handicap.HandicapSweep(cached.wins).as_dict()
+                )
+            simulation.iterations_used = cached.iterations
+            simulation.error = cached.error
+            current_session.add(simulation)
+            current_session.commit()
+            return flask.redirect(
+                flask.url_for('.view_match_simulation', id=simulation.id)
+            )
+
         current_session.add(simulation)
         current_session.commit()
 
@@ -163,21 +275,14 @@ def list_match_simulations():
             jobs.run_two_player_sim,
             kwargs=dict(
                 sim_id=simulation.id,
-                match_type=form_data['match_type'],
                 profile_a=profile_a,
                 profile_b=profile_b,
                 score_shot_types=lookups[0],
                 score_points=lookups[1],
-                iterations=form_data['iterations'],
-                a_first=form_data['a_first'],
-                a_handicap=form_data['a_handicap'] or 0,
-                b_handicap=form_data['b_handicap'] or 0,
-                total_sets=form_data['total_sets'],
-                total_legs=(
-                    12
-                    if form_data['match_type'] == 'premier_league'
-                    else form_data['total_legs']
-                ),
+                random_state=simulation.seed,
+                handicap_sweep=form_data['handicap_sweep'],
+                optimal_lookups=form_data['optimal_lookups'],
+                **match_kwargs
             ),
             timeout=settings.JOB_TIMEOUT,
         )
@@ -194,6 +299,60 @@ def list_match_simulations():
     ), 200 if flask.request.method == 'GET' else 400
 
 
+@interface.route('/matchsimulations/in-play/')
+def in_play_match():
+    """
+    Return the win and score probabilities of a match in progress, as
+    JSON, solved from its current state (see darts.sim.inplay).
+    """
+    args = flask.request.args
+    match_type = args.get('match_type', 'match_play')
+    if match_type not in ('match_play', 'set_play', 'premier_league'):
+        flask.abort(400)
+    profiles = [
+        current_session.query(models.Profile).get(
+            args.get(player, type=int)
+        )
+        for player in ('profile_a_id', 'profile_b_id')
+    ]
+    if None in profiles:
+        flask.abort(404)
+
+    state = {
+        name: args.get(name, default, type=int)
+        for name, default in (
+            ('a_score', 501),
+            ('b_score', 501),
+            ('a_legs', 0),
+            ('b_legs', 0),
+            ('a_sets', 0),
+            ('b_sets', 0),
+            ('a_handicap', 0),
+            ('b_handicap', 0),
+            ('legs_to_win', 7),
+            ('total_legs', None),
+            ('total_sets', 5),
+        )
+    }
+    a_to_throw = args.get('a_to_throw', 'true') == 'true'
+    a_started_leg = args.get('a_started_leg', None)
+    try:
+        solution = sim.inplay.solve_in_play(
+            match_type,
+            sim.inplay.load_context(current_session, profiles[0]),
+            sim.inplay.load_context(current_session, profiles[1]),
+            a_to_throw=a_to_throw,
+            a_started_leg=(
+                a_to_throw if a_started_leg is None
+                else a_started_leg == 'true'
+            ),
+            **state
+        )
+    except ValueError:
+        flask.abort(400)
+    return flask.jsonify(solution.stats())
+
+
 @interface.route('/matchsimulations/<int:id>/')
 def view_match_simulation(id):
     simulation = (
@@ -208,6 +367,98 @@ def view_match_simulation(id):
     )
 
 
+@interface.route('/roundrobins/', methods=['GET', 'POST'])
+def list_round_robin_simulations():
+
+    simulations = (
+        current_session.query(models.RoundRobinSimulation)
+        .order_by(models.RoundRobinSimulation.run_time.desc())
+    )
+
+    load_all = flask.request.args.get('all', False)
+    if not load_all:
+        simulations = simulations.limit(50)
+
+    profile_names = {
+        profile.id: str(profile)
+        for profile in current_session.query(models.Profile)
+    }
+
+    form = RoundRobinSimulationForm()
+
+    form.profile_ids.choices = sorted(
+        profile_names.items(),
+        key=lambda choice: choice[1],
+    )
+
+    if form.validate_on_submit():
+        form_data = form.data.copy()
+        form_data.pop('csrf_token', None)
+        # Keep the order the profiles were chosen in, without repeats.
+        profile_ids = []
+        for profile_id in form_data['profile_ids']:
+            if profile_id not in profile_ids:
+                profile_ids.append(profile_id)
+        total_legs = (
+            12
+            if form_data['match_type'] == 'premier_league'
+            else form_data['total_legs']
+        )
+        lookups = sim.load_lookups(current_session)
+        simulation = models.RoundRobinSimulation(
+            match_type=form_data['match_type'],
+            profile_ids=profile_ids,
+            iterations=form_data['iterations'],
+            total_legs=total_legs,
+            total_sets=form_data['total_sets'],
+            seed=sim.streams.new_seed(),
+        )
+        current_session.add(simulation)
+        current_session.commit()
+
+        flask.g.q.enqueue_call(
+            jobs.run_round_robin_sim,
+            kwargs=dict(
+                sim_id=simulation.id,
+                match_type=form_data['match_type'],
+                profiles=simulation.load_profiles(current_session),
+                score_shot_types=lookups[0],
+                score_points=lookups[1],
+                iterations=form_data['iterations'],
+                total_legs=total_legs,
+                total_sets=form_data['total_sets'],
+                random_state=simulation.seed,
+            ),
+            timeout=settings.JOB_TIMEOUT,
+        )
+
+        return flask.redirect(
+            flask.url_for('.view_round_robin_simulation', id=simulation.id)
+        )
+
+    return flask.render_template(
+        'list_round_robin_simulations.html',
+        form=form,
+        simulations=simulations,
+        profile_names=profile_names,
+        show_modal=flask.request.method == 'POST',
+    ), 200 if flask.request.method == 'GET' else 400
+
+
+@interface.route('/roundrobins/<int:id>/')
+def view_round_robin_simulation(id):
+    simulation = (
+        current_session.query(models.RoundRobinSimulation)
+        .filter(models.RoundRobinSimulation.id == id)
+        .one()
+    )
+    return flask.render_template(
+        'view_round_robin_simulation.html',
+        simulation=simulation,
+        profiles=simulation.load_profiles(current_session),
+    )
+
+
 @interface.route('/profiles/', methods=['GET', 'POST'])
 def list_profiles():
 
@@ -233,9 +484,19 @@ def list_profiles():
     if form.validate_on_submit():
         data = form.data.copy()
         data.pop('csrf_token', None)
+        lookups = sim.load_lookups(current_session)
         profile = models.Profile(**data)
         current_session.add(profile)
         current_session.commit()
+        flask.g.q.enqueue_call(
+            jobs.solve_profile_lookups,
+            kwargs=dict(
+                score_shot_types=lookups[0],
+                score_points=lookups[1],
+                profile_ids=[profile.id],
+            ),
+            timeout=settings.JOB_TIMEOUT,
+        )
         return flask.redirect(flask.url_for('.view_profile', id=profile.id))
 
     return flask.render_template(
@@ -247,14 +508,115 @@ def list_profiles():
     ), 200 if flask.request.method == 'GET' else 400
 
 
-@interface.route('/profiles/<int:id>/')
+@interface.route('/profiles/estimate/')
+def estimate_profile():
+    """
+    Return the expected stats of the percentages in the query string, as
+    JSON, interpolated from the surrogate grid (see darts.sim.surrogate).
+    """
+    grid = sim.surrogate.load_grid()
+    if grid is None:
+        flask.abort(404)
+    try:
+        point = [float(flask.request.args[column]) for column in grid.columns]
+    except (KeyError, ValueError):
+        flask.abort(400)
+    return flask.jsonify(
+        dict(zip(grid.statistics, grid.interpolate(point).tolist()))
+    )
+
+
+@interface.route('/profiles/<int:id>/', methods=['GET', 'POST'])
 def view_profile(id):
     profile = (
         current_session.query(models.Profile)
         .filter(models.Profile.id == id)
         .one()
     )
-    return flask.render_template('view_profile.html', profile=profile)
+    lookups = sim.load_lookups(current_session)
+    solution = sim.exact.solve_leg(profile, *lookups)
+
+    analyses = (
+        current_session.query(models.SensitivityAnalysis)
+        .filter(models.SensitivityAnalysis.profile_id == id)
+        .order_by(models.SensitivityAnalysis.run_time.desc())
+    )
+
+    form = SensitivityAnalysisForm()
+
+    form.opponent_id.choices = [(0, 'None')] + [
+        (opponent.id, str(opponent))
+        for opponent in current_session.query(models.Profile)
+        if opponent.id != id
+    ]
+
+    if form.validate_on_submit():
+        form_data = form.data.copy()
+        form_data.pop('csrf_token', None)
+        opponent = None
+        if form_data['opponent_id']:
+            opponent = (
+                current_session.query(models.Profile)
+                .filter(models.Profile.id == form_data['opponent_id'])
+                .one()
+            )
+        total_legs = (
+            12
+            if form_data['match_type'] == 'premier_league'
+            else form_data['total_legs']
+        )
+        analysis = models.SensitivityAnalysis(
+            profile=profile,
+            opponent=opponent,
+            match_type=form_data['match_type'] if opponent else None,
+            total_legs=total_legs,
+            total_sets=form_data['total_sets'],
+            step=form_data['step'],
+        )
+        current_session.add(analysis)
+        current_session.commit()
+
+        flask.g.q.enqueue_call(
+            jobs.run_sensitivity_analysis,
+            kwargs=dict(
+                analysis_id=analysis.id,
+                profile=profile,
+                score_shot_types=lookups[0],
+                score_points=lookups[1],
+                opponent=opponent,
+                match_type=form_data['match_type'],
+                total_legs=total_legs,
+                total_sets=form_data['total_sets'],
+                step=form_data['step'],
+            ),
+            timeout=settings.JOB_TIMEOUT,
+        )
+
+        return flask.redirect(
+            flask.url_for('.view_sensitivity_analysis', id=analysis.id)
+        )
+
+    return flask.render_template(
+        'view_profile.html',
+        profile=profile,
+        solution=solution,
+        form=form,
+        analyses=analyses,
+        show_modal=flask.request.method == 'POST',
+    ), 200 if flask.request.method == 'GET' else 400
+
+
+@interface.route('/sensitivity/<int:id>/')
+def view_sensitivity_analysis(id):
+    analysis = (
+        current_session.query(models.SensitivityAnalysis)
+        .filter(models.SensitivityAnalysis.id == id)
+        .one()
+    )
+    return flask.render_template(
+        'view_sensitivity_analysis.html',
+        analysis=analysis,
+    )
 
 
 @interface.route('/players/')
@@ -1,24 +1,77 @@
-from darts import models, sim
+from darts import models, settings, sim
+from darts.modeller import fitting
 from darts.db import Session
 
 
 s = Session()
 
 
-def run_one_player_sim(
-        sim_id,
+def simulation_engine():
+    """
+    Return the module whose simulators the jobs should use, and any extra
+    arguments they need.
+
+    Simulations are always split into the shards of
+    :py:mod:`darts.sim.parallel`, so that a stored seed gives the same
+    results whatever ``settings.SIMULATION_PROCESSES`` is; when it's 1 the
+    shards are run in the job's own process.
+    """
+    return sim.parallel, dict(
+        processes=int(settings.SIMULATION_PROCESSES) or None,
+    )
+
+
+def compile_profile(profile, score_shot_types, score_points):
+    """
+    Compile a profile for the simulators, with visit tables if
+    ``settings.SIMULATION_KERNEL`` is 'visits'.
+    """
+    if settings.SIMULATION_KERNEL == 'visits':
+        return sim.visits.compile_visits(
+            profile,
+            score_shot_types,
+            score_points,
+        )
+    return sim.CompiledSimContext(profile, score_shot_types, score_points)
+
+
+def profile_lookups(profile, score_shot_types, score_points):
+    """
+    Return a profile's own checkout strategy as lookups, solving it if it
+    isn't stored; see :py:mod:`darts.sim.strategy`.
+    """
+    return sim.strategy.load_strategy_lookups(
+        s,
         profile,
         score_shot_types,
         score_points,
-        **kwargs
-        ):
+    )
 
-    sim_results = sim.oneplayer.simulate_profile(
+
+def run_one_player_sim(
+        sim_id,
         profile,
         score_shot_types,
         score_points,
+        keep_darts=False,
+        optimal_lookups=False,
         **kwargs
+        ):
+
+    if optimal_lookups:
+        score_shot_types, score_points = profile_lookups(
+            profile,
+            score_shot_types,
+            score_points,
         )
+    context = compile_profile(profile, score_shot_types, score_points)
+    engine, engine_kwargs = simulation_engine()
+    kwargs.update(engine_kwargs)
+    accumulator = engine.accumulate_profile(
+        context,
+        keep_darts=keep_darts,
+        **kwargs
+    )
 
     simulation = (
         s.query(models.PlayerSimulation)
@@ -26,18 +79,60 @@ def run_one_player_sim(
         .one()
     )
 
-    simulation.results = [
-        leg.as_dict()
-        for leg in sim_results
-    ]
-    simulation.stats = simulation.create_stats(simulation.results)
+    if keep_darts:
+        simulation.results = accumulator.darts.as_dict()
+    simulation.stats = accumulator.stats()
     s.add(simulation)
     s.commit()
 
 
-def run_two_player_sim(sim_id, **kwargs):
+def run_two_player_sim(
+        sim_id,
+        profile_a,
+        profile_b,
+        score_shot_types,
+        score_points,
+        handicap_sweep=False,
+        optimal_lookups=False,
+        **kwargs
+        ):
 
-    sim_results = sim.twoplayer.simulate_match(**kwargs)
+    if optimal_lookups:
+        context_a = compile_profile(
+            profile_a,
+            *profile_lookups(profile_a, score_shot_types, score_points)
+        )
+        context_b = compile_profile(
+            profile_b,
+            *profile_lookups(profile_b, score_shot_types, score_points)
+        )
+        lookups_version = sim.strategy.lookups_version(
+            score_shot_types,
+            score_points,
+        )
+    else:
+        context_a = compile_profile(
+            profile_a,
+            score_shot_types,
+            score_points,
+        )
+        context_b = context_a.for_profile(profile_b)
+        lookups_version = sim.cache.lookups_hash(
+            score_shot_types,
+            score_points,
+        )
+    engine, engine_kwargs = simulation_engine()
+    if settings.LEG_DISTRIBUTIONS:
+        engine, engine_kwargs = sim.legs, dict(
+            method=settings.LEG_DISTRIBUTIONS,
+            cache=sim.legs.LegDistributionCache(s, lookups_version),
+        )
+    kwargs.update(engine_kwargs)
+    sim_results = engine.simulate_match(
+        profile_a=context_a,
+        profile_b=context_b,
+        **kwargs
+    )
 
     simulation = (
         s.query(models.MatchSimulation)
@@ -45,8 +140,136 @@ def run_two_player_sim(sim_id, **kwargs):
         .one()
     )
 
-    simulation.results = [match.as_dict() for match in sim_results]
-    simulation.stats = simulation.create_stats(simulation.results)
+    cache = sim.cache.MatchCache(s, lookups_version)
+    cached = sim.cache.CachedResult.from_matches(sim_results)
+    cache.put(
+        cached,
+        profile_a=profile_a,
+        profile_b=profile_b,
+        **kwargs
+    )
+
+    results = [match.as_dict() for match in sim_results]
+    stats = simulation.create_stats(results)
+    stats['errors'] = sim.adaptive.match_errors(results)
+    if handicap_sweep:
+        stats['handicap_sweep'] = (
+            sim.handicap.HandicapSweep(cached.wins).as_dict()
+        )
+
+    simulation.results = results
+    simulation.stats = stats
+    simulation.iterations_used = len(results)
+    simulation.error = stats['errors']['profile_a_win_percent']
+
+    s.add(simulation)
+    s.commit()
+
+
+def run_round_robin_sim(
+        sim_id,
+        profiles,
+        score_shot_types,
+        score_points,
+        **kwargs
+        ):
+
+    matrix = sim.roundrobin.simulate_round_robin(
+        profiles=profiles,
+        score_shot_types=score_shot_types,
+        score_points=score_points,
+        processes=int(settings.SIMULATION_PROCESSES) or None,
+        **kwargs
+    )
+
+    simulation = (
+        s.query(models.RoundRobinSimulation)
+        .filter(models.RoundRobinSimulation.id == sim_id)
+        .one()
+    )
+
+    simulation.results = matrix.as_dict()
 
     s.add(simulation)
     s.commit()
+
+
+def solve_profile_lookups(
+        score_shot_types,
+        score_points,
+        profile_ids=None,
+        ):
+    """
+    Solve the checkout strategy of each profile (default: all of them)
+    and store it as the profile's own lookups.
+    """
+    profiles = s.query(models.Profile)
+    if profile_ids is not None:
+        profiles = profiles.filter(models.Profile.id.in_(profile_ids))
+    for profile in profiles:
+        sim.strategy.save_strategy(
+            s,
+            profile,
+            sim.strategy.solve_strategy(
+                profile,
+                score_shot_types,
+                score_points,
+            ),
+        )
+    s.commit()
+
+
+def fit_player_profiles(
+        score_shot_types,
+        score_points,
+        player_ids=None,
+        ):
+    """
+    Fit a profile to the recent results of each player (default: every
+    ranked player), and solve the fitted profiles' checkout strategies;
+    see :py:mod:`darts.modeller.fitting`.
+    """
+    players = s.query(models.Player)
+    if player_ids is None:
+        players = players.filter(models.Player.pdc_ranking.isnot(None))
+    else:
+        players = players.filter(models.Player.id.in_(player_ids))
+    profiles = fitting.fit_players(
+        s,
+        players.all(),
+        score_shot_types,
+        score_points,
+        processes=int(settings.SIMULATION_PROCESSES) or None,
+    )
+    solve_profile_lookups(
+        score_shot_types,
+        score_points,
+        [profile.id for profile in profiles],
+    )
+
+
+def run_sensitivity_analysis(
+        analysis_id,
+        profile,
+        score_shot_types,
+        score_points,
+        **kwargs
+        ):
+
+    result = sim.sensitivity.analyse_profile(
+        profile,
+        score_shot_types,
+        score_points,
+        **kwargs
+    )
+
+    analysis = (
+        s.query(models.SensitivityAnalysis)
+        .filter(models.SensitivityAnalysis.id == analysis_id)
+        .one()
+    )
+
+    analysis.results = result.as_dict()
+
+    s.add(analysis)
+    s.commit()
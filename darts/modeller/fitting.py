@@ -0,0 +1,466 @@
+# -*- coding: utf-8 -*-
+"""
+Fit profiles to players' recent results.
+
+A player's recent match results give three targets: their three dart
+average, their 180s per leg and their checkout percentage. The checkout
+percentage is the chance of a dart at a finishing double going in, which
+in the simulations is just the profile's double hit percentage. The
+treble hit and big miss percentages are then searched (with a simplex
+search, see `minimise`) until the exact leg solution (see
+`~darts.sim.exact.leg_means`) matches the other two targets, each
+weighted by the standard error of its target.
+
+The remaining percentages say little about a player's results, so they're
+interpolated through typical values (see `SECONDARY_PCTS`).
+"""
+from collections import namedtuple
+from decimal import Decimal
+import logging
+import math
+
+import numpy as np
+
+from darts import models
+from darts.sim import exact, parallel, surrogate
+from darts.sim.cache import lookups_hash
+from darts.sim.context import compile_context
+
+
+log = logging.getLogger(__name__)
+
+
+RECENT_MATCHES = 20
+"Default number of a player's most recent matches to fit to"
+
+EXCLUDED_TOURNAMENTS = [
+    11,  # PDC World Championship (sets not legs)
+    14,  # World Grand Prix (must start on double)
+]
+"Tournaments whose matches aren't like the simulations'"
+
+SECONDARY_PCTS = {
+    'double_miss_outside_pct': (
+        'double_hit_pct',
+        [(20, 25), (35, 20), (45, 15)],
+    ),
+    'bullseye_hit_pct': ('treble_hit_pct', [(20, 10), (35, 20), (45, 30)]),
+    'outer_bull_hit_pct': ('treble_hit_pct', [(20, 30), (35, 40), (45, 50)]),
+}
+"""
+Percentages that aren't fitted, each interpolated from a fitted percentage
+through the (fitted, secondary) values of weak, average and elite players
+"""
+
+START = (35.0, 10.0)
+"Treble hit and big miss percentages the search starts from"
+
+PRIOR_BIG_MISS_SCALE = 20.0
+"""
+Width of the weak prior pulling the treble big miss percentage towards its
+starting value, in percentage points, so that the fit is unique even when
+there's only one target to fit it to
+"""
+
+MIN_STD_ERRORS = dict(three_dart_average=0.5, oneeighties_per_leg=0.01)
+"Smallest standard error used to weigh each target"
+
+TOLERANCE = 1e-4
+"Default change in the loss at which the search stops"
+
+MAX_EVALUATIONS = 200
+"Default limit on the number of leg solutions per fit"
+
+
+Targets = namedtuple('Targets', [
+    'player_id',
+    'matches',
+    'three_dart_average',
+    'three_dart_average_se',
+    'oneeighties_per_leg',
+    'oneeighties_per_leg_se',
+    'checkout_percent',
+])
+"""
+A player's recent results. The standard errors are of the means; any
+result the matches don't record is None. ``checkout_percent`` is a
+percentage, like the profile percentages.
+"""
+
+
+def _mean_se(values, weights=None):
+    if not values:
+        return None, None
+    values = np.array(values, dtype=float)
+    weights = np.ones(len(values)) if weights is None else np.array(weights)
+    mean = float((values * weights).sum() / weights.sum())
+    if len(values) < 2:
+        return mean, None
+    variance = (weights * (values - mean) ** 2).sum() / weights.sum()
+    return mean, float(math.sqrt(variance / (len(values) - 1)))
+
+
+def player_targets(session, player, matches=RECENT_MATCHES):
+    """
+    Summarise a player's most recent matches.
+
+    Legs played are the legs won by both players. The checkout percentage
+    is the legs won over the checkout chances, where both are known.
+
+    :param session: database session
+    :param player: :py:class:`~darts.models.Player`
+    :param int matches: number of matches to use
+
+    :rtype: Targets
+    """
+    results = (
+        session.query(models.MatchResult)
+        .join(models.Match)
+        .join(models.Event)
+        .filter(models.MatchResult.player_id == player.id)
+        .filter(models.MatchResult.average.isnot(None))
+        .filter(~models.Event.tournament_id.in_(EXCLUDED_TOURNAMENTS))
+        .order_by(models.Match.date.desc())
+        .limit(matches)
+        .all()
+    )
+    opponent_scores = dict(
+        session.query(models.MatchResult.match_id, models.MatchResult.score)
+        .filter(models.MatchResult.match_id.in_(
+            [result.match_id for result in results] or [None]
+        ))
+        .filter(models.MatchResult.player_id != player.id)
+    )
+
+    average, average_se = _mean_se([result.average for result in results])
+
+    rates, legs = [], []
+    won, chances = 0, 0
+    for result in results:
+        played = (
+            (result.score or 0) + (opponent_scores.get(result.match_id) or 0)
+        )
+        if result.oneeighties is not None and played:
+            rates.append(float(result.oneeighties) / played)
+            legs.append(played)
+        if result.score is not None and result.checkout_chances:
+            won += result.score
+            chances += result.checkout_chances
+    oneeighties, oneeighties_se = _mean_se(rates, legs)
+
+    return Targets(
+        player.id,
+        len(results),
+        average,
+        average_se,
+        oneeighties,
+        oneeighties_se,
+        100.0 * won / chances if chances else None,
+    )
+
+
+def minimise(f, x0, step, tolerance=TOLERANCE, max_evaluations=None):
+    """
+    Minimise a function with the Nelder-Mead simplex search.
+
+    :param f: function of a 1-d array
+    :param x0: starting point
+    :param step: size of the starting simplex along each axis
+    :param float tolerance: stop once the values at the simplex's points
+        are all within this of each other
+    :param int max_evaluations: limit on the number of calls to ``f``
+    :return: the best point and its value.
+    """
+    x0 = np.asarray(x0, dtype=float)
+    points = [x0] + [x0 + step * np.eye(len(x0))[i] for i in range(len(x0))]
+    values = [f(x) for x in points]
+    evaluations = len(points)
+
+    while max_evaluations is None or evaluations < max_evaluations:
+        order = np.argsort(values)
+        points = [points[i] for i in order]
+        values = [values[i] for i in order]
+        if values[-1] - values[0] <= tolerance:
+            break
+
+        centroid = np.mean(points[:-1], axis=0)
+        reflected = centroid + (centroid - points[-1])
+        reflected_value = f(reflected)
+        evaluations += 1
+        if reflected_value < values[0]:
+            expanded = centroid + 2 * (centroid - points[-1])
+            expanded_value = f(expanded)
+            evaluations += 1
+            if expanded_value < reflected_value:
+                points[-1], values[-1] = expanded, expanded_value
+            else:
+                points[-1], values[-1] = reflected, reflected_value
+        elif reflected_value < values[-2]:
+            points[-1], values[-1] = reflected, reflected_value
+        else:
+            contracted = centroid + 0.5 * (points[-1] - centroid)
+            contracted_value = f(contracted)
+            evaluations += 1
+            if contracted_value < values[-1]:
+                points[-1], values[-1] = contracted, contracted_value
+            else:
+                # Shrink towards the best point.
+                points = [points[0]] + [
+                    points[0] + 0.5 * (x - points[0]) for x in points[1:]
+                ]
+                values = [values[0]] + [f(x) for x in points[1:]]
+                evaluations += len(points) - 1
+
+    best = int(np.argmin(values))
+    return points[best], values[best]
+
+
+def profile_percentages(treble_hit, treble_big_miss, double_hit):
+    """
+    Return every profile percentage from the fitted ones, filling in the
+    rest from `SECONDARY_PCTS` and making each shot's add up to 100.
+    """
+    pcts = dict(
+        treble_hit_pct=treble_hit,
+        treble_big_miss_pct=treble_big_miss,
+        double_hit_pct=double_hit,
+    )
+    for column, (fitted, points) in SECONDARY_PCTS.items():
+        xs, ys = zip(*points)
+        pcts[column] = float(np.interp(pcts[fitted], xs, ys))
+    pcts['double_miss_outside_pct'] = min(
+        pcts['double_miss_outside_pct'],
+        100 - double_hit,
+    )
+    pcts['treble_miss_pct'] = 100 - treble_hit - treble_big_miss
+    pcts['double_miss_inside_pct'] = (
+        100 - double_hit - pcts['double_miss_outside_pct']
+    )
+    pcts['bullseye_miss_pct'] = 100 - pcts['bullseye_hit_pct']
+    pcts['outer_bull_miss_pct'] = 100 - pcts['outer_bull_hit_pct']
+    return pcts
+
+
+class ProfileFit:
+
+    """
+    The result of fitting a profile to a player's targets.
+
+    :param Targets targets: what was fitted to
+    :param dict percentages: every profile percentage, as returned by
+        `profile_percentages`
+    :param dict predicted: the three dart average and 180s per leg of the
+        fitted profile
+    :param float loss: the weighted sum of squared errors
+    """
+
+    def __init__(self, targets, percentages, predicted, loss):
+        self.targets = targets
+        self.percentages = percentages
+        self.predicted = predicted
+        self.loss = loss
+
+    def apply(self, profile):
+        """
+        Set a profile's percentages to the fitted ones.
+        """
+        for column, value in self.percentages.items():
+            # Profile columns hold two decimal places.
+            setattr(profile, column, Decimal(value).quantize(Decimal('.01')))
+        return profile
+
+
+def _leg_stats(context, percentages, total):
+    mean_darts, mean_180s = exact.leg_means(
+        context.for_profile(models.Profile(**percentages)),
+        total=total,
+    )
+    return dict(
+        three_dart_average=3.0 * total / mean_darts[total],
+        oneeighties_per_leg=float(mean_180s[total]),
+    )
+
+
+def _grid_stats(grid, percentages):
+    values = dict(zip(
+        grid.statistics,
+        grid.interpolate([percentages[column] for column in grid.columns]),
+    ))
+    return dict(
+        three_dart_average=3.0 * grid.total / values['expected_darts'],
+        oneeighties_per_leg=values['avg_180s'],
+    )
+
+
+def fit_targets(
+        targets,
+        context,
+        total=501,
+        tolerance=TOLERANCE,
+        max_evaluations=MAX_EVALUATIONS,
+        grid=None,
+        ):
+    """
+    Fit a profile to a player's targets.
+
+    The three dart average is taken as three times the leg total over the
+    expected darts per leg, as an average across legs would be.
+
+    :param Targets targets: the player's recent results; the three dart
+        average is required.
+    :param context: compiled context holding the lookups to fit with; its
+        profile is ignored.
+    :param int total: Total required to win a leg of darts (default: 501).
+    :param grid: :py:class:`~darts.sim.surrogate.SurrogateGrid` built with
+        the same lookups (optional); if given, the profile's results are
+        interpolated from the grid rather than solved, which is much faster
+        but only as accurate as the grid. The fitted profile's results are
+        solved either way.
+
+    :rtype: ProfileFit
+    """
+    double_hit = float(np.clip(
+        targets.checkout_percent
+        if targets.checkout_percent is not None else START[0],
+        1,
+        99,
+    ))
+    fitted = [(
+        'three_dart_average',
+        targets.three_dart_average,
+        max(
+            targets.three_dart_average_se or 0,
+            MIN_STD_ERRORS['three_dart_average'],
+        ),
+    )]
+    if targets.oneeighties_per_leg is not None:
+        fitted.append((
+            'oneeighties_per_leg',
+            targets.oneeighties_per_leg,
+            max(
+                targets.oneeighties_per_leg_se or 0,
+                MIN_STD_ERRORS['oneeighties_per_leg'],
+            ),
+        ))
+
+    def percentages(x):
+        treble_hit = float(np.clip(x[0], 1, 99))
+        treble_big_miss = float(np.clip(x[1], 0, 100 - treble_hit))
+        return profile_percentages(treble_hit, treble_big_miss, double_hit)
+
+    def loss(x, leg_stats):
+        pcts = percentages(x)
+        stats = leg_stats(pcts)
+        # Points outside the valid percentages are pushed back in.
+        outside = (
+            float(pcts['treble_hit_pct']) - x[0]
+        ) ** 2 + (float(pcts['treble_big_miss_pct']) - x[1]) ** 2
+        return sum(
+            ((stats[name] - target) / se) ** 2
+            for name, target, se in fitted
+        ) + ((x[1] - START[1]) / PRIOR_BIG_MISS_SCALE) ** 2 + outside
+
+    def exact_stats(pcts):
+        return _leg_stats(context, pcts, total)
+
+    def grid_stats(pcts):
+        return _grid_stats(grid, pcts)
+
+    x, value = minimise(
+        lambda x: loss(x, exact_stats if grid is None else grid_stats),
+        START,
+        step=10.0,
+        tolerance=tolerance,
+        max_evaluations=max_evaluations,
+    )
+    pcts = percentages(x)
+    return ProfileFit(targets, pcts, exact_stats(pcts), value)
+
+
+def _fit_task(task):
+    targets, kwargs = task
+    return fit_targets(targets, parallel.worker_contexts()[0], **kwargs)
+
+
+def fit_players(
+        session,
+        players,
+        score_shot_types,
+        score_points,
+        matches=RECENT_MATCHES,
+        total=501,
+        processes=None,
+        approximate=False,
+        ):
+    """
+    Fit a profile to each player's recent results, and save it.
+
+    Each player's fitted profile is named after them and linked to them by
+    :py:attr:`~darts.models.Profile.player_id`; a player who already has
+    one has it updated. Players with no recent averages are skipped. The
+    session is committed.
+
+    :param session: database session
+    :param list players: :py:class:`~darts.models.Player` objects
+    :param dict score_shot_types: mapping from (score, dart_number) to
+        shot types, as returned by `~darts.sim.load_lookups`
+    :param dict score_points: mapping from (score, dart ID) to score tuple,
+        as returned by `~darts.sim.load_lookups`.
+    :param int matches: number of each player's recent matches to fit to
+    :param int total: Total required to win a leg of darts (default: 501).
+    :param int processes: number of processes (default: one per CPU).
+    :param bool approximate: fit against the surrogate grid (see
+        `~darts.sim.surrogate`), if one has been built for the same
+        lookups, rather than solving each candidate profile's legs.
+
+    :return: the fitted profiles.
+    """
+    players = {player.id: player for player in players}
+    targets = [
+        player_targets(session, player, matches)
+        for player in players.values()
+    ]
+    targets = [t for t in targets if t.three_dart_average is not None]
+    context = compile_context(
+        models.Profile(**profile_percentages(START[0], START[1], START[0])),
+        score_shot_types,
+        score_points,
+        max_score=total,
+    )
+    version = lookups_hash(score_shot_types, score_points)
+    grid = surrogate.load_grid() if approximate else None
+    if grid is not None and (
+            grid.lookups_version != version or grid.total != total):
+        log.warning('ignoring %r, built for other lookups', grid)
+        grid = None
+    fits = parallel.run_shards(
+        _fit_task,
+        [(t, dict(total=total, grid=grid)) for t in targets],
+        (context,),
+        processes=processes,
+    )
+
+    profiles = []
+    for fit in fits:
+        player = players[fit.targets.player_id]
+        profile = (
+            session.query(models.Profile)
+            .filter(models.Profile.player_id == player.id)
+            .first()
+        )
+        if profile is None:
+            profile = models.Profile(
+                name=u'{} (fitted)'.format(player.name),
+                player_id=player.id,
+            )
+            session.add(profile)
+        profiles.append(fit.apply(profile))
+        log.info(
+            'fitted %s: average %.2f (target %.2f), loss %.3f',
+            player,
+            fit.predicted['three_dart_average'],
+            fit.targets.three_dart_average,
+            fit.loss,
+        )
+    session.commit()
+    return profiles
@@ -376,6 +376,7 @@ class Profile(Base):
 
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
+    player_id = Column(Integer, ForeignKey('players.id'), nullable=True)
 
     treble_hit_pct = Column(Numeric(4, 2), nullable=False)
     treble_miss_pct = Column(Numeric(4, 2), nullable=False)
@@ -393,6 +394,8 @@ class Profile(Base):
     double_miss_inside_pct = Column(Numeric(4, 2), nullable=False)
     double_miss_outside_pct = Column(Numeric(4, 2), nullable=False)
 
+    player = relationship('Player', backref='profiles')
+
     def __repr__(self):
         return "<Profile(name='%s')>" % self.name
 
@@ -450,6 +453,42 @@ class ScoreLookup(Base):
         return repr(self)
 
 
+class ProfileScoreLookup(Base):
+
+    """
+    A profile's own score lookups: the checkout strategy solved for it by
+    :py:func:`darts.sim.strategy.solve_strategy`.
+    """
+
+    __tablename__ = 'profile_score_lookups'
+
+    profile_id = Column(Integer, ForeignKey('profiles.id'), primary_key=True)
+    score = Column(Integer, primary_key=True)
+    dart = Column(Enum(DartEnum, name='dart_numbers'), primary_key=True)
+
+    shot_type = Column(Enum(
+        'single',
+        'treble',
+        'bull',
+        'outer_bull',
+        'double',
+        name='shot_types',
+    ), nullable=False)
+
+    hit_points = Column(Integer, nullable=False)
+    miss_points = Column(Integer, nullable=True)
+    big_miss_points = Column(Integer, nullable=True)
+
+    def __repr__(self):
+        return (
+            "<ProfileScoreLookup(profile='%s', score='%s', dart='%s')>" % (
+                self.profile_id,
+                self.score,
+                self.dart,
+            )
+        )
+
+
 class PlayerSimulation(Base):
 
     __tablename__ = 'player_simulations'
@@ -459,6 +498,11 @@ class PlayerSimulation(Base):
     iterations = Column(Integer, nullable=False, default=10000)
     results = deferred(Column(JSONB, nullable=True))
     run_time = Column(DateTime, default=func.now())
+    # Seed of the random stream the simulation was run with.
+    seed = Column(Integer, nullable=True)
+    # Whether the profile threw with its own checkout strategy rather than
+    # the shared score lookups.
+    optimal_lookups = Column(Boolean, nullable=False, default=False)
 
     profile = relationship('Profile')
 
@@ -501,12 +545,21 @@ class PlayerSimulation(Base):
     def std_180s(self):
         return self.stats.get('std_180s')
 
+    @cached_property
+    def darts(self):
+        # Imported here as darts.sim imports this module.
+        from darts.sim.columns import DartColumns
+        return DartColumns.from_results(self.results)
+
     @cached_property
     def leg_darts(self):
-        return [leg['all_darts'] for leg in (self.results or [])]
+        return self.darts.to_lists()
 
     @cached_property
     def three_dart_average_hist(self):
+        if 'three_dart_average_hist' in self.stats:
+            # Accumulated while the simulation ran.
+            return self.stats['three_dart_average_hist']
         hist = np.histogram(self.leg_averages, bins=20)
         ticks = [
             str(round(edge, 1)) for edge in hist[1]
@@ -518,36 +571,25 @@ class PlayerSimulation(Base):
 
     @cached_property
     def three_dart_scores(self):
-        counter = Counter(
-            sum(dart[2] for dart in three_darts)
-            for leg in self.leg_darts
-            for three_darts in leg
-        )
-        scores = []
-        labels = []
-        for x in xrange(181):
-            scores.append(counter[x])
-            labels.append(x)
-
-        return scores, labels
+        if 'three_dart_scores' in self.stats:
+            # Accumulated while the simulation ran.
+            return self.stats['three_dart_scores'], range(181)
+        scores = np.bincount(self.darts.three_dart_totals(), minlength=181)
+        return scores.tolist(), range(181)
 
     @cached_property
     def all_darts(self):
-        def darts():
-            for leg_id, leg in enumerate(self.results):
-                score = 501
-                for three_darts in leg['all_darts']:
-                    for dart_id, dart in enumerate(three_darts):
-                        yield (
-                            leg_id + 1,
-                            score,
-                            dart_id + 1,
-                            ShotTypeEnum(dart[0]).name,
-                            ShotResultEnum(dart[1]).name,
-                            dart[2],
-                        )
-                        score -= dart[2]
-        return list(darts())
+        darts = self.darts
+        shot_type_names = [x.name for x in ShotTypeEnum]
+        result_names = [x.name for x in ShotResultEnum]
+        return zip(
+            (darts.leg_ids + 1).tolist(),
+            darts.start_scores(501).tolist(),
+            darts.dart_numbers().tolist(),
+            [shot_type_names[x] for x in darts.shot_types.tolist()],
+            [result_names[x] for x in darts.results.tolist()],
+            darts.points.tolist(),
+        )
 
     def __repr__(self):
         return "<PlayerSimulation(profile_id='%s', iterations='%s')>" % (
@@ -581,6 +623,20 @@ class MatchSimulation(Base):
     b_handicap = Column(Integer, nullable=False, default=0)
     results = deferred(Column(JSONB, nullable=True))
     run_time = Column(DateTime, default=func.now())
+    # Seed of the random stream the simulation was run with.
+    seed = Column(Integer, nullable=True)
+    # Requested confidence interval half-width on profile_a_win_percent, if
+    # the simulation was allowed to stop before running every iteration.
+    tolerance = Column(Float, nullable=True)
+    score_tolerance = Column(Float, nullable=True)
+    # Iterations actually run, and the half-width they achieved.
+    iterations_used = Column(Integer, nullable=True)
+    error = Column(Float, nullable=True)
+    # Whether the result under every pair of handicaps was derived too.
+    handicap_sweep = Column(Boolean, nullable=False, default=False)
+    # Whether each profile threw with its own checkout strategy rather than
+    # the shared score lookups.
+    optimal_lookups = Column(Boolean, nullable=False, default=False)
 
     stats = Column(JSONB, nullable=True)
 
@@ -626,6 +682,14 @@ class MatchSimulation(Base):
     def profile_b_win_percent(self):
         return self.stats['profile_b_win_percent']
 
+    @cached_property
+    def sweep(self):
+        if not self.stats or 'handicap_sweep' not in self.stats:
+            return None
+        # Imported here as darts.sim imports this module.
+        from darts.sim.handicap import HandicapSweep
+        return HandicapSweep.from_dict(self.stats['handicap_sweep'])
+
     def __repr__(self):
         return (
             "<MatchSimulation(match_type='%s', profile_a_id='%s', "
@@ -646,3 +710,191 @@ class MatchSimulation(Base):
                 self.iterations,
             )
         )
+
+
+class CachedMatchResult(Base):
+
+    """
+    The distribution of a match's result, stored so that the same pairing
+    doesn't need simulating (or solving) again.
+
+    Rows are keyed by a hash of everything the result depends on; see
+    :py:mod:`darts.sim.cache`.
+    """
+
+    __tablename__ = 'match_result_cache'
+
+    key = Column(String(40), primary_key=True)
+    match_type = Column(Enum(
+        'match_play',
+        'set_play',
+        'premier_league',
+        name='match_types',
+    ), nullable=False)
+    profile_a_hash = Column(String(40), nullable=False, index=True)
+    profile_b_hash = Column(String(40), nullable=False, index=True)
+    lookups_hash = Column(String(40), nullable=False)
+    # Matches simulated, or None for an exact solution.
+    iterations = Column(Integer, nullable=True)
+    # Confidence interval half-widths on A's win probability and on the
+    # least precise score probability.
+    error = Column(Float, nullable=False)
+    score_error = Column(Float, nullable=False)
+    # Probability of each 'A legs (or sets)-B legs (or sets)', before
+    # handicaps.
+    wins = Column(JSONB, nullable=False)
+    # Probabilities of A winning a leg when throwing first and second, if
+    # known.
+    leg_win_probs = Column(JSONB, nullable=True)
+    last_updated = Column(DateTime, default=func.now())
+
+    def __repr__(self):
+        return "<CachedMatchResult(key='%s', iterations='%s')>" % (
+            self.key,
+            self.iterations,
+        )
+
+
+class CachedLegDistribution(Base):
+
+    """
+    A profile's distribution of visits needed to finish a leg, stored so
+    that matches can be sampled a leg at a time; see
+    :py:mod:`darts.sim.legs`.
+    """
+
+    __tablename__ = 'leg_distribution_cache'
+
+    key = Column(String(40), primary_key=True)
+    profile_hash = Column(String(40), nullable=False, index=True)
+    lookups_hash = Column(String(40), nullable=False)
+    total = Column(Integer, nullable=False)
+    method = Column(Enum(
+        'exact',
+        'monte_carlo',
+        name='leg_distribution_methods',
+    ), nullable=False)
+    # Legs simulated, or None for an exact solution.
+    iterations = Column(Integer, nullable=True)
+    # Probability of finishing in each number of visits, from 0.
+    visits = Column(JSONB, nullable=False)
+    last_updated = Column(DateTime, default=func.now())
+
+    def __repr__(self):
+        return "<CachedLegDistribution(key='%s', method='%s')>" % (
+            self.key,
+            self.method,
+        )
+
+
+class RoundRobinSimulation(Base):
+
+    __tablename__ = 'round_robin_simulations'
+
+    id = Column(Integer, primary_key=True)
+    match_type = Column(Enum(
+        'match_play',
+        'set_play',
+        'premier_league',
+        name='match_types',
+    ), nullable=False)
+    # Profiles in the order of the rows and columns of the matrix.
+    profile_ids = Column(JSONB, nullable=False)
+    iterations = Column(Integer, nullable=False, default=1000)
+    total_legs = Column(Integer, nullable=True)
+    total_sets = Column(Integer, nullable=True)
+    # Seed of the random stream the simulation was run with.
+    seed = Column(Integer, nullable=True)
+    # The matrix, as returned by MatchMatrix.as_dict.
+    results = deferred(Column(JSONB, nullable=True))
+    run_time = Column(DateTime, default=func.now())
+
+    @property
+    def match_type_pretty(self):
+        return dict(
+            match_play='Match Play',
+            set_play='Set Play',
+            premier_league='Premier League',
+        )[self.match_type]
+
+    def load_profiles(self, session):
+        """
+        Return the profiles, in matrix order.
+        """
+        profiles = {
+            profile.id: profile
+            for profile in session.query(Profile).filter(
+                Profile.id.in_(self.profile_ids)
+            )
+        }
+        return [profiles[profile_id] for profile_id in self.profile_ids]
+
+    @cached_property
+    def matrix(self):
+        # Imported here as darts.sim imports this module.
+        from darts.sim.roundrobin import MatchMatrix
+        return MatchMatrix.from_dict(self.results)
+
+    def __repr__(self):
+        return (
+            "<RoundRobinSimulation(match_type='%s', profile_ids='%s', "
+            "iterations='%s')>" % (
+                self.match_type,
+                self.profile_ids,
+                self.iterations,
+            )
+        )
+
+    def __str__(self):
+        return (
+            "Round robin of {} matches between {} profiles "
+            "({} iterations)".format(
+                self.match_type,
+                len(self.profile_ids),
+                self.iterations,
+            )
+        )
+
+
+class SensitivityAnalysis(Base):
+
+    __tablename__ = 'sensitivity_analyses'
+
+    id = Column(Integer, primary_key=True)
+    profile_id = Column(Integer, ForeignKey('profiles.id'), nullable=False)
+    # Profile the match win probability is found against, if any.
+    opponent_id = Column(Integer, ForeignKey('profiles.id'), nullable=True)
+    match_type = Column(Enum(
+        'match_play',
+        'set_play',
+        'premier_league',
+        name='match_types',
+    ), nullable=True)
+    total_legs = Column(Integer, nullable=True)
+    total_sets = Column(Integer, nullable=True)
+    # Step each percentage was moved by, in percentage points.
+    step = Column(Float, nullable=False, default=1.0)
+    # The derivatives, as returned by SensitivityResult.as_dict.
+    results = deferred(Column(JSONB, nullable=True))
+    run_time = Column(DateTime, default=func.now())
+
+    profile = relationship(
+        'Profile',
+        primaryjoin='SensitivityAnalysis.profile_id==Profile.id',
+    )
+    opponent = relationship(
+        'Profile',
+        primaryjoin='SensitivityAnalysis.opponent_id==Profile.id',
+    )
+
+    @cached_property
+    def result(self):
+        # Imported here as darts.sim imports this module.
+        from darts.sim.sensitivity import SensitivityResult
+        return SensitivityResult.from_dict(self.results)
+
+    def __repr__(self):
+        return "<SensitivityAnalysis(profile='%s', opponent='%s')>" % (
+            self.profile_id,
+            self.opponent_id,
+        )
@@ -25,6 +25,39 @@ PROFILES_PER_PAGE = 20
 
 JOB_TIMEOUT = 3000
 
+# Number of processes to shard each simulation job across; 1 runs the job
+# in the worker process itself, 0 uses one process per CPU.
+SIMULATION_PROCESSES = 1
+
+# Number of cached match results each process keeps in memory, in front of
+# the match_result_cache table.
+MATCH_CACHE_SIZE = 1024
+
+# How the simulation jobs throw a visit: 'darts' throws its darts one at a
+# time, 'visits' draws the whole visit from a table (see darts.sim.visits).
+SIMULATION_KERNEL = 'darts'
+
+# Number of visit tables each process keeps in memory.
+VISIT_TABLE_CACHE_SIZE = 32
+
+# Seconds the simulation forms may spend answering a request themselves
+# before handing it to the job queue instead (see darts.sim.fastpath).
+INLINE_BUDGET = 0.2
+
+# Number of profiles' leg-state tables each process keeps in memory for
+# in-play win probabilities and inline match solutions (see
+# darts.sim.inplay).
+IN_PLAY_CACHE_SIZE = 64
+
+# How match simulation jobs build the leg-length distributions they sample
+# legs from (see darts.sim.legs): 'exact' or 'monte_carlo'. None simulates
+# every dart instead.
+LEG_DISTRIBUTIONS = None
+
+# Path of the precomputed grid of profile results (see darts.sim.surrogate);
+# None uses surrogate_grid.npz at the top of the repository.
+SURROGATE_GRID_PATH = None
+
 SLACK_API_TOKEN = None
 SLACK_BOT_NAME = 'dartsbot'
 
@@ -1,8 +1,32 @@
 # flake8: noqa
+import csv
+import os
 
 from darts import models
 
-from . import oneplayer, twoplayer
+from . import (
+    adaptive,
+    cache,
+    context,
+    exact,
+    fastpath,
+    handicap,
+    inplay,
+    knockout,
+    legs,
+    oneplayer,
+    paired,
+    parallel,
+    roundrobin,
+    sensitivity,
+    strategy,
+    streams,
+    surrogate,
+    twoplayer,
+    vectorized,
+    visits,
+)
+from .context import CompiledSimContext
 
 
 class QuietDict(dict):
@@ -37,3 +61,32 @@ def load_lookups(session):
         )
 
     return score_shot_types, score_points
+
+
+LOOKUPS_CSV = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+    'darts_scores.csv',
+)
+"Path of the score lookups shipped with the repository"
+
+
+def load_lookups_csv(path=LOOKUPS_CSV):
+    """
+    Read the two required lookup tables from a CSV file, without a database.
+
+    The file has the columns of :py:class:`~darts.models.ScoreLookup`, with
+    darts named 'one', 'two' and 'three'. Returns the same as
+    `load_lookups`.
+    """
+    score_shot_types = QuietDict()
+    score_points = QuietDict()
+    with open(path) as f:
+        for row in csv.DictReader(f):
+            key = (int(row['score']), models.DartEnum[row['dart']])
+            score_shot_types[key] = models.ShotTypeEnum(row['shot_type'])
+            score_points[key] = tuple(
+                int(row[column]) if row[column] else None
+                for column in ('hit_points', 'miss_points', 'big_miss_points')
+            )
+
+    return score_shot_types, score_points
@@ -0,0 +1,215 @@
+"""
+Running statistics for simulations too large to keep in memory.
+
+Rather than holding every simulated leg until the end of a job, the legs
+are folded into a `LegAccumulator` as they are simulated, which keeps
+running means and variances (Welford's algorithm) and fixed-size
+histograms. Its memory use doesn't depend on the number of legs, unless
+the full dart traces are asked for.
+"""
+import numpy as np
+
+from .columns import DartColumns
+
+
+AVERAGE_BIN_WIDTH = 0.1
+"Width of the bins used to accumulate three dart averages"
+
+MAX_AVERAGE = 180
+"Largest possible three dart average"
+
+AVERAGE_HIST_BINS = 20
+"Number of bins in the three dart average histogram"
+
+
+def average_bin(averages):
+    """
+    Return the index of the `AVERAGE_BIN_WIDTH` bin holding each average.
+    """
+    # Round first so that e.g. 47.0 isn't put in the 46.9 bin.
+    return np.floor(
+        np.round(np.asarray(averages) / AVERAGE_BIN_WIDTH, 6)
+    ).astype(int)
+
+
+class RunningStats:
+
+    """
+    Running count, mean and variance of a stream of numbers.
+
+    Single values are added with Welford's algorithm, and arrays (or other
+    `RunningStats`) are merged in with Chan et al.'s parallel update, so
+    the result doesn't depend on how the stream was split up.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def add_many(self, xs):
+        xs = np.asarray(xs, dtype=float)
+        if xs.size:
+            self._merge(xs.size, xs.mean(), ((xs - xs.mean()) ** 2).sum())
+
+    def merge(self, other):
+        if other.n:
+            self._merge(other.n, other.mean, other.m2)
+
+    def _merge(self, n, mean, m2):
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta ** 2 * self.n * n / total
+        self.n = total
+
+    @property
+    def variance(self):
+        """
+        Population variance, as returned by :py:func:`numpy.var`.
+        """
+        return self.m2 / self.n if self.n else 0.0
+
+    @property
+    def std(self):
+        return self.variance ** 0.5
+
+
+class LegAccumulator:
+
+    """
+    Summary statistics of a stream of simulated legs.
+
+    Legs can be added one at a time (any object with the attributes of
+    :py:class:`~darts.sim.oneplayer.LegStats`) or a whole
+    :py:class:`~darts.sim.vectorized.LegBatch` at once. Accumulators of
+    different parts of a simulation can be merged.
+
+    :param bool keep_darts: keep every dart thrown (see `darts`), as well
+        as the running statistics.
+    """
+
+    def __init__(self, keep_darts=False):
+        self.keep_darts = keep_darts
+        self._darts = [] if keep_darts else None
+        self.averages = RunningStats()
+        self.num_180s = RunningStats()
+        self.min_average = np.inf
+        self.max_average = -np.inf
+        self.average_counts = np.zeros(
+            int(MAX_AVERAGE / AVERAGE_BIN_WIDTH) + 1,
+            dtype=np.int64,
+        )
+        self.three_dart_counts = np.zeros(181, dtype=np.int64)
+
+    def __len__(self):
+        return self.averages.n
+
+    def _add_averages(self, averages):
+        averages = np.atleast_1d(averages)
+        self.min_average = min(self.min_average, averages.min())
+        self.max_average = max(self.max_average, averages.max())
+        self.average_counts += np.bincount(
+            average_bin(averages),
+            minlength=self.average_counts.size,
+        )
+
+    def add(self, leg):
+        """
+        Add a single leg.
+        """
+        self.averages.add(leg.three_dart_average)
+        self.num_180s.add(leg.num_180s)
+        self._add_averages(leg.three_dart_average)
+        for three_dart_total in leg.three_dart_totals:
+            self.three_dart_counts[three_dart_total] += 1
+        if self.keep_darts:
+            self._darts.append(leg.darts)
+
+    def add_batch(self, batch):
+        """
+        Add every leg of a :py:class:`~darts.sim.vectorized.LegBatch`.
+        """
+        if not len(batch):
+            return
+        self.averages.add_many(batch.three_dart_averages)
+        self.num_180s.add_many(batch.num_180s)
+        self._add_averages(batch.three_dart_averages)
+        self.three_dart_counts += np.bincount(
+            batch.three_dart_totals,
+            minlength=self.three_dart_counts.size,
+        )
+        if self.keep_darts:
+            self._darts.append(batch.darts)
+
+    def merge(self, other):
+        """
+        Add the legs of another accumulator, as if they had been added to
+        this one.
+        """
+        self.averages.merge(other.averages)
+        self.num_180s.merge(other.num_180s)
+        self.min_average = min(self.min_average, other.min_average)
+        self.max_average = max(self.max_average, other.max_average)
+        self.average_counts += other.average_counts
+        self.three_dart_counts += other.three_dart_counts
+        if self.keep_darts:
+            self._darts.extend(other._darts or [])
+
+    @property
+    def darts(self):
+        """
+        Every dart thrown in the accumulated legs, as a
+        :py:class:`~darts.sim.columns.DartColumns`, or None unless
+        ``keep_darts`` was set.
+        """
+        if not self.keep_darts:
+            return None
+        return DartColumns.concatenate(self._darts)
+
+    def average_hist(self, bins=AVERAGE_HIST_BINS):
+        """
+        Histogram of three dart averages across the observed range.
+
+        The fine accumulated bins are regrouped into ``bins`` bins, so the
+        edges are approximate to within `AVERAGE_BIN_WIDTH`.
+
+        :return: counts and labels, as for
+            :py:attr:`~darts.models.PlayerSimulation.three_dart_average_hist`
+        """
+        if not len(self):
+            return [], []
+        lo = int(average_bin(self.min_average))
+        hi = int(average_bin(self.max_average)) + 1
+        groups = np.linspace(lo, hi, bins + 1).round().astype(int)
+        counts = np.add.reduceat(self.average_counts[:hi], groups[:-1])
+        # reduceat returns the single bin rather than zero for empty groups
+        counts[groups[:-1] == groups[1:]] = 0
+        ticks = [str(round(x * AVERAGE_BIN_WIDTH, 1)) for x in groups]
+        labels = ['-'.join(x) for x in zip(ticks, ticks[1:])]
+        return counts.tolist(), labels
+
+    def stats(self):
+        """
+        Return the accumulated stats, in the form stored in
+        :py:attr:`~darts.models.PlayerSimulation.stats`.
+
+        Unlike :py:meth:`~darts.models.PlayerSimulation.create_stats`, the
+        per-leg averages and 180s aren't included; the histograms they were
+        used for are stored instead.
+        """
+        return dict(
+            n_legs=len(self),
+            three_dart_average=self.averages.mean,
+            three_dart_std_dev=self.averages.std,
+            avg_180s=self.num_180s.mean,
+            std_180s=self.num_180s.std,
+            three_dart_average_hist=self.average_hist(),
+            three_dart_scores=self.three_dart_counts.tolist(),
+        )
@@ -0,0 +1,131 @@
+"""
+Precision-targeted match simulations.
+
+Rather than always running a fixed number of matches, a simulation can be
+run in batches until the confidence interval on player A's win
+probability (and, optionally, on every score probability) is narrower than
+a requested tolerance. The requested number of iterations becomes an upper
+limit.
+"""
+from collections import Counter
+import logging
+
+
+log = logging.getLogger(__name__)
+
+
+Z = 1.96
+"Standard normal quantile of the confidence intervals (95%)"
+
+BATCH_SIZE = 2000
+"Default number of matches simulated between precision checks"
+
+MIN_ITERATIONS = 1000
+"Number of matches to simulate before checking the precision"
+
+
+def half_width(count, n, z=Z):
+    """
+    Return the half-width of the Wilson score confidence interval on a
+    probability estimated as ``count / n``.
+
+    Unlike the normal-approximation interval, this isn't zero when
+    ``count`` is 0 or ``n``, so a lopsided pairing or a score that hasn't
+    come up yet doesn't look perfectly precise.
+    """
+    p = float(count) / n
+    z2 = z * z
+    return (
+        z * (p * (1 - p) / n + z2 / (4.0 * n * n)) ** 0.5 /
+        (1 + z2 / n)
+    )
+
+
+def match_errors(results, z=Z):
+    """
+    Return the confidence interval half-widths achieved by a simulation.
+
+    Returns a dict with the half-width on ``profile_a_win_percent`` and the
+    largest half-width on any of the ``score_probs``, in the same units as
+    :py:meth:`~darts.models.MatchSimulation.create_stats` (probabilities,
+    not percentages).
+
+    :param list results: match results, as returned by
+        :py:meth:`~darts.sim.twoplayer.MatchStats.as_dict`
+    """
+    return _errors(
+        sum(match['winner'] == 'a' for match in results),
+        Counter(tuple(match['scores']) for match in results),
+        len(results),
+        z,
+    )
+
+
+def _errors(a_wins, score_counter, n, z=Z):
+    return dict(
+        profile_a_win_percent=half_width(a_wins, n, z),
+        score_probs=max(
+            half_width(count, n, z) for count in score_counter.values()
+        ),
+    )
+
+
+def simulate_until_precise(
+        simulate_batch,
+        iterations,
+        tolerance,
+        score_tolerance=None,
+        a_first=True,
+        random_state=None,
+        batch_size=BATCH_SIZE,
+        min_iterations=MIN_ITERATIONS,
+        ):
+    """
+    Simulate matches in batches until the results are precise enough.
+
+    Stops once at least ``min_iterations`` matches have been run and the
+    half-widths from `match_errors` are within the tolerances, or once
+    ``iterations`` matches have been run.
+
+    :param simulate_batch: function taking the number of matches, whether
+        player A throws first in the first of them, and a random stream,
+        and returning a list of :py:class:`~darts.sim.twoplayer.MatchStats`
+    :param int iterations: maximum number of matches to simulate.
+    :param float tolerance: target half-width on player A's win probability.
+    :param float score_tolerance: optional target half-width on every score
+        probability.
+    :param bool a_first: whether player A throws first in the first match.
+        The first thrower alternates between matches, across batches.
+    :param random_state: :py:class:`~darts.sim.streams.RandomStream` whose
+        children are given to each batch.
+    :param int batch_size: number of matches between precision checks.
+    :param int min_iterations: matches to simulate before stopping early.
+
+    :return: the simulated matches.
+    """
+    matches = []
+    a_wins, score_counter = 0, Counter()
+    batch = 0
+    while len(matches) < iterations:
+        start = len(matches)
+        new_matches = simulate_batch(
+            min(batch_size, iterations - start),
+            a_first == (start % 2 == 0),
+            random_state.child(batch),
+        )
+        batch += 1
+        matches.extend(new_matches)
+        for match in new_matches:
+            a_wins += match.scores[0] > match.scores[1]
+            score_counter[tuple(match.scores)] += 1
+
+        if len(matches) < min_iterations:
+            continue
+        errors = _errors(a_wins, score_counter, len(matches))
+        log.info('ran %s matches, errors: %s', len(matches), errors)
+        if errors['profile_a_win_percent'] <= tolerance and (
+                score_tolerance is None or
+                errors['score_probs'] <= score_tolerance):
+            break
+
+    return matches
@@ -0,0 +1,449 @@
+"""
+A persistent cache of match results.
+
+The distribution of a match's result (before handicaps) depends only on
+how the two profiles throw, the score lookups, and the match format, so
+it's stored in the ``match_result_cache`` table under a hash of those, with
+a per-process LRU in front. A simulation of a pairing that's already been
+simulated, or solved exactly, to the precision requested can be served
+from the cache without running anything.
+
+Keys are content hashes, so an edited profile or lookup simply stops
+matching its old entries. Those entries are also deleted when the edit is
+flushed, by the listeners at the bottom of this module.
+"""
+from collections import OrderedDict
+import hashlib
+import logging
+import math
+
+from sqlalchemy import event, inspect, or_
+
+from darts import models, settings
+
+from . import adaptive
+from .context import profile_key
+from .exact import MatchSolution
+from .handicap import raw_wins
+
+
+log = logging.getLogger(__name__)
+
+
+PROFILE_COLUMNS = [
+    column.key
+    for column in models.Profile.__table__.columns
+    if column.key.endswith('_pct')
+]
+"Profile columns that affect how the profile throws"
+
+
+class LRUCache:
+
+    """
+    A mapping that holds at most ``size`` items, dropping the least
+    recently used.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        try:
+            value = self._items.pop(key)
+        except KeyError:
+            return default
+        self._items[key] = value
+        return value
+
+    def put(self, key, value):
+        self._items.pop(key, None)
+        self._items[key] = value
+        while len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+
+_local = LRUCache(int(settings.MATCH_CACHE_SIZE))
+
+
+def _hash(value):
+    return hashlib.sha1(repr(value)).hexdigest()
+
+
+def profile_hash(profile):
+    """
+    Return a hash of how a profile throws; see
+    `~darts.sim.context.profile_key`.
+    """
+    return _hash(profile_key(profile))
+
+
+def lookups_hash(score_shot_types, score_points):
+    """
+    Return a hash of the contents of the score lookups, as returned by
+    `~darts.sim.load_lookups`.
+    """
+    return _hash((
+        sorted(
+            (score, int(dart), shot_type.value)
+            for (score, dart), shot_type in score_shot_types.items()
+        ),
+        sorted(
+            (score, int(dart), tuple(points))
+            for (score, dart), points in score_points.items()
+        ),
+    ))
+
+
+def match_format(
+        match_type,
+        legs_to_win=7,
+        total_legs=None,
+        total_sets=5,
+        total=501,
+        ):
+    """
+    Return a tuple describing a match format, ignoring any arguments that
+    don't apply to the match type.
+    """
+    if match_type == 'set_play':
+        return (match_type, total_sets, total)
+    if match_type == 'premier_league':
+        return (match_type, total)
+    if total_legs is not None:
+        legs_to_win = int(math.ceil(total_legs / 2.0))
+    return (match_type, legs_to_win, total_legs, total)
+
+
+class CachedResult:
+
+    """
+    A cached distribution of a match's result.
+
+    :param dict wins: mapping from (A's legs or sets, B's legs or sets) to
+        its probability, before handicaps
+    :param int iterations: number of matches simulated, or None if exact
+    :param float error: confidence interval half-width on A's win
+        probability
+    :param float score_error: largest half-width on any score probability
+    :param tuple leg_win_probs: probabilities of A winning a leg when
+        throwing first and second, if known
+    """
+
+    def __init__(
+            self,
+            wins,
+            iterations=None,
+            error=0.0,
+            score_error=0.0,
+            leg_win_probs=None,
+            ):
+        self.wins = wins
+        self.iterations = iterations
+        self.error = error
+        self.score_error = score_error
+        self.leg_win_probs = leg_win_probs
+
+    @classmethod
+    def from_matches(cls, matches):
+        """
+        Summarise simulated matches.
+
+        :param list matches: :py:class:`~darts.sim.twoplayer.MatchStats`
+        """
+        errors = adaptive.match_errors([match.as_dict() for match in matches])
+        return cls(
+            raw_wins(matches),
+            iterations=len(matches),
+            error=errors['profile_a_win_percent'],
+            score_error=errors['score_probs'],
+        )
+
+    @classmethod
+    def from_solution(cls, solution, leg_win_probs=None):
+        """
+        :param solution: :py:class:`~darts.sim.exact.MatchSolution`
+        """
+        return cls(solution.wins, leg_win_probs=leg_win_probs)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            {
+                tuple(int(x) for x in score.split('-')): prob
+                for score, prob in row.wins.items()
+            },
+            iterations=row.iterations,
+            error=row.error,
+            score_error=row.score_error,
+            leg_win_probs=(
+                tuple(row.leg_win_probs) if row.leg_win_probs else None
+            ),
+        )
+
+    @property
+    def exact(self):
+        return self.iterations is None
+
+    def precise_enough(
+            self,
+            iterations=1000,
+            tolerance=None,
+            score_tolerance=None,
+            ):
+        """
+        Return whether this result is at least as precise as a simulation
+        with the given arguments would be.
+        """
+        if self.exact:
+            return True
+        if tolerance is None:
+            return self.iterations >= iterations
+        return self.error <= tolerance and (
+            score_tolerance is None or self.score_error <= score_tolerance
+        )
+
+    def more_precise_than(self, other):
+        if other.exact:
+            return False
+        return self.exact or self.iterations > other.iterations
+
+    def reversed(self):
+        """
+        Return the same result from player B's point of view.
+        """
+        leg_win_probs = None
+        if self.leg_win_probs is not None:
+            p_first, p_second = self.leg_win_probs
+            leg_win_probs = (1 - p_second, 1 - p_first)
+        return CachedResult(
+            {(b, a): prob for (a, b), prob in self.wins.items()},
+            iterations=self.iterations,
+            error=self.error,
+            score_error=self.score_error,
+            leg_win_probs=leg_win_probs,
+        )
+
+    def win_prob(self):
+        """
+        Return the probability of A winning, counting a draw as half a win.
+        """
+        a_wins = sum(p for (a, b), p in self.wins.items() if a > b)
+        draws = sum(p for (a, b), p in self.wins.items() if a == b)
+        return a_wins + draws / 2
+
+    def stats(self, a_handicap=0, b_handicap=0):
+        """
+        Return the result in the form of
+        :py:meth:`~darts.models.MatchSimulation.create_stats`, with the
+        errors as added by the match simulation job.
+        """
+        stats = MatchSolution(self.wins, a_handicap, b_handicap).stats()
+        stats['errors'] = dict(
+            profile_a_win_percent=self.error,
+            score_probs=self.score_error,
+        )
+        stats['cached'] = True
+        return stats
+
+
+class MatchCache:
+
+    """
+    Look up and store match results for one version of the score lookups.
+
+    `get` and `put` take the same keyword arguments as
+    `~darts.sim.vectorized.simulate_match`. Those that don't change the
+    distribution of the result before handicaps (the number of iterations,
+    the handicaps, the random stream and so on) are ignored.
+
+    Rows are added to the session but not committed.
+
+    :param session: database session
+    :param str lookups_version: as returned by `lookups_hash`
+    """
+
+    def __init__(self, session, lookups_version):
+        self.session = session
+        self.lookups_version = lookups_version
+
+    def key(
+            self,
+            match_type,
+            profile_a,
+            profile_b,
+            a_first=True,
+            legs_to_win=7,
+            total_legs=None,
+            total_sets=5,
+            total=501,
+            **kwargs
+            ):
+        """
+        Return the cache key for a match.
+        """
+        return _hash((
+            profile_hash(profile_a),
+            profile_hash(profile_b),
+            self.lookups_version,
+            bool(a_first),
+            match_format(
+                match_type,
+                legs_to_win,
+                total_legs,
+                total_sets,
+                total,
+            ),
+        ))
+
+    def _get(self, key):
+        result = _local.get(key)
+        if result is None:
+            row = self.session.query(models.CachedMatchResult).get(key)
+            if row is not None:
+                result = CachedResult.from_row(row)
+                _local.put(key, result)
+        return result
+
+    def get(self, match_type, profile_a, profile_b, a_first=True, **kwargs):
+        """
+        Return the cached result of a match, or None.
+
+        A result cached for the same match with the players the other way
+        round is used if there's no result for this way round.
+
+        :rtype: CachedResult
+        """
+        result = self._get(
+            self.key(match_type, profile_a, profile_b, a_first, **kwargs)
+        )
+        if result is None:
+            result = self._get(self.key(
+                match_type,
+                profile_b,
+                profile_a,
+                not a_first,
+                **kwargs
+            ))
+            if result is not None:
+                result = result.reversed()
+        return result
+
+    def put(self, result, match_type, profile_a, profile_b, **kwargs):
+        """
+        Cache the result of a match, unless a more precise result is
+        already cached.
+
+        :param CachedResult result: the result
+        :return: the result now cached
+        """
+        key = self.key(match_type, profile_a, profile_b, **kwargs)
+        cached = self._get(key)
+        if cached is not None and not result.more_precise_than(cached):
+            return cached
+
+        self.session.merge(models.CachedMatchResult(
+            key=key,
+            match_type=match_type,
+            profile_a_hash=profile_hash(profile_a),
+            profile_b_hash=profile_hash(profile_b),
+            lookups_hash=self.lookups_version,
+            iterations=result.iterations,
+            error=result.error,
+            score_error=result.score_error,
+            wins={
+                '{}-{}'.format(*wins): prob
+                for wins, prob in result.wins.items()
+            },
+            leg_win_probs=(
+                list(result.leg_win_probs) if result.leg_win_probs else None
+            ),
+        ))
+        _local.put(key, result)
+        return result
+
+
+class _ProfileValues:
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+
+def _delete_profile_entries(connection, profile):
+    old_hash = profile_hash(profile)
+    table = models.CachedMatchResult.__table__
+    connection.execute(table.delete().where(or_(
+        table.c.profile_a_hash == old_hash,
+        table.c.profile_b_hash == old_hash,
+    )))
+    _local.clear()
+
+
+def previous_profile(profile):
+    """
+    Return an object with a profile's ID and percentages as they were
+    before its pending changes, or None if they haven't changed.
+
+    For use in ``before_update`` listeners, to find what was cached for the
+    profile before the edit.
+    """
+    state = inspect(profile)
+    histories = [state.attrs[column].history for column in PROFILE_COLUMNS]
+    if not any(history.has_changes() for history in histories):
+        return None
+    return _ProfileValues(id=profile.id, **{
+        column: (
+            history.deleted[0] if history.deleted
+            else getattr(profile, column)
+        )
+        for column, history in zip(PROFILE_COLUMNS, histories)
+    })
+
+
+def register_invalidation(delete_profile, delete_all):
+    """
+    Listen for the database changes that make cached results stale.
+
+    Each cache of results derived from profiles and the score lookups
+    registers with this, so that its entries are deleted when they change.
+
+    :param delete_profile: function taking a connection and a profile,
+        called with the profile as it was before an edit, or as it is
+        before it's deleted, to delete its entries
+    :param delete_all: function taking a connection, called to delete
+        every entry when the score lookups change
+    """
+    def invalidate_updated_profile(mapper, connection, target):
+        # Delete the entries for the profile as it was before the edit.
+        previous = previous_profile(target)
+        if previous is not None:
+            delete_profile(connection, previous)
+
+    def invalidate_deleted_profile(mapper, connection, target):
+        delete_profile(connection, target)
+
+    def invalidate_lookups(mapper, connection, target):
+        delete_all(connection)
+
+    event.listen(models.Profile, 'before_update', invalidate_updated_profile)
+    event.listen(models.Profile, 'before_delete', invalidate_deleted_profile)
+    for name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(models.ScoreLookup, name, invalidate_lookups)
+
+
+def _delete_all_entries(connection):
+    connection.execute(models.CachedMatchResult.__table__.delete())
+    _local.clear()
+
+
+register_invalidation(_delete_profile_entries, _delete_all_entries)
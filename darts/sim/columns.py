@@ -0,0 +1,268 @@
+"""
+Compact, array-backed storage for simulated darts.
+
+The legacy representation of a leg's darts is a list of visits, each a
+list of (shot type, result, points) tuples, which costs a few hundred
+bytes per dart in Python and again as nested JSON. A `DartColumns` holds
+the same darts in parallel small-integer arrays, with one entry per dart
+thrown, and only builds the nested lists when asked for.
+"""
+import numpy as np
+
+from darts.models import ShotTypeEnum
+
+from .context import SHOT_TYPE_IDS, SHOT_TYPES
+
+
+SHOT_TYPE_VALUES = [x.value for x in SHOT_TYPES]
+"Values of the shot types, indexed by integer shot type ID"
+
+
+class DartColumns:
+
+    """
+    The darts thrown in a number of legs, stored column by column.
+
+    Darts are sorted by leg, then visit, then dart. A busted visit counts
+    no darts, so it has no entries; it shows up as a gap in ``visits``.
+
+    Indexing with a leg ID, or a slice of leg IDs, returns another
+    `DartColumns` whose arrays are views onto this one's.
+
+    :param shot_types: shot type ID of each dart (uint8)
+    :param results: result of each dart (uint8)
+    :param points: points scored by each dart (uint16)
+    :param visits: index of each dart's visit within its leg (uint16)
+    :param leg_offsets: index of the first dart of each leg, followed by the
+        total number of darts (so the first offset is always 0)
+    """
+
+    def __init__(self, shot_types, results, points, visits, leg_offsets):
+        self.shot_types = np.asarray(shot_types, dtype=np.uint8)
+        self.results = np.asarray(results, dtype=np.uint8)
+        self.points = np.asarray(points, dtype=np.uint16)
+        self.visits = np.asarray(visits, dtype=np.uint16)
+        self.leg_offsets = np.asarray(leg_offsets, dtype=np.int64)
+
+    @classmethod
+    def empty(cls):
+        return cls([], [], [], [], [0])
+
+    @classmethod
+    def from_legs(cls, legs):
+        """
+        Build columns from legs in the legacy representation.
+
+        :param legs: iterable of each leg's ``all_darts``, as returned by
+            :py:meth:`~darts.sim.oneplayer.LegStats.as_dict`. Shot types
+            can be :py:class:`~darts.models.ShotTypeEnum` members or their
+            values.
+        """
+        shot_types, results, points, visits = [], [], [], []
+        leg_offsets = [0]
+        for leg in legs:
+            for visit, darts in enumerate(leg):
+                for shot_type, result, points_scored in darts:
+                    shot_types.append(SHOT_TYPE_IDS[ShotTypeEnum(shot_type)])
+                    results.append(result)
+                    points.append(points_scored)
+                    visits.append(visit)
+            leg_offsets.append(len(points))
+        return cls(shot_types, results, points, visits, leg_offsets)
+
+    @classmethod
+    def from_dict(cls, columns):
+        """
+        Build columns from the output of `as_dict`.
+        """
+        return cls(
+            columns['shot_types'],
+            columns['results'],
+            columns['points'],
+            columns['visits'],
+            columns['leg_offsets'],
+        )
+
+    @classmethod
+    def from_results(cls, results):
+        """
+        Build columns from stored simulation results.
+
+        :param results: either the output of `as_dict`, or a list of leg
+            dicts in the legacy representation, or None.
+        """
+        if results is None:
+            return cls.empty()
+        if isinstance(results, dict):
+            return cls.from_dict(results)
+        return cls.from_legs(leg['all_darts'] for leg in results)
+
+    @classmethod
+    def concatenate(cls, columns):
+        """
+        Join the legs of several `DartColumns` together, in order.
+        """
+        columns = list(columns)
+        if not columns:
+            return cls.empty()
+        starts = np.cumsum([0] + [len(x.points) for x in columns])
+        return cls(
+            np.concatenate([x.shot_types for x in columns]),
+            np.concatenate([x.results for x in columns]),
+            np.concatenate([x.points for x in columns]),
+            np.concatenate([x.visits for x in columns]),
+            np.concatenate([[0]] + [
+                x.leg_offsets[1:] + start
+                for x, start in zip(columns, starts)
+            ]),
+        )
+
+    def __len__(self):
+        return len(self.leg_offsets) - 1
+
+    def __getitem__(self, legs):
+        if isinstance(legs, slice):
+            start, stop, step = legs.indices(len(self))
+            if step != 1:
+                raise ValueError('Leg slices must be contiguous')
+            stop = max(start, stop)
+        else:
+            if legs < 0:
+                legs += len(self)
+            if not 0 <= legs < len(self):
+                raise IndexError(legs)
+            start, stop = legs, legs + 1
+        first, last = self.leg_offsets[start], self.leg_offsets[stop]
+        return DartColumns(
+            self.shot_types[first:last],
+            self.results[first:last],
+            self.points[first:last],
+            self.visits[first:last],
+            self.leg_offsets[start:stop + 1] - first,
+        )
+
+    @property
+    def nbytes(self):
+        return sum(x.nbytes for x in (
+            self.shot_types,
+            self.results,
+            self.points,
+            self.visits,
+            self.leg_offsets,
+        ))
+
+    @property
+    def leg_ids(self):
+        """
+        The leg of each dart.
+        """
+        return np.repeat(np.arange(len(self)), np.diff(self.leg_offsets))
+
+    @property
+    def n_visits(self):
+        """
+        The number of visits in each leg, including busts.
+        """
+        n_visits = np.zeros(len(self), dtype=np.int64)
+        thrown = np.diff(self.leg_offsets) > 0
+        last_darts = self.leg_offsets[1:][thrown] - 1
+        n_visits[thrown] = self.visits[last_darts].astype(np.int64) + 1
+        return n_visits
+
+    def visit_offsets(self):
+        """
+        Return the index of the first visit of each leg, counting visits
+        across all legs, followed by the total number of visits.
+        """
+        return np.concatenate(([0], np.cumsum(self.n_visits)))
+
+    def _global_visits(self, visit_offsets):
+        return visit_offsets[self.leg_ids] + self.visits
+
+    def three_dart_totals(self):
+        """
+        Return the points scored in every visit, with busts scoring 0.
+
+        Visits are in the order of `visit_offsets`.
+        """
+        visit_offsets = self.visit_offsets()
+        return np.bincount(
+            self._global_visits(visit_offsets),
+            weights=self.points,
+            minlength=visit_offsets[-1],
+        ).astype(int)
+
+    def dart_numbers(self):
+        """
+        Return the dart ID (1, 2, 3) of each dart within its visit.
+        """
+        index = np.arange(len(self.points))
+        leg_ids = self.leg_ids
+        new_visit = np.ones(len(self.points), dtype=bool)
+        new_visit[1:] = (
+            (self.visits[1:] != self.visits[:-1]) |
+            (leg_ids[1:] != leg_ids[:-1])
+        )
+        return index - np.maximum.accumulate(index * new_visit) + 1
+
+    def start_scores(self, total=501):
+        """
+        Return the score before each dart was thrown.
+
+        Busted visits aren't stored, so they don't affect the scores.
+        """
+        thrown = np.concatenate(([0], np.cumsum(self.points, dtype=np.int64)))
+        leg_starts = np.repeat(
+            thrown[self.leg_offsets[:-1]],
+            np.diff(self.leg_offsets),
+        )
+        # Points thrown in the leg before each dart
+        return total - (thrown[:-1] - leg_starts)
+
+    def to_lists(self):
+        """
+        Convert to the legacy representation.
+
+        Returns a list with each leg's ``all_darts``: a list of visits,
+        each a list of (shot type value, result, points) tuples.
+        """
+        rows = list(zip(
+            [SHOT_TYPE_VALUES[x] for x in self.shot_types.tolist()],
+            self.results.tolist(),
+            self.points.tolist(),
+        ))
+        visit_offsets = self.visit_offsets()
+        dart_offsets = np.concatenate(([0], np.cumsum(np.bincount(
+            self._global_visits(visit_offsets),
+            minlength=visit_offsets[-1],
+        )))).tolist()
+        return [
+            [
+                rows[dart_offsets[visit]:dart_offsets[visit + 1]]
+                for visit in xrange(start, end)
+            ]
+            for start, end in zip(
+                visit_offsets[:-1].tolist(),
+                visit_offsets[1:].tolist(),
+            )
+        ]
+
+    def as_dict(self):
+        """
+        Return the columns as lists, for storing as JSON.
+
+        Shot types are stored as their integer IDs.
+        """
+        return dict(
+            shot_types=self.shot_types.tolist(),
+            results=self.results.tolist(),
+            points=self.points.tolist(),
+            visits=self.visits.tolist(),
+            leg_offsets=self.leg_offsets.tolist(),
+        )
+
+    def __repr__(self):
+        return '<DartColumns(legs=%s, darts=%s)>' % (
+            len(self),
+            len(self.points),
+        )
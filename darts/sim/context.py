@@ -0,0 +1,245 @@
+"""
+Simulation inputs compiled into plain arrays.
+
+The lookups returned by `~darts.sim.load_lookups` and the percentages on a
+:py:class:`~darts.models.Profile` are convenient to store but slow to use
+once per dart: every lookup hashes a tuple, every result compares against
+a Decimal and every shot builds an Enum. A `CompiledSimContext` converts
+them once per job into dense arrays indexed by score, dart ID, shot type ID
+and result.
+"""
+import copy
+
+import numpy as np
+
+from darts.models import ShotResultEnum, ShotTypeEnum
+
+
+DEFAULT_SHOT_TYPE = ShotTypeEnum.Treble
+"Shot type to use if score doesn't appear in lookup"
+
+DEFAULT_POINTS = (60, 20, 6)
+"Points tuple to use if score doesn't appear in lookup"
+
+SHOT_TYPES = list(ShotTypeEnum)
+"Shot types, in the order used for integer shot type IDs"
+
+SHOT_TYPE_IDS = {shot_type: i for i, shot_type in enumerate(SHOT_TYPES)}
+"Mapping from shot type to integer shot type ID"
+
+SHOT_RESULTS = list(ShotResultEnum)
+"Shot results, indexed by their integer value"
+
+BIG_MISS_POINTS = [1, 3, 5, 15]
+"Points scored by a big miss whose lookup value is 6"
+
+BIG_MISS_CHOICES = np.array(BIG_MISS_POINTS, dtype=np.int16)
+"`BIG_MISS_POINTS` as an array, for the vectorized simulators"
+
+
+def lookup_arrays(score_shot_types, score_points, max_score=501):
+    """
+    Convert the lookup dicts into dense arrays indexed by score and dart ID.
+
+    Returns a 2-tuple containing:
+
+    - an integer array of shape (max_score + 1, 4) holding shot type IDs
+    - an integer array of shape (max_score + 1, 4, 3) holding the
+        (hit score, miss score, big miss score) of each shot
+
+    Column 0 of the dart axis is unused so that dart IDs (1, 2, 3) can be
+    used as indices directly.
+
+    :param dict score_shot_types: mapping from (score, dart_number) to
+        shot types, as returned by `~load_lookups`
+    :param dict score_points: mapping from (score, dart ID) to score tuple,
+        as returned by `load_lookups`.
+    :param int max_score: highest score that can be looked up.
+    """
+    shot_types = np.empty((max_score + 1, 4), dtype=np.int8)
+    shot_types[:] = SHOT_TYPE_IDS[DEFAULT_SHOT_TYPE]
+    points = np.empty((max_score + 1, 4, 3), dtype=np.int16)
+    points[:] = DEFAULT_POINTS
+
+    for (score, dart), shot_type in score_shot_types.items():
+        if score <= max_score:
+            shot_types[score, int(dart)] = SHOT_TYPE_IDS[shot_type]
+    for (score, dart), point_tuple in score_points.items():
+        if score <= max_score:
+            # Missing points are only used for results which can't happen
+            # for that shot type (e.g. missing a single).
+            points[score, int(dart)] = [p or 0 for p in point_tuple]
+
+    return shot_types, points
+
+
+def profile_thresholds(profile):
+    """
+    Extract the cumulative result thresholds of a profile.
+
+    Returns a float array of shape (number of shot types, 2). A shot of type
+    ``t`` with a result of ``r = 100 * random()`` is a hit if
+    ``r <= thresholds[t, 0]``, a miss if ``r <= thresholds[t, 1]`` and
+    a big miss otherwise, matching `~darts.sim.oneplayer.get_result`.
+
+    :param profile: shot profile
+    :type profile: :py:class:`~darts.models.Profile`
+    """
+    thresholds = np.empty((len(SHOT_TYPES), 2))
+    thresholds[SHOT_TYPE_IDS[ShotTypeEnum.Treble]] = (
+        float(profile.treble_hit_pct),
+        100 - float(profile.treble_big_miss_pct),
+    )
+    thresholds[SHOT_TYPE_IDS[ShotTypeEnum.Double]] = (
+        float(profile.double_hit_pct),
+        100 - float(profile.double_miss_outside_pct),
+    )
+    thresholds[SHOT_TYPE_IDS[ShotTypeEnum.Single]] = (100, 100)
+    thresholds[SHOT_TYPE_IDS[ShotTypeEnum.Bull]] = (
+        float(profile.bullseye_hit_pct),
+        100,
+    )
+    thresholds[SHOT_TYPE_IDS[ShotTypeEnum.OuterBull]] = (
+        float(profile.outer_bull_hit_pct),
+        100,
+    )
+    return thresholds
+
+
+def profile_key(profile):
+    """
+    Return a hashable key identifying how a profile throws.
+
+    Two profiles (or compiled contexts) with the same key produce the same
+    simulations, whatever their names or IDs.
+
+    :param profile: shot profile or compiled context
+    :type profile: :py:class:`~darts.models.Profile` or `CompiledSimContext`
+    """
+    if isinstance(profile, CompiledSimContext):
+        thresholds = profile.thresholds
+    else:
+        thresholds = profile_thresholds(profile)
+    return tuple(thresholds.ravel().tolist())
+
+
+class CompiledSimContext:
+
+    """
+    Everything needed to simulate darts thrown by one profile.
+
+    Holds the lookups as dense arrays (see `lookup_arrays`) and the
+    profile's result thresholds as floats (see `profile_thresholds`), along
+    with nested list copies of both for the pure Python simulators, where
+    indexing a list is much cheaper than indexing a numpy array.
+
+    Build one per job and pass it to any of the simulators in place of
+    the profile; the lookup arguments can then be omitted.
+
+    :param profile: shot profile
+    :type profile: :py:class:`~darts.models.Profile`
+    :param dict score_shot_types: mapping from (score, dart_number) to
+        shot types, as returned by `~load_lookups`
+    :param dict score_points: mapping from (score, dart ID) to score tuple,
+        as returned by `load_lookups`.
+    :param int max_score: highest score that can be looked up.
+    """
+
+    def __init__(
+            self,
+            profile,
+            score_shot_types,
+            score_points,
+            max_score=501,
+            ):
+        self.max_score = max_score
+        self.shot_types, self.points = lookup_arrays(
+            score_shot_types,
+            score_points,
+            max_score=max_score,
+        )
+        self.shot_type_table = self.shot_types.tolist()
+        self.points_table = self.points.tolist()
+        self._set_profile(profile)
+
+    def _set_profile(self, profile):
+        self.profile = profile
+        self.thresholds = profile_thresholds(profile)
+        self.threshold_table = [tuple(x) for x in self.thresholds.tolist()]
+
+    def for_profile(self, profile):
+        """
+        Return a context for another profile, sharing this one's lookups.
+
+        :param profile: shot profile
+        :type profile: :py:class:`~darts.models.Profile`
+        """
+        context = copy.copy(self)
+        context._set_profile(profile)
+        return context
+
+    def throw_dart(self, current_score, dart_number, random_state):
+        """
+        Simulate the throwing of a dart at a particular score.
+
+        The equivalent of `~darts.sim.oneplayer.throw_dart` using only list
+        indexing and float comparisons.
+
+        :param int current_score: current score (before throwing the dart)
+        :param int dart_number: dart ID (1, 2, 3)
+        :param random_state: random stream to draw from
+        :type random_state: :py:class:`~darts.sim.streams.RandomStream`
+
+        :return: shot type ID, shot result and points scored
+        :rtype: Tuple[int, int, int]
+        """
+        shot_type = self.shot_type_table[current_score][dart_number]
+        hit, miss = self.threshold_table[shot_type]
+        result = 100 * random_state.random()
+        result = 0 if result <= hit else 1 if result <= miss else 2
+        points = self.points_table[current_score][dart_number][result]
+        if result == 2 and points == 6:
+            points = random_state.choice(BIG_MISS_POINTS)
+        return shot_type, result, points
+
+    def __repr__(self):
+        return '<CompiledSimContext(profile=%r)>' % (self.profile,)
+
+
+def compile_context(
+        profile,
+        score_shot_types=None,
+        score_points=None,
+        max_score=501,
+        ):
+    """
+    Return a compiled context for a profile.
+
+    If ``profile`` is already a `CompiledSimContext` it is returned as is,
+    otherwise one is built from it and the lookups.
+
+    :param profile: shot profile
+    :type profile: :py:class:`~darts.models.Profile` or `CompiledSimContext`
+    :param dict score_shot_types: mapping from (score, dart_number) to
+        shot types, as returned by `~load_lookups`
+    :param dict score_points: mapping from (score, dart ID) to score tuple,
+        as returned by `load_lookups`.
+    :param int max_score: highest score that can be looked up.
+    :raises ValueError: if ``profile`` is a context compiled for a lower
+        ``max_score``, as it no longer has the lookups to recompile from.
+    """
+    if isinstance(profile, CompiledSimContext):
+        if profile.shot_types.shape[0] <= max_score:
+            raise ValueError(
+                'Context compiled for scores up to {}, not {}'.format(
+                    profile.shot_types.shape[0] - 1,
+                    max_score,
+                )
+            )
+        return profile
+    return CompiledSimContext(
+        profile,
+        score_shot_types,
+        score_points,
+        max_score=max_score,
+    )
@@ -0,0 +1,739 @@
+"""
+Exact solutions of legs and matches.
+
+A leg is a Markov chain over the score at the start of each visit: a visit
+from a given score ends on a lower score (or the same score, after a bust)
+with probabilities determined entirely by the profile and the lookups. The
+distribution of darts and visits needed to finish a leg, and the expected
+number of 180s, can therefore be computed exactly by dynamic programming
+over the scores, without any simulation.
+
+Match formats are deterministic functions of the leg outcomes, and the
+legs themselves only depend on how many visits each player needs, so the
+full distribution of a match's final score follows from the two players'
+visits-per-leg distributions by a second, much smaller, dynamic program.
+
+These numbers are noise-free, so they are also the reference the Monte
+Carlo simulators in `~darts.sim.oneplayer`, `~darts.sim.twoplayer` and
+`~darts.sim.vectorized` should converge to.
+"""
+from collections import defaultdict
+import math
+
+import numpy as np
+
+from .context import BIG_MISS_POINTS, compile_context
+
+
+MAX_DARTS = 300
+"Default number of darts tracked by the darts-per-leg distribution"
+
+MAX_VISITS = 150
+"Default number of visits tracked by the visits-per-leg distribution"
+
+
+def dart_outcomes(context):
+    """
+    Tabulate the possible outcomes of a single dart.
+
+    Returns a 2-tuple of arrays, each of shape (max_score + 1, 4, 6),
+    indexed by score, dart ID and outcome, containing the points scored by
+    each outcome and its probability. The outcomes are a hit, a miss, and
+    either a big miss or the four random big misses chosen when the big
+    miss lookup value is 6. Unused outcomes have zero probability.
+
+    :param context: compiled context, as returned by
+        `~darts.sim.context.compile_context`
+    """
+    return shot_outcomes(
+        context.shot_types,
+        context.points,
+        context.thresholds,
+    )
+
+
+def shot_outcomes(shot_types, points, thresholds):
+    """
+    Tabulate the possible outcomes of any array of shots; see
+    `dart_outcomes`.
+
+    :param shot_types: integer array of shot type IDs
+    :param points: integer array of (hit, miss, big miss) points, with one
+        more axis than ``shot_types``
+    :param thresholds: result thresholds, as returned by
+        `~darts.sim.context.profile_thresholds`
+    :return: the points and probabilities of each outcome, with a last
+        axis of length 6.
+    """
+    hit, miss = np.clip(thresholds / 100.0, 0, 1).T
+    hit, miss = hit[shot_types], np.maximum(miss, hit)[shot_types]
+
+    outcome_points = np.zeros(shot_types.shape + (6,), dtype=np.int32)
+    outcome_probs = np.zeros(shot_types.shape + (6,))
+    outcome_points[..., :3] = points
+    outcome_probs[..., 0] = hit
+    outcome_probs[..., 1] = miss - hit
+    outcome_probs[..., 2] = 1 - miss
+
+    random_big_miss = points[..., 2] == 6
+    big_miss_prob = outcome_probs[..., 2] * random_big_miss
+    outcome_probs[..., 2] -= big_miss_prob
+    for i, big_miss_points in enumerate(BIG_MISS_POINTS):
+        outcome_points[..., 2 + i][random_big_miss] = big_miss_points
+        outcome_probs[..., 2 + i] += big_miss_prob / len(BIG_MISS_POINTS)
+
+    return outcome_points, outcome_probs
+
+
+def _combine(keys, probs, shape):
+    """
+    Sum the probabilities of duplicate keys.
+
+    Returns the unique (unravelled) keys and their total probabilities.
+    """
+    totals = np.bincount(keys, weights=probs, minlength=np.prod(shape))
+    keys = np.flatnonzero(totals)
+    return np.unravel_index(keys, shape) + (totals[keys],)
+
+
+def visit_transitions(context, total=501):
+    """
+    Compute the outcome distribution of a visit from every score.
+
+    Returns a 4-tuple of equal-length arrays describing every possible
+    visit outcome:
+
+    - the score at the start of the visit
+    - the score at the end of the visit
+    - the number of darts counted for the visit (busts count none, as in
+        `~darts.sim.oneplayer.throw_three_darts`)
+    - the probability of the outcome, given the start score
+
+    :param context: compiled context, as returned by
+        `~darts.sim.context.compile_context`
+    :param int total: highest start score to compute transitions for.
+    """
+    outcome_points, outcome_probs = dart_outcomes(context)
+    n_outcomes = outcome_probs.shape[-1]
+    shape = (total + 1, total + 1, 4)
+
+    start = np.arange(2, total + 1)
+    score = start.copy()
+    prob = np.ones(start.size)
+
+    finished = []
+    for dart_id in (1, 2, 3):
+        start = np.repeat(start, n_outcomes)
+        new_score = np.repeat(score, n_outcomes)
+        new_score -= outcome_points[score, dart_id].ravel()
+        prob = (prob[:, np.newaxis] * outcome_probs[score, dart_id]).ravel()
+
+        checkout = (new_score == 0) & (prob > 0)
+        bust = ((new_score == 1) | (new_score < 0)) & (prob > 0)
+        finished.append((
+            np.ravel_multi_index(
+                (start[checkout], 0, dart_id),
+                shape,
+            ),
+            prob[checkout],
+        ))
+        finished.append((
+            np.ravel_multi_index((start[bust], start[bust], 0), shape),
+            prob[bust],
+        ))
+
+        playing = (new_score > 1) & (prob > 0)
+        if dart_id == 3:
+            finished.append((
+                np.ravel_multi_index(
+                    (start[playing], new_score[playing], 3),
+                    shape,
+                ),
+                prob[playing],
+            ))
+        else:
+            start, score, prob = _combine(
+                start[playing] * (total + 1) + new_score[playing],
+                prob[playing],
+                (total + 1, total + 1),
+            )
+
+    keys, probs = [np.concatenate(x) for x in zip(*finished)]
+    return _combine(keys, probs, shape)
+
+
+def _self_loop(rest, loop_probs):
+    """
+    Solve ``f[n] = rest[n] + sum_k loop_probs[k] * f[n - k]`` for ``f``.
+
+    ``loop_probs[0]`` must be less than 1.
+    """
+    f = rest / (1 - loop_probs[0])
+    if not loop_probs[1:].any():
+        return f
+
+    # Convolve with the impulse response of the loop.
+    coefs = loop_probs[1:] / (1 - loop_probs[0])
+    if coefs.size == 1:
+        response = coefs[0] ** np.arange(f.size)
+    else:
+        response = np.zeros(f.size)
+        response[0] = 1
+        for n in xrange(1, f.size):
+            lags = min(n, coefs.size)
+            response[n] = coefs[:lags].dot(response[n - lags:n][::-1])
+    return np.convolve(f, response)[:f.size]
+
+
+class LegSolution:
+
+    """
+    The exact solution of a leg for every starting score.
+
+    :ivar darts: array of shape (total + 1, max_darts + 1); ``darts[s, n]``
+        is the probability of finishing from ``s`` with ``n`` darts
+        counted.
+    :ivar visits: array of shape (total + 1, max_visits + 1);
+        ``visits[s, n]`` is the probability of finishing from ``s`` in
+        exactly ``n`` visits, including busted visits.
+    :ivar mean_180s: expected number of 180s when finishing from each score.
+    :ivar var_180s: variance of the number of 180s when finishing from each
+        score.
+    """
+
+    def __init__(self, total, darts, visits, mean_180s, var_180s):
+        self.total = total
+        self.darts = darts
+        self.visits = visits
+        self.mean_180s = mean_180s
+        self.var_180s = var_180s
+
+    @property
+    def darts_probs(self):
+        "Distribution of darts counted in a leg from `total`"
+        return self.darts[self.total]
+
+    @property
+    def visits_probs(self):
+        "Distribution of visits taken to finish a leg from `total`"
+        return self.visits[self.total]
+
+    @property
+    def truncated_prob(self):
+        "Probability of a leg needing more darts than are tracked"
+        return max(0.0, 1 - self.darts_probs.sum())
+
+    @property
+    def expected_darts(self):
+        n = np.arange(self.darts_probs.size)
+        return float((n * self.darts_probs).sum())
+
+    def _three_dart_averages(self):
+        n = np.arange(1, self.darts_probs.size)
+        return 3.0 * self.total / n, self.darts_probs[1:]
+
+    @property
+    def three_dart_average(self):
+        """
+        Expected three dart average of a leg.
+
+        This is the mean of per-leg averages, as reported by
+        :py:meth:`~darts.models.PlayerSimulation.create_stats`.
+        """
+        averages, probs = self._three_dart_averages()
+        return float((averages * probs).sum() / probs.sum())
+
+    @property
+    def three_dart_std_dev(self):
+        averages, probs = self._three_dart_averages()
+        mean = self.three_dart_average
+        return float(np.sqrt(
+            ((averages - mean) ** 2 * probs).sum() / probs.sum()
+        ))
+
+    @property
+    def avg_180s(self):
+        return float(self.mean_180s[self.total])
+
+    @property
+    def std_180s(self):
+        return float(np.sqrt(self.var_180s[self.total]))
+
+    def as_dict(self):
+        return dict(
+            three_dart_average=self.three_dart_average,
+            three_dart_std_dev=self.three_dart_std_dev,
+            avg_180s=self.avg_180s,
+            std_180s=self.std_180s,
+            expected_darts=self.expected_darts,
+            darts_probs=self.darts_probs.tolist(),
+        )
+
+
+def solve_leg(
+        profile,
+        score_shot_types=None,
+        score_points=None,
+        total=501,
+        max_darts=MAX_DARTS,
+        max_visits=MAX_VISITS,
+        ):
+    """
+    Solve a leg of darts exactly.
+
+    Works up from the lowest scores, so that when solving a score every
+    score a visit can reach has already been solved. Busts (and visits
+    scoring nothing) loop back to the same score and are handled by
+    `_self_loop`.
+
+    :param profile: shot profile, or a compiled context in which case the
+        lookups are ignored
+    :type profile: :py:class:`~darts.models.Profile` or
+        :py:class:`~darts.sim.context.CompiledSimContext`
+    :param dict score_shot_types: mapping from (score, dart_number) to
+        shot types, as returned by `~load_lookups`
+    :param dict score_points: mapping from (score, dart ID) to score tuple,
+        as returned by `load_lookups`.
+    :param int total: Total required to win a leg of darts (default: 501).
+    :param int max_darts: number of darts to track in the darts-per-leg
+        distribution.
+    :param int max_visits: number of visits to track in the visits-per-leg
+        distribution.
+
+    :rtype: LegSolution
+    """
+    context = compile_context(
+        profile,
+        score_shot_types,
+        score_points,
+        max_score=total,
+    )
+    start, end, n_darts, probs = visit_transitions(context, total=total)
+    is_180 = ((start - end) == 180).astype(float)
+    bounds = np.searchsorted(start, np.arange(total + 2))
+
+    darts = np.zeros((total + 1, max_darts + 1))
+    visits = np.zeros((total + 1, max_visits + 1))
+    mean_180s = np.zeros(total + 1)
+    var_180s = np.zeros(total + 1)
+    second_180s = np.zeros(total + 1)
+    darts[0, 0] = 1
+    visits[0, 0] = 1
+
+    for score in xrange(2, total + 1):
+        a, b = bounds[score], bounds[score + 1]
+        e, k, p, y = end[a:b], n_darts[a:b], probs[a:b], is_180[a:b]
+        loop = e == score
+        e, k, p, y = e[~loop], k[~loop], p[~loop], y[~loop]
+        loop_darts = np.bincount(n_darts[a:b][loop], probs[a:b][loop], 4)
+        loop_prob = loop_darts.sum()
+
+        rest = np.zeros(max_darts + 1)
+        for n in (1, 2, 3):
+            rest[n:] += p[k == n].dot(darts[e[k == n], :-n])
+        darts[score] = _self_loop(rest, loop_darts)
+
+        rest = np.zeros(max_visits + 1)
+        rest[1:] = p.dot(visits[e, :-1])
+        visits[score] = _self_loop(rest, np.array([0, loop_prob]))
+
+        mean_180s[score] = (p * (y + mean_180s[e])).sum() / (1 - loop_prob)
+        second_180s[score] = (
+            (p * (y + 2 * y * mean_180s[e] + second_180s[e])).sum() /
+            (1 - loop_prob)
+        )
+        var_180s[score] = second_180s[score] - mean_180s[score] ** 2
+
+    return LegSolution(total, darts, visits, mean_180s, var_180s)
+
+
+def leg_means(
+        profile,
+        score_shot_types=None,
+        score_points=None,
+        total=501,
+        ):
+    """
+    Return the expected darts counted and the expected 180s to finish a leg
+    from each score.
+
+    These are the means of `solve_leg` without the distributions, which
+    makes this several times faster where only the means are needed.
+
+    Takes the same arguments as `solve_leg`.
+    """
+    context = compile_context(
+        profile,
+        score_shot_types,
+        score_points,
+        max_score=total,
+    )
+    start, end, n_darts, probs = visit_transitions(context, total=total)
+    is_180 = ((start - end) == 180).astype(float)
+    bounds = np.searchsorted(start, np.arange(total + 2))
+
+    mean_darts = np.zeros(total + 1)
+    mean_180s = np.zeros(total + 1)
+    for score in xrange(2, total + 1):
+        a, b = bounds[score], bounds[score + 1]
+        e, k, p, y = end[a:b], n_darts[a:b], probs[a:b], is_180[a:b]
+        loop = e == score
+        loop_prob = p[loop].sum()
+        mean_darts[score] = (
+            (p * k).sum() + p[~loop].dot(mean_darts[e[~loop]])
+        ) / (1 - loop_prob)
+        mean_180s[score] = (
+            (p * y).sum() + p[~loop].dot(mean_180s[e[~loop]])
+        ) / (1 - loop_prob)
+
+    return mean_darts, mean_180s
+
+
+def _visit_checkout_attempts(context, total=501):
+    """
+    Return the expected number of darts thrown at a finish in a visit from
+    each score: darts whose hit would score exactly what's left.
+    """
+    outcome_points, outcome_probs = dart_outcomes(context)
+    hit_points = context.points[..., 0]
+    attempts = np.zeros(total + 1)
+
+    start = np.arange(2, total + 1)
+    score = start.copy()
+    prob = np.ones(start.size)
+    for dart_id in (1, 2, 3):
+        at_finish = hit_points[score, dart_id] == score
+        attempts += np.bincount(
+            start[at_finish],
+            prob[at_finish],
+            minlength=total + 1,
+        )
+        if dart_id == 3:
+            break
+
+        n_outcomes = outcome_probs.shape[-1]
+        new_score = np.repeat(score, n_outcomes)
+        new_score -= outcome_points[score, dart_id].ravel()
+        prob = (prob[:, np.newaxis] * outcome_probs[score, dart_id]).ravel()
+        start = np.repeat(start, n_outcomes)
+        playing = (new_score > 1) & (prob > 0)
+        start, score, prob = _combine(
+            start[playing] * (total + 1) + new_score[playing],
+            prob[playing],
+            (total + 1, total + 1),
+        )
+
+    return attempts
+
+
+def checkout_attempts(
+        profile,
+        score_shot_types=None,
+        score_points=None,
+        total=501,
+        ):
+    """
+    Return the expected number of darts thrown at a finish (checkout
+    chances) to finish a leg from each score.
+
+    Every leg ends with one successful chance, so the checkout percentage
+    of a leg from ``total`` is ``100 / checkout_attempts(...)[total]``.
+
+    Takes the same arguments as `solve_leg`.
+    """
+    context = compile_context(
+        profile,
+        score_shot_types,
+        score_points,
+        max_score=total,
+    )
+    start, end, _, probs = visit_transitions(context, total=total)
+    per_visit = _visit_checkout_attempts(context, total=total)
+    bounds = np.searchsorted(start, np.arange(total + 2))
+
+    attempts = np.zeros(total + 1)
+    for score in xrange(2, total + 1):
+        a, b = bounds[score], bounds[score + 1]
+        e, p = end[a:b], probs[a:b]
+        loop = e == score
+        attempts[score] = (
+            per_visit[score] + p[~loop].dot(attempts[e[~loop]])
+        ) / (1 - p[loop].sum())
+
+    return attempts
+
+
+LEGS_PER_SET = 3
+"Legs required to win a set in set play"
+
+
+def leg_win_probs(visits_a, visits_b):
+    """
+    Compute the probability of player A winning a leg.
+
+    Returns a 2-tuple containing the probability of A winning when A
+    throws first, and when B throws first.
+
+    :param visits_a: player A's visits-per-leg distribution, e.g.
+        `LegSolution.visits_probs`
+    :param visits_b: player B's visits-per-leg distribution
+    """
+    visits_a = visits_a / visits_a.sum()
+    visits_b = visits_b / visits_b.sum()
+    # P(B needs at least / more than n visits)
+    b_at_least = visits_b[::-1].cumsum()[::-1]
+    b_more_than = b_at_least - visits_b
+    return (
+        float(visits_a.dot(b_at_least)),
+        float(visits_a.dot(b_more_than)),
+    )
+
+
+def match_play_probs(
+        p_first,
+        p_second,
+        a_first=True,
+        legs_to_win=7,
+        total_legs=None,
+        legs=(0, 0),
+        ):
+    """
+    Compute the distribution of legs won in a match play match.
+
+    The first thrower alternates between legs, as in
+    `~darts.sim.twoplayer.simulate_match_play`.
+
+    Returns a dict mapping (A's legs, B's legs) to its probability.
+
+    :param float p_first: probability of A winning a leg when throwing
+        first
+    :param float p_second: probability of A winning a leg when throwing
+        second
+    :param bool a_first: whether A throws first in the first leg.
+    :param int legs_to_win: legs required to win the match.
+    :param int total_legs: maximum number of legs; the match is drawn if
+        neither player has won after this many.
+    :param tuple legs: legs A and B have already won; the match carries
+        on from there, with ``a_first`` still giving who threw first in
+        the first leg.
+    """
+    def over(legs):
+        return (
+            max(legs) >= legs_to_win or
+            total_legs is not None and sum(legs) >= total_legs
+        )
+
+    legs = tuple(legs)
+    if over(legs):
+        return {legs: 1.0}
+    states = {legs: 1.0}
+    final = defaultdict(float)
+    while states:
+        next_states = defaultdict(float)
+        for (a_legs, b_legs), prob in states.items():
+            a_throws_first = ((a_legs + b_legs) % 2 == 0) == a_first
+            p_a = p_first if a_throws_first else p_second
+            for next_legs, p in (
+                    ((a_legs + 1, b_legs), prob * p_a),
+                    ((a_legs, b_legs + 1), prob * (1 - p_a)),
+                    ):
+                (final if over(next_legs) else next_states)[next_legs] += p
+        states = next_states
+    return dict(final)
+
+
+def set_play_probs(p_first, p_second, a_first=True, total_sets=5):
+    """
+    Compute the distribution of sets won in a set play match.
+
+    Each set is first to `LEGS_PER_SET` legs, with the first thrower
+    alternating between legs within a set and between the first legs of
+    consecutive sets, as in `~darts.sim.twoplayer.simulate_set_play`.
+
+    Returns a dict mapping (A's sets, B's sets) to its probability.
+
+    :param float p_first: probability of A winning a leg when throwing
+        first
+    :param float p_second: probability of A winning a leg when throwing
+        second
+    :param bool a_first: whether A throws first in the first set.
+    :param int total_sets: sets required to win the match.
+    """
+    set_first, set_second = [
+        sum(
+            prob
+            for (a_legs, _), prob in match_play_probs(
+                p_first,
+                p_second,
+                a_first=a_starts,
+                legs_to_win=LEGS_PER_SET,
+            ).items()
+            if a_legs == LEGS_PER_SET
+        )
+        for a_starts in (True, False)
+    ]
+    return match_play_probs(
+        set_first,
+        set_second,
+        a_first=a_first,
+        legs_to_win=total_sets,
+    )
+
+
+class MatchSolution:
+
+    """
+    The exact distribution of a match's result.
+
+    :ivar wins: dict mapping (A's legs or sets, B's legs or sets) to its
+        probability, before handicaps.
+    """
+
+    def __init__(self, wins, a_handicap=0, b_handicap=0):
+        self.wins = wins
+        self.a_handicap = a_handicap
+        self.b_handicap = b_handicap
+
+    def score_probs(self, a_handicap=None, b_handicap=None):
+        """
+        Return a dict mapping final (A, B) scores to their probability.
+
+        The handicaps default to those the solution was created with.
+        """
+        if a_handicap is None:
+            a_handicap = self.a_handicap
+        if b_handicap is None:
+            b_handicap = self.b_handicap
+        probs = defaultdict(float)
+        for (a_wins, b_wins), prob in self.wins.items():
+            probs[(a_wins + a_handicap, b_wins + b_handicap)] += prob
+        return dict(probs)
+
+    def stats(self, a_handicap=None, b_handicap=None):
+        """
+        Return the result in the form of
+        :py:meth:`~darts.models.MatchSimulation.create_stats`.
+        """
+        score_probs = self.score_probs(a_handicap, b_handicap)
+        return dict(
+            profile_a_win_percent=sum(
+                p for (a, b), p in score_probs.items() if a > b
+            ),
+            profile_b_win_percent=sum(
+                p for (a, b), p in score_probs.items() if b > a
+            ),
+            score_probs={
+                '-'.join(str(x) for x in k): v
+                for k, v in score_probs.items()
+            },
+        )
+
+
+def match_wins(
+        match_type,
+        p_first,
+        p_second,
+        a_first=True,
+        legs_to_win=7,
+        total_legs=None,
+        total_sets=5,
+        alternate_first=True,
+        ):
+    """
+    Compute the distribution of legs (or sets) won in a match, from the
+    probabilities of player A winning a leg.
+
+    Returns a dict mapping (A's legs or sets, B's legs or sets) to its
+    probability. See `solve_match` for the arguments.
+
+    :param float p_first: probability of A winning a leg when throwing
+        first
+    :param float p_second: probability of A winning a leg when throwing
+        second
+    """
+    if match_type == 'set_play':
+        def solve(a_first):
+            return set_play_probs(
+                p_first,
+                p_second,
+                a_first=a_first,
+                total_sets=total_sets,
+            )
+    else:
+        if match_type == 'premier_league':
+            # Always 12 legs in a Premier League match.
+            legs_to_win, total_legs = 7, 12
+        elif total_legs is not None:
+            legs_to_win = int(math.ceil(total_legs / 2.0))
+
+        def solve(a_first):
+            return match_play_probs(
+                p_first,
+                p_second,
+                a_first=a_first,
+                legs_to_win=legs_to_win,
+                total_legs=total_legs,
+            )
+
+    if not alternate_first:
+        return solve(a_first)
+    wins = defaultdict(float)
+    for starts in (a_first, not a_first):
+        for k, prob in solve(starts).items():
+            wins[k] += prob / 2
+    return dict(wins)
+
+
+def solve_match(
+        match_type,
+        profile_a,
+        profile_b,
+        score_shot_types=None,
+        score_points=None,
+        a_first=True,
+        a_handicap=0,
+        b_handicap=0,
+        legs_to_win=7,
+        total_legs=None,
+        total_sets=5,
+        total=501,
+        alternate_first=True,
+        ):
+    """
+    Solve a match between two profiles exactly.
+
+    Takes the same arguments as `~darts.sim.vectorized.simulate_match`,
+    without the iterations. The simulators alternate the player throwing
+    first between iterations, so by default the result is an even mix of
+    A and B throwing first; pass ``alternate_first=False`` to solve a single
+    match in which A throws first if ``a_first``.
+
+    The profiles may also be `LegSolution` objects, as returned by
+    `solve_leg`, to avoid solving the same profile repeatedly.
+
+    :rtype: MatchSolution
+    """
+    solutions = [
+        profile if isinstance(profile, LegSolution) else solve_leg(
+            profile,
+            score_shot_types,
+            score_points,
+            total=total,
+        )
+        for profile in (profile_a, profile_b)
+    ]
+    p_first, p_second = leg_win_probs(
+        solutions[0].visits_probs,
+        solutions[1].visits_probs,
+    )
+    wins = match_wins(
+        match_type,
+        p_first,
+        p_second,
+        a_first=a_first,
+        legs_to_win=legs_to_win,
+        total_legs=total_legs,
+        total_sets=total_sets,
+        alternate_first=alternate_first,
+    )
+    return MatchSolution(wins, a_handicap=a_handicap, b_handicap=b_handicap)
@@ -0,0 +1,167 @@
+"""
+Answering small simulation requests straight away, rather than through
+the job queue.
+
+The web views try these first and only enqueue a job when they give up:
+
+- `accumulate_within` simulates a profile's legs as the player simulation
+    job would, but stops as soon as the legs look like they'll take
+    longer than the time budget.
+- `solve_match` solves a match exactly, with the leg tables each process
+    keeps (see `~darts.sim.inplay.leg_table`), so that it costs nothing
+    once both profiles have been seen; it too gives up if solving their
+    tables would take longer than the budget.
+"""
+import logging
+import time
+
+from darts import settings
+from . import exact, inplay, parallel, vectorized
+from .accumulate import LegAccumulator
+from .cache import CachedResult
+from .context import compile_context
+from .streams import as_stream
+
+
+log = logging.getLogger(__name__)
+
+
+def accumulate_within(
+        profile,
+        score_shot_types=None,
+        score_points=None,
+        iterations=1000,
+        total=501,
+        random_state=None,
+        keep_darts=False,
+        budget=None,
+        shard_size=parallel.SHARD_SIZE,
+        ):
+    """
+    Simulate a profile, keeping only running statistics of the legs, unless
+    it would take longer than ``budget`` seconds.
+
+    Takes the same arguments as `~darts.sim.parallel.accumulate_profile`,
+    which the player simulation job runs, and throws the legs in the same
+    shards from the same child streams, so that it returns the same
+    statistics as the job for a given random stream and context (see
+    `~darts.jobs.compile_profile`). After each shard, the time the
+    remaining legs will take is projected from the shards thrown so far,
+    and the simulation is abandoned if it won't finish in time.
+
+    :param float budget: seconds to allow (default:
+        ``settings.INLINE_BUDGET``)
+
+    :return: :py:class:`~darts.sim.accumulate.LegAccumulator`, or None if
+        the simulation was abandoned.
+    """
+    if budget is None:
+        budget = float(settings.INLINE_BUDGET)
+    start = time.time()
+    random_state = as_stream(random_state)
+    context = compile_context(
+        profile,
+        score_shot_types,
+        score_points,
+        max_score=total,
+    )
+    accumulator = LegAccumulator(keep_darts)
+    done = 0
+    for shard, (_, n) in enumerate(
+            parallel.shard_iterations(iterations, shard_size)):
+        accumulator.merge(vectorized.accumulate_profile(
+            context,
+            iterations=n,
+            total=total,
+            random_state=random_state.child(shard),
+            keep_darts=keep_darts,
+        ))
+        done += n
+        elapsed = time.time() - start
+        if done < iterations and elapsed * iterations / done > budget:
+            log.info(
+                'abandoned after %s of %s legs in %.3fs',
+                done,
+                iterations,
+                elapsed,
+            )
+            return None
+    return accumulator
+
+
+def solve_match(
+        match_type,
+        profile_a,
+        profile_b,
+        score_shot_types=None,
+        score_points=None,
+        a_first=True,
+        legs_to_win=7,
+        total_legs=None,
+        total_sets=5,
+        total=501,
+        budget=None,
+        **kwargs
+        ):
+    """
+    Solve a match between two profiles exactly, as
+    `~darts.sim.exact.solve_match` does with an even mix of A and B
+    throwing first, unless it would take longer than ``budget`` seconds.
+
+    Takes the same arguments as `~darts.sim.vectorized.simulate_match`;
+    those that don't change the result before handicaps are ignored.
+    Leg tables this process doesn't have yet are solved one at a time, and
+    the solution is abandoned once they look like they'll take longer than
+    the budget; those already solved are kept for the next request.
+
+    :param float budget: seconds to allow (default:
+        ``settings.INLINE_BUDGET``)
+
+    :return: :py:class:`~darts.sim.cache.CachedResult`, ready to be stored
+        in a :py:class:`~darts.sim.cache.MatchCache`, or None if the
+        solution was abandoned.
+    """
+    if budget is None:
+        budget = float(settings.INLINE_BUDGET)
+    start = time.time()
+    contexts = vectorized.match_contexts(
+        profile_a,
+        profile_b,
+        score_shot_types,
+        score_points,
+        total,
+    )
+    missing = [
+        context
+        for context in contexts
+        if not inplay.has_leg_table(context, total)
+    ]
+    for solved, context in enumerate(missing, 1):
+        inplay.leg_table(context, total=total)
+        elapsed = time.time() - start
+        if elapsed * len(missing) / solved > budget:
+            log.info(
+                'abandoned after %s of %s leg tables in %.3fs',
+                solved,
+                len(missing),
+                elapsed,
+            )
+            return None
+
+    table_a, table_b = [
+        inplay.leg_table(context, total=total)
+        for context in contexts
+    ]
+    leg_win_probs = exact.leg_win_probs(table_a[total], table_b[total])
+    return CachedResult(
+        exact.match_wins(
+            match_type,
+            leg_win_probs[0],
+            leg_win_probs[1],
+            a_first=a_first,
+            legs_to_win=legs_to_win,
+            total_legs=total_legs,
+            total_sets=total_sets,
+        ),
+        leg_win_probs=leg_win_probs,
+    )
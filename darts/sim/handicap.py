@@ -0,0 +1,118 @@
+"""
+Handicap sweeps.
+
+Handicaps only shift the final scores of a match; they never change how
+it's played. So rather than simulating a match once per handicap, the
+distribution of legs (or sets) won before handicaps is simulated once and
+the result under every pair of handicaps is derived from it.
+"""
+from collections import Counter
+
+import numpy as np
+
+from .exact import MatchSolution
+
+
+HANDICAPS = range(-10, 11)
+"Handicaps swept for each player by default"
+
+
+def raw_wins(matches):
+    """
+    Return the distribution of legs (or sets) won before handicaps.
+
+    :param list matches: :py:class:`~darts.sim.twoplayer.MatchStats`
+    :return: dict mapping (A's legs, B's legs) to its probability.
+    """
+    n = float(len(matches))
+    counter = Counter(tuple(match.wins) for match in matches)
+    return {wins: count / n for wins, count in counter.items()}
+
+
+class HandicapSweep:
+
+    """
+    The result of a match under every pair of handicaps.
+
+    Entry ``[i][j]`` of each matrix is for player A receiving
+    ``a_handicaps[i]`` and player B ``b_handicaps[j]``.
+
+    :param dict wins: mapping from (A's legs or sets, B's legs or sets) to
+        its probability, before handicaps, e.g. from `raw_wins`
+    :param list a_handicaps: handicaps for player A
+    :param list b_handicaps: handicaps for player B
+    """
+
+    def __init__(self, wins, a_handicaps=HANDICAPS, b_handicaps=HANDICAPS):
+        self.wins = wins
+        self.a_handicaps = list(a_handicaps)
+        self.b_handicaps = list(b_handicaps)
+
+        # Only the difference between the handicaps affects who wins, so
+        # tabulate the distribution of A's margin of victory once.
+        margins = np.array([a - b for a, b in wins], dtype=np.int64)
+        probs = np.array(wins.values())
+        offset = margins.min() if len(margins) else 0
+        margin_probs = np.bincount(margins - offset, probs)
+        # P(margin < m) for m = offset, offset + 1, ...
+        below = np.concatenate([[0], margin_probs.cumsum()])
+
+        def prob_below(m):
+            return below[np.clip(m - offset, 0, len(below) - 1)]
+
+        net = (
+            np.array(self.a_handicaps)[:, None] -
+            np.array(self.b_handicaps)[None, :]
+        )
+        # A wins if margin + net > 0, i.e. margin >= 1 - net.
+        self.b_win_probs = prob_below(-net)
+        self.draw_probs = prob_below(1 - net) - self.b_win_probs
+        self.a_win_probs = below[-1] - prob_below(1 - net)
+
+    @classmethod
+    def from_dict(cls, sweep):
+        return cls(
+            {
+                tuple(int(x) for x in score.split('-')): prob
+                for score, prob in sweep['wins'].items()
+            },
+            sweep['a_handicaps'],
+            sweep['b_handicaps'],
+        )
+
+    def stats(self, a_handicap=0, b_handicap=0):
+        """
+        Return the result under one pair of handicaps, in the form of
+        :py:meth:`~darts.models.MatchSimulation.create_stats`.
+        """
+        return MatchSolution(self.wins, a_handicap, b_handicap).stats()
+
+    def net_rows(self):
+        """
+        Return a row for each distinct net handicap (A's minus B's): the
+        net handicap and the probabilities of A winning, a draw, and B
+        winning.
+        """
+        rows = {}
+        for i, a_handicap in enumerate(self.a_handicaps):
+            for j, b_handicap in enumerate(self.b_handicaps):
+                rows[a_handicap - b_handicap] = (
+                    a_handicap - b_handicap,
+                    float(self.a_win_probs[i, j]),
+                    float(self.draw_probs[i, j]),
+                    float(self.b_win_probs[i, j]),
+                )
+        return [rows[net] for net in sorted(rows)]
+
+    def as_dict(self):
+        return dict(
+            wins={
+                '{}-{}'.format(*wins): prob
+                for wins, prob in self.wins.items()
+            },
+            a_handicaps=self.a_handicaps,
+            b_handicaps=self.b_handicaps,
+            a_win_probs=self.a_win_probs.tolist(),
+            draw_probs=self.draw_probs.tolist(),
+            b_win_probs=self.b_win_probs.tolist(),
+        )
@@ -0,0 +1,332 @@
+"""
+Win probabilities from part-way through a match, for following a match
+live.
+
+A player's chance of winning the leg in progress depends only on the
+scores both players are left on and whose throw it is: the player to
+throw wins unless they need more visits to finish than their opponent.
+`~darts.sim.exact.solve_leg` already gives every score's distribution of
+visits to finish, so a profile's table of them (see `leg_table`) is
+solved once per process and kept, and a match state is then solved with
+the small match dynamic programs of `~darts.sim.exact`, in well under a
+millisecond.
+
+For following matches from the web interface, `load_context` also keeps
+the score lookups and each profile's compiled context per process, so
+that a request doesn't read the lookups from the database again. Like the
+other per-process caches, these are dropped by the listeners at the bottom
+of this module when the profile or the lookups are edited.
+"""
+from collections import defaultdict
+import hashlib
+import math
+
+from darts import settings
+from . import exact
+from .cache import LRUCache, profile_hash, register_invalidation
+from .context import compile_context, profile_key
+from .vectorized import match_contexts
+
+
+_tables = LRUCache(int(settings.IN_PLAY_CACHE_SIZE))
+"Leg-state tables solved by this process, by profile and lookups"
+
+_lookups = LRUCache(1)
+"Score lookups read by `load_context` in this process"
+
+_contexts = LRUCache(int(settings.IN_PLAY_CACHE_SIZE))
+"Contexts compiled by `load_context` in this process, by profile"
+
+
+def load_context(session, profile, total=501):
+    """
+    Return a profile's context compiled against the score lookups in the
+    database.
+
+    The lookups are read once per process, and each profile's context is
+    compiled once per process, until they're edited.
+
+    :param session: database session
+    :param profile: shot profile
+    :type profile: :py:class:`~darts.models.Profile`
+    :param int total: Total required to win a leg of darts (default: 501).
+
+    :rtype: :py:class:`~darts.sim.context.CompiledSimContext`
+    """
+    # Imported here as darts.sim imports this module.
+    from darts.sim import load_lookups
+    lookups = _lookups.get('lookups')
+    if lookups is None:
+        lookups = load_lookups(session)
+        _lookups.put('lookups', lookups)
+    key = (profile_hash(profile), total)
+    context = _contexts.get(key)
+    if context is None:
+        context = compile_context(profile, *lookups, max_score=total)
+        _contexts.put(key, context)
+    return context
+
+
+def leg_table(profile, score_shot_types=None, score_points=None, total=501):
+    """
+    Return a profile's distribution of visits needed to finish a leg from
+    every score.
+
+    Tables are kept per process, so asking again for the same profile and
+    lookups doesn't solve the leg again.
+
+    :param profile: shot profile, or a compiled context in which case the
+        lookups are ignored
+    :type profile: :py:class:`~darts.models.Profile` or
+        :py:class:`~darts.sim.context.CompiledSimContext`
+    :param dict score_shot_types: mapping from (score, dart_number) to
+        shot types, as returned by `~darts.sim.load_lookups`
+    :param dict score_points: mapping from (score, dart ID) to score tuple,
+        as returned by `~darts.sim.load_lookups`.
+    :param int total: Total required to win a leg of darts (default: 501).
+
+    :return: array of shape (total + 1, max_visits + 1), as
+        `~darts.sim.exact.LegSolution.visits`
+    """
+    context = compile_context(
+        profile,
+        score_shot_types,
+        score_points,
+        max_score=total,
+    )
+    key = _table_key(context, total)
+    table = _tables.get(key)
+    if table is None:
+        table = exact.solve_leg(context, total=total).visits
+        _tables.put(key, table)
+    return table
+
+
+def has_leg_table(context, total=501):
+    """
+    Return whether this process already has a compiled context's
+    `leg_table`, so that asking for it costs nothing.
+    """
+    return _table_key(context, total) in _tables
+
+
+def _table_key(context, total):
+    return (
+        profile_key(context),
+        hashlib.sha1(context.shot_types.tobytes()).hexdigest(),
+        hashlib.sha1(context.points.tobytes()).hexdigest(),
+        total,
+    )
+
+
+class InPlaySolution(exact.MatchSolution):
+
+    """
+    The exact distribution of a match's result from part-way through.
+
+    :ivar float leg_win_prob: probability of A winning the leg in progress.
+    """
+
+    def __init__(self, wins, leg_win_prob, a_handicap=0, b_handicap=0):
+        exact.MatchSolution.__init__(self, wins, a_handicap, b_handicap)
+        self.leg_win_prob = leg_win_prob
+
+    def stats(self, a_handicap=None, b_handicap=None):
+        stats = exact.MatchSolution.stats(self, a_handicap, b_handicap)
+        stats['profile_a_leg_win_percent'] = self.leg_win_prob
+        return stats
+
+
+def _check_score(score, total):
+    if not 2 <= score <= total:
+        raise ValueError('No leg in progress from a score of %s' % score)
+
+
+def _play_out(
+        p_current,
+        won,
+        p_first,
+        p_second,
+        a_started,
+        to_win,
+        total_played=None,
+        ):
+    """
+    Compute the distribution of legs (or sets) won at the end of a match
+    with one in progress.
+
+    :param float p_current: probability of A winning the one in progress
+    :param tuple won: legs (or sets) A and B have already won
+    :param bool a_started: whether A threw first in the one in progress
+    :param int to_win: number required to win the match
+    :param int total_played: maximum number played, if a draw is possible
+
+    See `~darts.sim.exact.match_play_probs` for the other arguments.
+    """
+    if max(won) >= to_win or (
+            total_played is not None and sum(won) >= total_played):
+        raise ValueError('The match is already over at %s-%s' % won)
+    a_first = (sum(won) % 2 == 0) == a_started
+    wins = defaultdict(float)
+    for next_won, prob in (
+            ((won[0] + 1, won[1]), p_current),
+            ((won[0], won[1] + 1), 1 - p_current),
+            ):
+        for k, p in exact.match_play_probs(
+                p_first,
+                p_second,
+                a_first=a_first,
+                legs_to_win=to_win,
+                total_legs=total_played,
+                legs=next_won,
+                ).items():
+            wins[k] += prob * p
+    return dict(wins)
+
+
+def solve_in_play(
+        match_type,
+        profile_a,
+        profile_b,
+        score_shot_types=None,
+        score_points=None,
+        a_score=501,
+        b_score=501,
+        a_legs=0,
+        b_legs=0,
+        a_sets=0,
+        b_sets=0,
+        a_to_throw=True,
+        a_started_leg=None,
+        a_handicap=0,
+        b_handicap=0,
+        legs_to_win=7,
+        total_legs=None,
+        total_sets=5,
+        total=501,
+        ):
+    """
+    Solve the rest of a match in progress between two profiles exactly.
+
+    The first thrower alternates between legs, and between the first legs
+    of sets in set play, as in `~darts.sim.twoplayer.simulate_match`.
+
+    :param str match_type: 'match_play', 'set_play' or 'premier_league'
+    :param profile_a: player A's shot profile or compiled context
+    :type profile_a: :py:class:`~darts.models.Profile` or
+        :py:class:`~darts.sim.context.CompiledSimContext`
+    :param profile_b: player B's shot profile or compiled context
+    :param dict score_shot_types: mapping from (score, dart_number) to
+        shot types, as returned by `~darts.sim.load_lookups`
+    :param dict score_points: mapping from (score, dart ID) to score tuple,
+        as returned by `~darts.sim.load_lookups`.
+    :param int a_score: score A is left on in the leg in progress.
+    :param int b_score: score B is left on in the leg in progress.
+    :param int a_legs: legs A has won (in the current set, in set play).
+    :param int b_legs: legs B has won (in the current set, in set play).
+    :param int a_sets: sets A has won, in set play.
+    :param int b_sets: sets B has won, in set play.
+    :param bool a_to_throw: whether A throws the next visit.
+    :param bool a_started_leg: whether A threw first in the leg in
+        progress (default: ``a_to_throw``, as at the start of a leg).
+    :param int a_handicap: Player A's handicap (legs or sets).
+    :param int b_handicap: Player B's handicap (legs or sets).
+    :param int legs_to_win: legs required to win, in match play.
+    :param int total_legs: maximum number of legs, in match play.
+    :param int total_sets: sets required to win, in set play.
+    :param int total: Total required to win a leg of darts (default: 501).
+
+    :rtype: InPlaySolution
+    :raises ValueError: if the state isn't that of a match in progress.
+    """
+    _check_score(a_score, total)
+    _check_score(b_score, total)
+    if a_started_leg is None:
+        a_started_leg = a_to_throw
+
+    table_a, table_b = [
+        leg_table(context, total=total)
+        for context in match_contexts(
+            profile_a,
+            profile_b,
+            score_shot_types,
+            score_points,
+            total,
+        )
+    ]
+
+    leg_win_prob = exact.leg_win_probs(
+        table_a[a_score],
+        table_b[b_score],
+    )[0 if a_to_throw else 1]
+    p_first, p_second = exact.leg_win_probs(table_a[total], table_b[total])
+
+    if match_type == 'set_play':
+        set_first, set_second = [
+            sum(
+                prob
+                for (a_set_legs, _), prob in exact.match_play_probs(
+                    p_first,
+                    p_second,
+                    a_first=a_starts,
+                    legs_to_win=exact.LEGS_PER_SET,
+                ).items()
+                if a_set_legs == exact.LEGS_PER_SET
+            )
+            for a_starts in (True, False)
+        ]
+        a_started_set = ((a_legs + b_legs) % 2 == 0) == a_started_leg
+        set_win_prob = sum(
+            prob
+            for (a_set_legs, _), prob in _play_out(
+                leg_win_prob,
+                (a_legs, b_legs),
+                p_first,
+                p_second,
+                a_started_leg,
+                exact.LEGS_PER_SET,
+            ).items()
+            if a_set_legs == exact.LEGS_PER_SET
+        )
+        wins = _play_out(
+            set_win_prob,
+            (a_sets, b_sets),
+            set_first,
+            set_second,
+            a_started_set,
+            total_sets,
+        )
+    else:
+        if match_type == 'premier_league':
+            # Always 12 legs in a Premier League match.
+            legs_to_win, total_legs = 7, 12
+        elif total_legs is not None:
+            legs_to_win = int(math.ceil(total_legs / 2.0))
+        wins = _play_out(
+            leg_win_prob,
+            (a_legs, b_legs),
+            p_first,
+            p_second,
+            a_started_leg,
+            legs_to_win,
+            total_legs,
+        )
+
+    return InPlaySolution(
+        wins,
+        leg_win_prob,
+        a_handicap=a_handicap,
+        b_handicap=b_handicap,
+    )
+
+
+def _delete_profile_entries(connection, profile):
+    _contexts.clear()
+
+
+def _delete_all_entries(connection):
+    _lookups.clear()
+    _contexts.clear()
+
+
+register_invalidation(_delete_profile_entries, _delete_all_entries)
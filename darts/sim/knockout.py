@@ -0,0 +1,313 @@
+"""
+Knockout tournament simulations.
+
+A bracket is a list of entrants in draw order: the first two meet in the
+first round, the winner of that match meets the winner of the next two,
+and so on. Every match between two entrants is decided by a probability
+looked up in a `WinProbabilityTable`, which solves each pairing exactly
+(see `~darts.sim.exact`) the first time it's needed, so the brackets
+themselves can be run in bulk without simulating any darts.
+"""
+import logging
+
+import numpy as np
+
+from darts import models
+
+from . import exact
+from .cache import CachedResult
+from .context import compile_context, CompiledSimContext, profile_key
+from .streams import as_stream
+
+
+log = logging.getLogger(__name__)
+
+
+class WinProbabilityTable:
+
+    """
+    Lazily solved probabilities of one profile beating another.
+
+    Each profile's leg is solved once, and each pairing once, whichever
+    way round it's asked for. Profiles are identified by `profile_key`, so
+    the table can be shared between brackets and events.
+
+    Drawn matches (only possible with an even number of legs) count as
+    half a win each, as if decided by a coin toss.
+
+    Takes the same match arguments as `~darts.sim.exact.solve_match`, and:
+
+    :param cache: optional :py:class:`~darts.sim.cache.MatchCache` to read
+        exact solutions from and store new ones in.
+    """
+
+    def __init__(
+            self,
+            match_type,
+            score_shot_types=None,
+            score_points=None,
+            legs_to_win=7,
+            total_legs=None,
+            total_sets=5,
+            total=501,
+            cache=None,
+            ):
+        self.match_type = match_type
+        self.score_shot_types = score_shot_types
+        self.score_points = score_points
+        self.legs_to_win = legs_to_win
+        self.total_legs = total_legs
+        self.total_sets = total_sets
+        self.total = total
+        self.cache = cache
+        self._context = None
+        self._legs = {}
+        self._probs = {}
+
+    def __len__(self):
+        return len(self._probs)
+
+    def _compile(self, profile):
+        if isinstance(profile, CompiledSimContext):
+            return profile
+        if self._context is None:
+            self._context = compile_context(
+                profile,
+                self.score_shot_types,
+                self.score_points,
+                max_score=self.total,
+            )
+            return self._context
+        return self._context.for_profile(profile)
+
+    def leg_solution(self, profile):
+        """
+        Return the solved leg of a profile.
+
+        :rtype: :py:class:`~darts.sim.exact.LegSolution`
+        """
+        key = profile_key(profile)
+        if key not in self._legs:
+            self._legs[key] = exact.solve_leg(
+                self._compile(profile),
+                total=self.total,
+            )
+        return self._legs[key]
+
+    def win_prob(self, profile_a, profile_b):
+        """
+        Return the probability of ``profile_a`` beating ``profile_b``, with
+        each equally likely to throw first.
+        """
+        key_a, key_b = profile_key(profile_a), profile_key(profile_b)
+        if (key_b, key_a) in self._probs:
+            return 1 - self._probs[(key_b, key_a)]
+        if (key_a, key_b) not in self._probs:
+            self._probs[(key_a, key_b)] = self._solve(profile_a, profile_b)
+        return self._probs[(key_a, key_b)]
+
+    def _solve(self, profile_a, profile_b):
+        match_kwargs = dict(
+            legs_to_win=self.legs_to_win,
+            total_legs=self.total_legs,
+            total_sets=self.total_sets,
+            total=self.total,
+        )
+        if self.cache is not None:
+            cached = self.cache.get(
+                self.match_type,
+                profile_a,
+                profile_b,
+                **match_kwargs
+            )
+            if cached is not None and cached.exact:
+                return cached.win_prob()
+
+        leg_a = self.leg_solution(profile_a)
+        leg_b = self.leg_solution(profile_b)
+        result = CachedResult.from_solution(
+            exact.solve_match(self.match_type, leg_a, leg_b, **match_kwargs),
+            leg_win_probs=exact.leg_win_probs(
+                leg_a.visits_probs,
+                leg_b.visits_probs,
+            ),
+        )
+        if self.cache is not None:
+            self.cache.put(
+                result,
+                self.match_type,
+                profile_a,
+                profile_b,
+                **match_kwargs
+            )
+        return result.win_prob()
+
+    def matrix(self, profiles):
+        """
+        Return an array whose ``[i, j]`` entry is the probability of
+        ``profiles[i]`` beating ``profiles[j]``.
+        """
+        n = len(profiles)
+        probs = np.full((n, n), 0.5)
+        for i in xrange(n):
+            for j in xrange(i + 1, n):
+                probs[i, j] = self.win_prob(profiles[i], profiles[j])
+                probs[j, i] = 1 - probs[i, j]
+        return probs
+
+
+def bracket_size(n):
+    """
+    Return the number of places in a bracket for ``n`` entrants: the
+    smallest power of two that is at least ``n``.
+    """
+    size = 2
+    while size < n:
+        size *= 2
+    return size
+
+
+def round_names(n_rounds):
+    """
+    Return the names of the stages of a knockout with ``n_rounds`` rounds,
+    from the first round up to the winner.
+    """
+    named = ['Final', 'Semi-finals', 'Quarter-finals']
+    names = [
+        named[n_rounds - r - 1] if n_rounds - r - 1 < len(named)
+        else 'Round {}'.format(r + 1)
+        for r in xrange(n_rounds)
+    ]
+    return names + ['Winner']
+
+
+def fixtures_bracket(fixtures):
+    """
+    Build a bracket from the first-round fixtures of an event.
+
+    The fixtures are taken in order of date, then ID; a fixture with a
+    single player gives that player a bye. Any places left over in the
+    bracket are byes at the bottom of the draw.
+
+    :param list fixtures: :py:class:`~darts.models.Fixture` objects
+    :return: list of player IDs, or None for byes, in draw order.
+    """
+    bracket = []
+    for fixture in sorted(fixtures, key=lambda f: (f.date, f.id)):
+        player_ids = sorted(fp.player_id for fp in fixture.fixture_players)
+        if len(player_ids) > 2:
+            raise ValueError(
+                '{!r} has more than two players'.format(fixture)
+            )
+        bracket.extend(player_ids + [None] * (2 - len(player_ids)))
+    return bracket + [None] * (bracket_size(len(bracket)) - len(bracket))
+
+
+def event_bracket(session, event_id):
+    """
+    Build a bracket from an event's fixtures; see `fixtures_bracket`.
+    """
+    return fixtures_bracket(
+        session.query(models.Fixture)
+        .filter(models.Fixture.event_id == event_id)
+    )
+
+
+class KnockoutResult:
+
+    """
+    Probabilities of each entrant reaching each stage of a knockout.
+
+    :param list entrants: entrant keys (e.g. player IDs), in draw order
+    :param list stages: stage names, as returned by `round_names`
+    :param reach_probs: array whose ``[i, r]`` entry is the probability of
+        ``entrants[i]`` reaching ``stages[r]``; the last stage is winning.
+    :param int iterations: number of brackets run
+    """
+
+    def __init__(self, entrants, stages, reach_probs, iterations):
+        self.entrants = entrants
+        self.stages = stages
+        self.reach_probs = reach_probs
+        self.iterations = iterations
+
+    @property
+    def win_probs(self):
+        """
+        Return a dict mapping each entrant to its probability of winning.
+        """
+        return dict(zip(self.entrants, self.reach_probs[:, -1].tolist()))
+
+    def as_dict(self):
+        return dict(
+            entrants=self.entrants,
+            stages=self.stages,
+            reach_probs=self.reach_probs.tolist(),
+            iterations=self.iterations,
+        )
+
+
+def simulate_knockout(
+        bracket,
+        profiles,
+        table,
+        iterations=10000,
+        random_state=None,
+        ):
+    """
+    Run a knockout bracket many times.
+
+    All the brackets are run together, a round at a time: each match in
+    each bracket is won by the first entrant if a uniform draw falls below
+    the first entrant's probability of beating the second.
+
+    :param list bracket: entrant keys in draw order, with None for byes,
+        e.g. from `fixtures_bracket`. Its length must be a power of two.
+    :param dict profiles: mapping from each entrant key to its profile or
+        compiled context
+    :param WinProbabilityTable table: pairwise win probabilities
+    :param int iterations: number of brackets to run.
+    :param random_state: :py:class:`~darts.sim.streams.RandomStream` to
+        draw from (default: a new, randomly seeded stream).
+
+    :rtype: KnockoutResult
+    """
+    random_state = as_stream(random_state)
+    if len(bracket) != bracket_size(len(bracket)):
+        raise ValueError('Bracket size must be a power of two')
+    entrants = [key for key in bracket if key is not None]
+    missing = [key for key in entrants if key not in profiles]
+    if missing:
+        raise ValueError('No profiles for {}'.format(missing))
+
+    # Byes are an extra entrant who loses to everyone.
+    n = len(entrants)
+    bye = n
+    probs = np.ones((n + 1, n + 1))
+    probs[:n, :n] = table.matrix([profiles[key] for key in entrants])
+    probs[bye, :n] = 0
+
+    index = iter(xrange(n))
+    slots = np.array(
+        [bye if key is None else next(index) for key in bracket],
+        dtype=np.int32,
+    )
+    slots = np.tile(slots, (iterations, 1))
+
+    n_rounds = int(np.log2(len(bracket)))
+    reach = np.zeros((n, n_rounds + 1))
+    reach[:, 0] = iterations
+    for r in xrange(1, n_rounds + 1):
+        a, b = slots[:, 0::2], slots[:, 1::2]
+        a_wins = random_state.random_sample(a.shape) < probs[a, b]
+        slots = np.where(a_wins, a, b)
+        reach[:, r] = np.bincount(slots.ravel(), minlength=n + 1)[:n]
+
+    log.info('ran %s brackets of %s entrants', iterations, n)
+
+    return KnockoutResult(
+        entrants,
+        round_names(n_rounds),
+        reach / iterations,
+        iterations,
+    )
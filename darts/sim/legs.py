@@ -0,0 +1,423 @@
+"""
+Matches sampled a leg at a time from cached leg-length distributions.
+
+Who wins a leg depends only on how many visits each player needs to
+finish it: the player throwing first wins unless they need more visits
+than their opponent. Legs are independent, so a match can be sampled by
+drawing each player's visits for each leg from their distribution of
+visits-to-finish, without throwing any darts.
+
+Each profile's distribution is either solved exactly (see
+`~darts.sim.exact.solve_leg`) or counted from one large Monte Carlo run.
+Distributions are stored in the ``leg_distribution_cache`` table (see
+`LegDistributionCache`), with a per-process LRU in front, so that later
+jobs can reuse them. As with the match result cache, entries are deleted
+when their profile or the lookups are edited, by the listeners at the
+bottom of this module.
+"""
+import hashlib
+import logging
+import math
+
+import numpy as np
+
+from darts import models, settings
+
+from . import exact, vectorized
+from .adaptive import simulate_until_precise
+from .cache import LRUCache, profile_hash, register_invalidation
+from .streams import as_stream
+
+
+log = logging.getLogger(__name__)
+
+
+METHODS = ['exact', 'monte_carlo']
+"Ways of building a leg-length distribution, most precise first"
+
+ITERATIONS = 200000
+"Default number of legs in a Monte Carlo leg-length distribution"
+
+LEGS_PER_SET = 3
+"Legs required to win a set in set play"
+
+
+class LegDistribution:
+
+    """
+    A profile's distribution of visits needed to finish a leg.
+
+    :param visits: ``visits[n]`` is the probability (or number of legs) of
+        finishing in exactly ``n`` visits, including busted visits; it is
+        normalised.
+    :param str method: one of `METHODS`
+    :param int iterations: number of legs counted, for 'monte_carlo'
+    """
+
+    def __init__(self, visits, method='exact', iterations=None):
+        visits = np.asarray(visits, dtype=float)
+        self.visits = visits / visits.sum()
+        self.method = method
+        self.iterations = iterations
+        self._cdf = np.cumsum(self.visits)
+        self._cdf[-1] = 1
+
+    @property
+    def expected_visits(self):
+        return float(np.arange(self.visits.size).dot(self.visits))
+
+    def more_precise_than(self, other):
+        """
+        Return whether this distribution should replace ``other``.
+        """
+        if self.method != other.method:
+            return METHODS.index(self.method) < METHODS.index(other.method)
+        return (self.iterations or 0) > (other.iterations or 0)
+
+    def sample(self, draws):
+        """
+        Return the visits needed to finish a leg, for each of an array of
+        uniform random numbers in [0, 1).
+        """
+        return np.searchsorted(self._cdf, draws, side='right')
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row.visits, row.method, row.iterations)
+
+    def __repr__(self):
+        return '<LegDistribution(method=%r, expected_visits=%.3f)>' % (
+            self.method,
+            self.expected_visits,
+        )
+
+
+def build_distribution(
+        context,
+        method='exact',
+        iterations=ITERATIONS,
+        total=501,
+        random_state=None,
+        ):
+    """
+    Build a profile's leg-length distribution.
+
+    :param context: compiled context, as returned by
+        `~darts.sim.context.compile_context`
+    :param str method: 'exact' to solve the leg, or 'monte_carlo' to count
+        the visits in ``iterations`` simulated legs
+    :param int iterations: legs to simulate, for 'monte_carlo'.
+    :param int total: Total required to win a leg of darts (default: 501).
+    :param random_state: :py:class:`~darts.sim.streams.RandomStream` to
+        draw from, for 'monte_carlo' (default: a new, randomly seeded
+        stream).
+
+    :rtype: LegDistribution
+    """
+    if method == 'exact':
+        leg = exact.solve_leg(context, total=total)
+        return LegDistribution(leg.visits_probs, method)
+
+    random_state = as_stream(random_state)
+    counts = np.zeros(1)
+    for start in xrange(0, iterations, vectorized.BATCH_SIZE):
+        n = min(vectorized.BATCH_SIZE, iterations - start)
+        legs = vectorized.simulate_visits(
+            context,
+            iterations=n,
+            total=total,
+            random_state=random_state,
+        )[0]
+        batch_counts = np.bincount(np.bincount(legs, minlength=n))
+        size = max(counts.size, batch_counts.size)
+        counts = (
+            np.pad(counts, (0, size - counts.size), 'constant') +
+            np.pad(batch_counts, (0, size - batch_counts.size), 'constant')
+        )
+    return LegDistribution(counts, method, iterations)
+
+
+_local = LRUCache(int(settings.MATCH_CACHE_SIZE))
+
+
+class LegDistributionCache:
+
+    """
+    Look up and store leg-length distributions for one version of the
+    score lookups.
+
+    Rows are added to the session but not committed.
+
+    :param session: database session
+    :param str lookups_version: as returned by
+        `~darts.sim.cache.lookups_hash`
+    """
+
+    def __init__(self, session, lookups_version):
+        self.session = session
+        self.lookups_version = lookups_version
+
+    def key(self, profile, total=501):
+        """
+        Return the cache key for a profile's distribution.
+        """
+        return hashlib.sha1(repr((
+            profile_hash(profile),
+            self.lookups_version,
+            total,
+        ))).hexdigest()
+
+    def get(self, profile, total=501):
+        """
+        Return a profile's cached distribution, or None.
+
+        :rtype: LegDistribution
+        """
+        key = self.key(profile, total)
+        distribution = _local.get(key)
+        if distribution is None:
+            row = self.session.query(models.CachedLegDistribution).get(key)
+            if row is not None:
+                distribution = LegDistribution.from_row(row)
+                _local.put(key, distribution)
+        return distribution
+
+    def put(self, distribution, profile, total=501):
+        """
+        Cache a profile's distribution, unless a more precise one is
+        already cached.
+
+        :return: the distribution now cached
+        """
+        cached = self.get(profile, total)
+        if cached is not None and not distribution.more_precise_than(cached):
+            return cached
+
+        key = self.key(profile, total)
+        self.session.merge(models.CachedLegDistribution(
+            key=key,
+            profile_hash=profile_hash(profile),
+            lookups_hash=self.lookups_version,
+            total=total,
+            method=distribution.method,
+            iterations=distribution.iterations,
+            visits=distribution.visits.tolist(),
+        ))
+        _local.put(key, distribution)
+        return distribution
+
+    def load(self, context, method='exact', total=501, **kwargs):
+        """
+        Return a profile's distribution from the cache, building and
+        caching it with ``method`` if it isn't cached.
+
+        Any cached distribution is returned, even if it was built with
+        another method. Other keyword arguments are passed to
+        `build_distribution`.
+
+        :param context: compiled context, as returned by
+            `~darts.sim.context.compile_context`
+        :rtype: LegDistribution
+        """
+        distribution = self.get(context, total)
+        if distribution is None:
+            distribution = self.put(
+                build_distribution(context, method, total=total, **kwargs),
+                context,
+                total,
+            )
+        return distribution
+
+
+def simulate_match_wins(
+        match_type,
+        legs_a,
+        legs_b,
+        iterations=1000,
+        a_first=True,
+        legs_to_win=7,
+        total_legs=None,
+        total_sets=5,
+        random_state=None,
+        ):
+    """
+    Sample lots of matches between two profiles in lockstep, a leg at a
+    time.
+
+    Every step, each unfinished match draws both players' visits for its
+    current leg; the player throwing first wins the leg if they need no
+    more visits than the other. Leg and set throwers alternate as in
+    `~darts.sim.vectorized.simulate_match_wins`, which this replaces, and
+    the return value is the same.
+
+    :param LegDistribution legs_a: player A's leg-length distribution
+    :param LegDistribution legs_b: player B's leg-length distribution
+
+    See `simulate_match` for the other arguments.
+    """
+    random_state = as_stream(random_state)
+
+    set_play = match_type == 'set_play'
+    if match_type == 'premier_league':
+        # Always 12 legs in a Premier League match.
+        legs_to_win, total_legs = 7, 12
+    elif total_legs is not None:
+        legs_to_win = int(math.ceil(total_legs / 2.0))
+
+    # Players are 0 (A) and 1 (B).
+    matches = np.arange(iterations)
+    first = (matches + (0 if a_first else 1)) % 2
+    set_thrower = first.copy()
+    leg_thrower = first.copy()
+    legs = np.zeros((iterations, 2), dtype=np.int32)
+    sets = np.zeros((iterations, 2), dtype=np.int32)
+    legs_played = np.zeros(iterations, dtype=np.int32)
+
+    while matches.size:
+        visits_a = legs_a.sample(random_state.random_sample(matches.size))
+        visits_b = legs_b.sample(random_state.random_sample(matches.size))
+        a_throws_first = leg_thrower[matches] == 0
+        a_wins = np.where(
+            a_throws_first,
+            visits_a <= visits_b,
+            visits_a < visits_b,
+        )
+        winners = np.where(a_wins, 0, 1)
+
+        legs[matches, winners] += 1
+        legs_played[matches] += 1
+        leg_thrower[matches] = 1 - leg_thrower[matches]
+
+        if set_play:
+            won_set = legs[matches, winners] == LEGS_PER_SET
+            set_ended, set_winners = matches[won_set], winners[won_set]
+            sets[set_ended, set_winners] += 1
+            legs[set_ended] = 0
+            set_thrower[set_ended] = 1 - set_thrower[set_ended]
+            leg_thrower[set_ended] = set_thrower[set_ended]
+            finished = sets[matches].max(axis=1) >= total_sets
+        else:
+            finished = legs[matches].max(axis=1) >= legs_to_win
+            if total_legs is not None:
+                finished |= legs_played[matches] >= total_legs
+
+        matches = matches[~finished]
+
+    log.info('sampled %s matches', iterations)
+
+    return sets if set_play else legs
+
+
+def simulate_match(
+        match_type,
+        profile_a,
+        profile_b,
+        score_shot_types=None,
+        score_points=None,
+        iterations=1000,
+        a_first=True,
+        a_handicap=0,
+        b_handicap=0,
+        legs_to_win=7,
+        total_legs=None,
+        total_sets=5,
+        total=501,
+        random_state=None,
+        tolerance=None,
+        score_tolerance=None,
+        method='exact',
+        cache=None,
+        ):
+    """
+    Sample lots of matches between two profiles from their leg-length
+    distributions.
+
+    A drop-in replacement for `~darts.sim.vectorized.simulate_match`,
+    taking the same arguments plus:
+
+    :param str method: how to build a distribution that isn't cached; see
+        `build_distribution`.
+    :param LegDistributionCache cache: cache to take the distributions
+        from and add them to (optional).
+
+    :return: one :py:class:`~darts.sim.twoplayer.MatchStats` per match,
+        without leg details.
+    """
+    random_state = as_stream(random_state)
+    contexts = vectorized.match_contexts(
+        profile_a,
+        profile_b,
+        score_shot_types,
+        score_points,
+        total,
+    )
+    distributions = []
+    for context in contexts:
+        # simulate_until_precise gives its batches the first children, at
+        # most one per match, so Monte Carlo distributions draw from those
+        # after them.
+        distribution_state = random_state.child(
+            iterations + len(distributions)
+        )
+        if cache is None:
+            distributions.append(build_distribution(
+                context,
+                method,
+                total=total,
+                random_state=distribution_state,
+            ))
+        else:
+            distributions.append(cache.load(
+                context,
+                method,
+                total=total,
+                random_state=distribution_state,
+            ))
+    legs_a, legs_b = distributions
+
+    def simulate_batch(n, batch_a_first, batch_random_state):
+        wins = simulate_match_wins(
+            match_type,
+            legs_a,
+            legs_b,
+            iterations=n,
+            a_first=batch_a_first,
+            legs_to_win=legs_to_win,
+            total_legs=total_legs,
+            total_sets=total_sets,
+            random_state=batch_random_state,
+        )
+        return vectorized.match_stats(
+            wins,
+            profile_a,
+            profile_b,
+            a_handicap,
+            b_handicap,
+        )
+
+    if tolerance is not None:
+        return simulate_until_precise(
+            simulate_batch,
+            iterations,
+            tolerance,
+            score_tolerance,
+            a_first=a_first,
+            random_state=random_state,
+        )
+    return simulate_batch(iterations, a_first, random_state)
+
+
+def _delete_profile_entries(connection, profile):
+    table = models.CachedLegDistribution.__table__
+    connection.execute(
+        table.delete().where(table.c.profile_hash == profile_hash(profile))
+    )
+    _local.clear()
+
+
+def _delete_all_entries(connection):
+    connection.execute(models.CachedLegDistribution.__table__.delete())
+    _local.clear()
+
+
+register_invalidation(_delete_profile_entries, _delete_all_entries)
@@ -2,21 +2,25 @@
 Simulations of 1-player matches.
 """
 import logging
-import random
 
 import enum
 
 from darts.models import ShotResultEnum, ShotTypeEnum
 
-
-log = logging.getLogger(__name__)
+from .accumulate import LegAccumulator
+from .columns import DartColumns
+from .context import (
+    CompiledSimContext,
+    DEFAULT_POINTS,
+    DEFAULT_SHOT_TYPE,
+    SHOT_RESULTS,
+    SHOT_TYPES,
+)
+from .streams import as_stream
+from .visits import VisitTable
 
 
-DEFAULT_SHOT_TYPE = ShotTypeEnum.Treble
-"Shot type to use if score doesn't appear in lookup"
-
-DEFAULT_POINTS = (60, 20, 6)
-"Points tuple to use if score doesn't appear in lookup"
+log = logging.getLogger(__name__)
 
 
 def get_shot_type(current_score, dart_number, score_shot_types):
@@ -34,7 +38,7 @@ def get_shot_type(current_score, dart_number, score_shot_types):
     )
 
 
-def get_result(shot_type, profile):
+def get_result(shot_type, profile, random_state=None):
     """
     Return a random result for a shot type, with the probability
     determined by the given profile.
@@ -48,14 +52,19 @@ def get_result(shot_type, profile):
     :param profile: shot profile
     :type profile: :py:class:`~darts.models.Profile`
 
+    :param random_state: random stream to draw from (default: a new,
+        randomly seeded stream)
+    :type random_state: :py:class:`~darts.sim.streams.RandomStream`
+
     :return: shot outcome
     :rtype: ShotResult
     """
+    random_state = as_stream(random_state)
 
     if shot_type == ShotTypeEnum.Single:
         return ShotResultEnum.Hit
 
-    result = 100 * random.random()
+    result = 100 * random_state.random()
 
     if shot_type == ShotTypeEnum.Treble:
         if result <= profile.treble_hit_pct:
@@ -89,7 +98,13 @@ def get_result(shot_type, profile):
         raise ValueError('Unknown shot type: {}'.format(shot_type))
 
 
-def get_points(current_score, dart_number, result, score_points):
+def get_points(
+        current_score,
+        dart_number,
+        result,
+        score_points,
+        random_state=None,
+        ):
     """
     Return the points scored by a shot.
 
@@ -101,17 +116,21 @@ def get_points(current_score, dart_number, result, score_points):
     :param string result: shot result, as returned by get_result.
     :param dict score_points: mapping from (score, dart ID) to score tuple,
         as returned by `load_lookups`.
+    :param random_state: random stream to draw from (default: a new,
+        randomly seeded stream)
+    :type random_state: :py:class:`~darts.sim.streams.RandomStream`
 
     :return: number of points scored.
     :rtype: int
     """
+    random_state = as_stream(random_state)
     point_tuple = score_points.get(
         (current_score, dart_number),
         DEFAULT_POINTS,
     )
     if result == ShotResultEnum.BigMiss and point_tuple[result] == 6:
         choices = [1, 3, 5, 15]
-        return random.choice(choices)
+        return random_state.choice(choices)
     return point_tuple[result]
 
 
@@ -122,25 +141,42 @@ class DartThrow:
             start_score,
             dart_number,
             profile,
-            score_shot_types,
-            score_points,
+            score_shot_types=None,
+            score_points=None,
+            random_state=None,
             ):
-        log.debug('Score is {}, dart id is {}'.format(start_score, dart_number))
+        random_state = as_stream(random_state)
         self.start_score = start_score
         self.dart_number = dart_number
+        if isinstance(profile, CompiledSimContext):
+            shot_type, shot_result, self.points_scored = profile.throw_dart(
+                start_score,
+                dart_number,
+                random_state,
+            )
+            self.shot_type = SHOT_TYPES[shot_type]
+            self.shot_result = SHOT_RESULTS[shot_result]
+            return
+
+        log.debug('Score is {}, dart id is {}'.format(start_score, dart_number))
         self.shot_type = get_shot_type(
             start_score,
             dart_number,
             score_shot_types,
         )
         log.debug('Aiming for {}'.format(self.shot_type.name))
-        self.shot_result = get_result(self.shot_type, profile)
+        self.shot_result = get_result(
+            self.shot_type,
+            profile,
+            random_state,
+        )
         log.debug('Shot {}!'.format(self.shot_result.name))
         self.points_scored = get_points(
             start_score,
             dart_number,
             self.shot_result,
             score_points,
+            random_state,
         )
         log.debug('Points scored: {}'.format(self.points_scored))
 
@@ -158,8 +194,9 @@ def throw_dart(
         current_score,
         dart_number,
         profile,
-        score_shot_types,
-        score_points,
+        score_shot_types=None,
+        score_points=None,
+        random_state=None,
         ):
     """
     Simulate the throwing of a dart at a particular score.
@@ -169,29 +206,61 @@ def throw_dart(
     :param int current_score: current score (before throwing the dart)
     :param int dart_number: dart ID (1, 2, 3)
 
-    :param profile: shot profile
-    :type profile: :py:class:`~darts.models.Profile`
+    :param profile: shot profile, or a compiled context in which case the
+        lookups are ignored
+    :type profile: :py:class:`~darts.models.Profile` or
+        :py:class:`~darts.sim.context.CompiledSimContext`
 
     :param dict score_shot_types: mapping from (score, dart_number) to
         shot types, as returned by `~load_lookups`
     :param dict score_points: mapping from (score, dart ID) to score tuple,
         as returned by `load_lookups`.
+    :param random_state: random stream to draw from (default: a new,
+        randomly seeded stream)
+    :type random_state: :py:class:`~darts.sim.streams.RandomStream`
 
     :return: number of points scored.
     :rtype: int
     """
+    random_state = as_stream(random_state)
+    if isinstance(profile, CompiledSimContext):
+        shot_type, result, points = profile.throw_dart(
+            current_score,
+            dart_number,
+            random_state,
+        )
+        return (
+            dart_number,
+            SHOT_TYPES[shot_type],
+            SHOT_RESULTS[result],
+            points,
+        )
+
     shot_type = get_shot_type(current_score, dart_number, score_shot_types)
-    result = get_result(shot_type, profile)
-    points = get_points(current_score, dart_number, result, score_points)
+    result = get_result(shot_type, profile, random_state)
+    points = get_points(
+        current_score,
+        dart_number,
+        result,
+        score_points,
+        random_state,
+    )
     return (dart_number, shot_type, result, points)
 
 
-def throw_three_darts(current_score, profile, score_shot_types, score_points):
+def throw_three_darts(
+        current_score,
+        profile,
+        score_shot_types=None,
+        score_points=None,
+        random_state=None,
+        ):
     """
     Simulate throwing three darts.
 
     Encapsulates the logic of winning if score reaches 0 after any dart,
-    or busting if score is either 1 or less than zero.
+    or busting if score is either 1 or less than zero. A bust leaves the
+    score where it was before the first dart.
 
     Returns a tuple containing:
 
@@ -201,17 +270,29 @@ def throw_three_darts(current_score, profile, score_shot_types, score_points):
 
     :param int current_score: current score (before throwing the dart)
 
-    :param profile: shot profile
-    :type profile: :py:class:`~darts.models.Profile`
+    :param profile: shot profile, or a compiled context in which case the
+        lookups are ignored; if a
+        :py:class:`~darts.sim.visits.VisitTable`, the whole visit is drawn
+        from it at once
+    :type profile: :py:class:`~darts.models.Profile` or
+        :py:class:`~darts.sim.context.CompiledSimContext`
 
     :param dict score_shot_types: mapping from (score, dart_number) to
         shot types, as returned by `~load_lookups`
     :param dict score_points: mapping from (score, dart ID) to score tuple,
         as returned by `load_lookups`.
+    :param random_state: random stream to draw from (default: a new,
+        randomly seeded stream)
+    :type random_state: :py:class:`~darts.sim.streams.RandomStream`
 
     :return: the new score, three dart total, and number of darts thrown.
     :rtype: Tuple[int, int, int]
     """
+    random_state = as_stream(random_state)
+
+    if isinstance(profile, VisitTable):
+        new_score, darts = profile.throw_visit(current_score, random_state)
+        return (new_score, ThreeDartStats(*darts))
 
     new_score = current_score
 
@@ -226,6 +307,7 @@ def throw_three_darts(current_score, profile, score_shot_types, score_points):
             profile,
             score_shot_types,
             score_points,
+            random_state,
         )
 
         new_score = new_score - dart_throw.points_scored
@@ -240,12 +322,65 @@ def throw_three_darts(current_score, profile, score_shot_types, score_points):
             return (new_score, ThreeDartStats(*three_dart_stats))
 
         else:
-            # score is either 1 or < 0, so bust.
-            return (new_score, ThreeDartStats(*[]))
+            # score is either 1 or < 0, so bust and revert to the score
+            # at the start of the turn.
+            return (current_score, ThreeDartStats(*[]))
 
     return (new_score, ThreeDartStats(*three_dart_stats))
 
 
+def score_visit(
+        current_score,
+        profile,
+        score_shot_types=None,
+        score_points=None,
+        random_state=None,
+        ):
+    """
+    Simulate throwing three darts, keeping only the visit's totals.
+
+    Draws the same darts as `throw_three_darts` from the same random
+    stream, without recording any of them, for simulations that only need
+    the score.
+
+    Returns a tuple containing:
+
+    - the new score after throwing three darts
+    - the number of darts counted (none after a bust)
+
+    Takes the same arguments as `throw_three_darts`.
+
+    :rtype: Tuple[int, int]
+    """
+    random_state = as_stream(random_state)
+
+    if isinstance(profile, VisitTable):
+        return profile.score_visit(current_score, random_state)
+
+    new_score = current_score
+    for dart_id in (1, 2, 3):
+        if isinstance(profile, CompiledSimContext):
+            points = profile.throw_dart(new_score, dart_id, random_state)[2]
+        else:
+            points = throw_dart(
+                new_score,
+                dart_id,
+                profile,
+                score_shot_types,
+                score_points,
+                random_state,
+            )[3]
+        new_score -= points
+
+        if new_score == 0:
+            return (new_score, dart_id)
+        elif new_score <= 1:
+            # Bust: back to the score at the start of the turn.
+            return (current_score, 0)
+
+    return (new_score, 3)
+
+
 class LegStats:
 
     def __init__(self, total, *three_dart_stats):
@@ -257,6 +392,13 @@ class LegStats:
         n_darts = len([x for dart in self.all_darts for x in dart])
         self.three_dart_average = 3.0 * float(total) / float(n_darts)
 
+    @property
+    def darts(self):
+        """
+        The leg's darts as a :py:class:`~darts.sim.columns.DartColumns`.
+        """
+        return DartColumns.from_legs([self.all_darts])
+
     def create_rows(self, *three_dart_stats):
         for darts in three_dart_stats:
             rows = zip(darts.shot_types, darts.shot_results, darts.points_scored)  # noqa
@@ -274,24 +416,56 @@ class LegStats:
         )
 
 
-def simulate_leg(profile, score_shot_types, score_points, total=501):
+class LegSummary:
+
+    """
+    A player's totals for a leg, without the darts that make them up; see
+    `LegStats`.
+    """
+
+    def __init__(self, total, n_darts, num_180s):
+        self.n_darts = n_darts
+        self.num_180s = num_180s
+        self.three_dart_average = 3.0 * float(total) / float(n_darts)
+
+    def as_dict(self):
+        return dict(
+            three_dart_average=self.three_dart_average,
+            num_180s=self.num_180s,
+            n_darts=self.n_darts,
+        )
+
+
+def simulate_leg(
+        profile,
+        score_shot_types=None,
+        score_points=None,
+        total=501,
+        random_state=None,
+        ):
     """
     Simulate a leg of darts.
 
     Returns every three dart total.
 
-    :param profile: shot profile
-    :type profile: :py:class:`~darts.models.Profile`
+    :param profile: shot profile, or a compiled context in which case the
+        lookups are ignored
+    :type profile: :py:class:`~darts.models.Profile` or
+        :py:class:`~darts.sim.context.CompiledSimContext`
 
     :param dict score_shot_types: mapping from (score, dart_number) to
         shot types, as returned by `~load_lookups`
     :param dict score_points: mapping from (score, dart ID) to score tuple,
         as returned by `load_lookups`.
     :param int total: Total required to win a leg of darts (default: 501).
+    :param random_state: random stream to draw from (default: a new,
+        randomly seeded stream)
+    :type random_state: :py:class:`~darts.sim.streams.RandomStream`
 
     :return: List of lists holdingthree dart totals.
     :rtype: List[int]
     """
+    random_state = as_stream(random_state)
     all_three_dart_stats = []
     current_score = total
     while current_score > 0:
@@ -300,24 +474,55 @@ def simulate_leg(profile, score_shot_types, score_points, total=501):
             profile,
             score_shot_types,
             score_points,
+            random_state,
         )
         all_three_dart_stats.append(three_dart_stats)
 
     return LegStats(total, *all_three_dart_stats)
 
 
+def iter_legs(
+        profile,
+        score_shot_types=None,
+        score_points=None,
+        iterations=1000,
+        total=501,
+        random_state=None,
+        ):
+    """
+    Simulate a profile, yielding each leg's
+    :py:class:`LegStats` as soon as it has been thrown.
+
+    Takes the same arguments as `simulate_profile`.
+    """
+    random_state = as_stream(random_state)
+    for i in xrange(iterations):
+        yield simulate_leg(
+            profile,
+            score_shot_types,
+            score_points,
+            total,
+            random_state,
+        )
+        if i % 1000 == 0:
+            print('ran %s iterations' % i)
+
+
 def simulate_profile(
         profile,
-        score_shot_types,
-        score_points,
+        score_shot_types=None,
+        score_points=None,
         iterations=1000,
         total=501,
+        random_state=None,
         ):
     """
     Simulate a profile by simulating lots of legs.
 
-    :param profile: shot profile
-    :type profile: :py:class:`~darts.models.Profile`
+    :param profile: shot profile, or a compiled context in which case the
+        lookups are ignored
+    :type profile: :py:class:`~darts.models.Profile` or
+        :py:class:`~darts.sim.context.CompiledSimContext`
 
     :param dict score_shot_types: mapping from (score, dart_number) to
         shot types, as returned by `~load_lookups`
@@ -325,13 +530,47 @@ def simulate_profile(
         as returned by `load_lookups`.
     :param int iterations: Number of iterations to run (default: 10000).
     :param int total: Total required to win a leg of darts (default: 501).
+    :param random_state: random stream to draw from (default: a new,
+        randomly seeded stream)
+    :type random_state: :py:class:`~darts.sim.streams.RandomStream`
 
     """
-    legs = []
-    for i in xrange(iterations):
-        leg = simulate_leg(profile, score_shot_types, score_points, total)
-        legs.append(leg)
-        if i % 1000 == 0:
-            print('ran %s iterations' % i)
+    return list(iter_legs(
+        profile,
+        score_shot_types,
+        score_points,
+        iterations,
+        total,
+        random_state,
+    ))
 
-    return legs
+
+def accumulate_profile(
+        profile,
+        score_shot_types=None,
+        score_points=None,
+        iterations=1000,
+        total=501,
+        random_state=None,
+        keep_darts=False,
+        ):
+    """
+    Simulate a profile, keeping only running statistics of the legs.
+
+    Takes the same arguments as `simulate_profile`, plus:
+
+    :param bool keep_darts: also keep the full dart traces of every leg.
+
+    :rtype: :py:class:`~darts.sim.accumulate.LegAccumulator`
+    """
+    accumulator = LegAccumulator(keep_darts)
+    for leg in iter_legs(
+            profile,
+            score_shot_types,
+            score_points,
+            iterations,
+            total,
+            random_state,
+            ):
+        accumulator.add(leg)
+    return accumulator
@@ -0,0 +1,403 @@
+"""
+Paired comparisons of two profiles with common random numbers.
+
+Comparing two independent simulations of similar profiles needs a lot of
+iterations, as the noise in each dwarfs the difference between them. Here
+both profiles throw leg i with the same random numbers, dart for dart: the
+k-th dart either of them throws in leg i is decided by the same uniform
+draw, so a dart that one profile hits, a slightly better profile hits too.
+The per-leg differences are then far less noisy than the legs themselves.
+
+Match win probabilities are derived from the legs rather than simulated:
+both profiles' legs are paired with the same simulated opponent legs to
+estimate the probabilities of winning a leg throwing first and second, and
+the match result follows exactly, as in `~darts.sim.exact.match_wins`.
+"""
+from collections import namedtuple
+import logging
+
+import numpy as np
+
+from .adaptive import MIN_ITERATIONS, Z
+from .context import BIG_MISS_CHOICES
+from .exact import match_wins, MatchSolution
+from .streams import as_stream
+from .vectorized import BATCH_SIZE, dart_results, match_contexts
+
+
+log = logging.getLogger(__name__)
+
+
+BLOCK_DARTS = 32
+"Number of darts per leg drawn at a time by `CommonNumbers`"
+
+
+class CommonNumbers:
+
+    """
+    Uniform random numbers indexed by leg and dart.
+
+    Each dart uses two numbers: one for its result, and one to choose the
+    points of a random big miss. Numbers are drawn a block of
+    `BLOCK_DARTS` darts per leg at a time, each block from its own child
+    stream, so they don't depend on the order they're asked for in.
+
+    :param int iterations: number of legs
+    :param random_state: :py:class:`~darts.sim.streams.RandomStream`, or a
+        seed, to draw from (default: random).
+    """
+
+    def __init__(self, iterations, random_state=None):
+        self.iterations = iterations
+        self.random_state = as_stream(random_state)
+        self._blocks = []
+
+    def _block(self, block):
+        while len(self._blocks) <= block:
+            self._blocks.append(
+                self.random_state.child(len(self._blocks)).random_sample(
+                    (2, self.iterations, BLOCK_DARTS)
+                )
+            )
+        return self._blocks[block]
+
+    def draws(self, legs, darts):
+        """
+        Return the numbers for dart ``darts[i]`` of leg ``legs[i]``, as an
+        array of shape (2, len(legs)).
+        """
+        blocks, columns = np.divmod(darts, BLOCK_DARTS)
+        numbers = np.empty((2, legs.size))
+        for block in np.unique(blocks):
+            in_block = blocks == block
+            numbers[:, in_block] = self._block(block)[
+                :,
+                legs[in_block],
+                columns[in_block],
+            ]
+        return numbers
+
+
+def simulate_legs(context, numbers, total=501):
+    """
+    Simulate one leg per leg of ``numbers``, in lockstep.
+
+    Follows `~darts.sim.vectorized.simulate_visits`, except that each dart
+    takes its numbers from ``numbers``, according to its leg and how many
+    darts (including busted ones) the leg has thrown.
+
+    Returns a 3-tuple of arrays with one entry per leg: the darts counted,
+    the visits thrown and the number of 180s.
+
+    :param context: compiled context, as returned by
+        `~darts.sim.context.compile_context`
+    :param CommonNumbers numbers: the numbers to throw with
+    :param int total: Total required to win a leg of darts (default: 501).
+    """
+    shot_types, points = context.shot_types, context.points
+    thresholds = context.thresholds
+
+    iterations = numbers.iterations
+    leg_darts = np.zeros(iterations, dtype=np.int64)
+    leg_visits = np.zeros(iterations, dtype=np.int64)
+    leg_180s = np.zeros(iterations, dtype=np.int64)
+    thrown = np.zeros(iterations, dtype=np.int64)
+
+    legs = np.arange(iterations)
+    scores = np.empty(iterations, dtype=np.int32)
+    scores[:] = total
+    while legs.size:
+        new_scores = scores.copy()
+        n_darts = np.zeros(legs.size, dtype=np.int64)
+        throwing = np.arange(legs.size)
+        for dart_id in (1, 2, 3):
+            throwing_legs = legs[throwing]
+            result_draws, big_miss_draws = numbers.draws(
+                throwing_legs,
+                thrown[throwing_legs],
+            )
+            thrown[throwing_legs] += 1
+            _, result, points_scored = dart_results(
+                new_scores[throwing],
+                dart_id,
+                shot_types,
+                points,
+                thresholds,
+                result_draws,
+            )
+            big_misses = (result == 2) & (points_scored == 6)
+            points_scored[big_misses] = BIG_MISS_CHOICES[(
+                big_miss_draws[big_misses] * len(BIG_MISS_CHOICES)
+            ).astype(int)]
+            n_darts[throwing] = dart_id
+            new_scores[throwing] -= points_scored
+            throwing = throwing[new_scores[throwing] > 1]
+            if not throwing.size:
+                break
+
+        bust = (new_scores == 1) | (new_scores < 0)
+        new_scores[bust] = scores[bust]
+        n_darts[bust] = 0
+
+        leg_darts[legs] += n_darts
+        leg_visits[legs] += 1
+        leg_180s[legs] += (scores - new_scores) == 180
+
+        playing = new_scores != 0
+        legs, scores = legs[playing], new_scores[playing]
+
+    return leg_darts, leg_visits, leg_180s
+
+
+Difference = namedtuple('Difference', [
+    'a',
+    'b',
+    'difference',
+    'std_error',
+    'independent_std_error',
+])
+"""
+The estimates for profiles A and B of one statistic, the estimated
+difference (B minus A), its standard error, and the standard error the
+difference would have had from two independent simulations of the same
+size.
+"""
+
+
+def _difference(a_values, b_values):
+    n = len(a_values)
+    return Difference(
+        float(np.mean(a_values)),
+        float(np.mean(b_values)),
+        float(np.mean(b_values - a_values)),
+        float(np.std(b_values - a_values) / np.sqrt(n)),
+        float(np.sqrt((np.var(a_values) + np.var(b_values)) / n)),
+    )
+
+
+class PairedComparison:
+
+    """
+    The paired legs of two profiles, and of an optional opponent.
+
+    :param int total: Total required to win a leg of darts.
+    :param dict match_kwargs: match arguments for `match_win`; see
+        `~darts.sim.exact.match_wins`
+    """
+
+    def __init__(self, total=501, match_kwargs=None):
+        self.total = total
+        self.match_kwargs = match_kwargs or dict(match_type='match_play')
+        self.legs = {}
+
+    def __len__(self):
+        return len(self.legs['a'][0]) if self.legs else 0
+
+    def add(self, player, darts, visits, num_180s):
+        """
+        Add legs simulated by `simulate_legs` for player 'a', 'b' or
+        'opponent'.
+        """
+        new = (darts, visits, num_180s)
+        if player in self.legs:
+            new = [
+                np.concatenate([old, x])
+                for old, x in zip(self.legs[player], new)
+            ]
+        self.legs[player] = new
+
+    def three_dart_average(self):
+        """
+        Compare the mean three-dart averages of the legs.
+
+        :rtype: Difference
+        """
+        return _difference(
+            3.0 * self.total / self.legs['a'][0],
+            3.0 * self.total / self.legs['b'][0],
+        )
+
+    def avg_180s(self):
+        """
+        Compare the mean number of 180s per leg.
+
+        :rtype: Difference
+        """
+        return _difference(
+            self.legs['a'][2].astype(float),
+            self.legs['b'][2].astype(float),
+        )
+
+    def _win_prob(self, p_first, p_second):
+        return MatchSolution(
+            match_wins(p_first=p_first, p_second=p_second, **self.match_kwargs)
+        ).stats()['profile_a_win_percent']
+
+    def _match_influence(self, player):
+        # Each leg's contribution to the error in the match win
+        # probability, by the delta method.
+        visits = self.legs[player][1]
+        opponent_visits = self.legs['opponent'][1]
+        first = (visits <= opponent_visits).astype(float)
+        second = (visits < opponent_visits).astype(float)
+        p_first, p_second = first.mean(), second.mean()
+        win_prob = self._win_prob(p_first, p_second)
+        eps = 1e-6
+        d_first = (
+            self._win_prob(min(p_first + eps, 1), p_second) -
+            self._win_prob(max(p_first - eps, 0), p_second)
+        ) / (min(p_first + eps, 1) - max(p_first - eps, 0))
+        d_second = (
+            self._win_prob(p_first, min(p_second + eps, 1)) -
+            self._win_prob(p_first, max(p_second - eps, 0))
+        ) / (min(p_second + eps, 1) - max(p_second - eps, 0))
+        return win_prob, d_first * first + d_second * second
+
+    def match_win(self):
+        """
+        Compare the probabilities of beating the opponent.
+
+        :rtype: Difference
+        """
+        a_win, a_influence = self._match_influence('a')
+        b_win, b_influence = self._match_influence('b')
+        n = len(self)
+        return Difference(
+            a_win,
+            b_win,
+            b_win - a_win,
+            float(np.std(b_influence - a_influence) / np.sqrt(n)),
+            float(np.sqrt((np.var(a_influence) + np.var(b_influence)) / n)),
+        )
+
+    def differences(self):
+        """
+        Return a dict of every `Difference` available.
+        """
+        differences = dict(
+            three_dart_average=self.three_dart_average(),
+            avg_180s=self.avg_180s(),
+        )
+        if 'opponent' in self.legs:
+            differences['match_win'] = self.match_win()
+        return differences
+
+    def as_dict(self):
+        return dict(
+            iterations=len(self),
+            differences={
+                name: difference._asdict()
+                for name, difference in self.differences().items()
+            },
+        )
+
+
+def compare_profiles(
+        profile_a,
+        profile_b,
+        score_shot_types=None,
+        score_points=None,
+        opponent=None,
+        match_type='match_play',
+        legs_to_win=7,
+        total_legs=None,
+        total_sets=5,
+        iterations=10000,
+        total=501,
+        random_state=None,
+        tolerance=None,
+        win_tolerance=None,
+        batch_size=BATCH_SIZE,
+        min_iterations=MIN_ITERATIONS,
+        ):
+    """
+    Compare two profiles, e.g. a profile and a tuned copy of it, with
+    common random numbers.
+
+    Legs are simulated in batches of ``batch_size``. Without a tolerance,
+    ``iterations`` legs are simulated; with one, batches are simulated
+    until the 95% confidence interval half-widths on the differences are
+    within the tolerances, up to ``iterations`` legs.
+
+    :param profile_a: the first profile, or a compiled context
+    :param profile_b: the second profile, or a compiled context
+    :param dict score_shot_types: mapping from (score, dart_number) to
+        shot types, as returned by `~load_lookups`
+    :param dict score_points: mapping from (score, dart ID) to score tuple,
+        as returned by `load_lookups`.
+    :param opponent: optional profile for both profiles to play, to compare
+        their match win probabilities
+    :param str match_type: 'match_play', 'set_play' or 'premier_league'
+    :param int legs_to_win: legs required to win a match play match.
+    :param int total_legs: maximum legs in a match play match; overrides
+        ``legs_to_win``.
+    :param int total_sets: sets required to win a set play match.
+    :param int iterations: (maximum) number of legs to simulate.
+    :param int total: Total required to win a leg of darts (default: 501).
+    :param random_state: :py:class:`~darts.sim.streams.RandomStream`, or a
+        seed, from which each batch's numbers are derived (default: random).
+    :param float tolerance: target half-width on the difference in
+        three-dart average.
+    :param float win_tolerance: target half-width on the difference in
+        match win probability.
+    :param int batch_size: number of legs simulated at a time.
+    :param int min_iterations: legs to simulate before stopping early.
+
+    :rtype: PairedComparison
+    """
+    if win_tolerance is not None and opponent is None:
+        raise ValueError('win_tolerance needs an opponent')
+    random_state = as_stream(random_state)
+    context_a, context_b = match_contexts(
+        profile_a,
+        profile_b,
+        score_shot_types,
+        score_points,
+        total,
+    )
+    contexts = dict(a=context_a, b=context_b)
+    if opponent is not None:
+        contexts['opponent'] = match_contexts(context_a, opponent)[1]
+
+    comparison = PairedComparison(total, dict(
+        match_type=match_type,
+        legs_to_win=legs_to_win,
+        total_legs=total_legs,
+        total_sets=total_sets,
+    ))
+    batch = 0
+    while len(comparison) < iterations:
+        n = min(batch_size, iterations - len(comparison))
+        batch_random_state = random_state.child(batch)
+        batch += 1
+        # Both profiles throw with the same numbers; the opponent with its
+        # own.
+        numbers = CommonNumbers(n, batch_random_state.child(0))
+        for player in ('a', 'b'):
+            comparison.add(player, *simulate_legs(
+                contexts[player],
+                numbers,
+                total=total,
+            ))
+        if opponent is not None:
+            comparison.add('opponent', *simulate_legs(
+                contexts['opponent'],
+                CommonNumbers(n, batch_random_state.child(1)),
+                total=total,
+            ))
+
+        if tolerance is None and win_tolerance is None:
+            continue
+        if len(comparison) < min_iterations:
+            continue
+        differences = comparison.differences()
+        log.info('ran %s paired legs: %s', len(comparison), differences)
+        if tolerance is not None and (
+                Z * differences['three_dart_average'].std_error > tolerance):
+            continue
+        if win_tolerance is not None and (
+                Z * differences['match_win'].std_error > win_tolerance):
+            continue
+        break
+
+    return comparison
@@ -0,0 +1,343 @@
+"""
+Parallel execution of the vectorized simulators.
+
+The iterations of a simulation are split into fixed-size shards which are
+run across a process pool. Each shard draws from its own child of the
+simulation's random stream, identified by the shard's index, so results
+depend only on the seed and not on the number of processes.
+
+The compiled contexts are sent to each worker once, when the pool starts,
+rather than with every shard.
+"""
+from contextlib import contextmanager
+import logging
+import multiprocessing
+
+import numpy as np
+
+from . import vectorized
+from .accumulate import LegAccumulator
+from . import adaptive
+from .context import compile_context
+from .streams import as_stream
+
+
+log = logging.getLogger(__name__)
+
+
+SHARD_SIZE = 5000
+"Default number of iterations per shard"
+
+SHARDS_PER_BATCH = 8
+"Shards each batch of an adaptive simulation is split into"
+
+_contexts = None
+"The contexts of the current job, set in each worker process"
+
+
+def _init_worker(contexts):
+    global _contexts
+    _contexts = contexts
+
+
+def worker_contexts():
+    """
+    Return the contexts sent to this worker process by `run_shards`.
+    """
+    return _contexts
+
+
+def shard_iterations(iterations, shard_size=SHARD_SIZE):
+    """
+    Split a number of iterations into shards.
+
+    Returns a list of (first iteration, number of iterations) tuples.
+    """
+    return [
+        (start, min(shard_size, iterations - start))
+        for start in xrange(0, iterations, shard_size)
+    ]
+
+
+@contextmanager
+def shard_pool(contexts, processes=None):
+    """
+    Start a process pool for running several sets of shards against the
+    same contexts, which are sent to each worker once.
+
+    Yields a function taking ``fn`` and ``tasks`` as `run_shards` does,
+    which can be called until the block exits and the pool is closed.
+
+    :param tuple contexts: compiled contexts to send to each worker
+    :param int processes: number of processes (default: one per CPU); if
+        1, the tasks are run in this process instead
+    """
+    if processes == 1:
+        _init_worker(contexts)
+        yield lambda fn, tasks: [fn(task) for task in tasks]
+        return
+    pool = multiprocessing.Pool(
+        processes,
+        initializer=_init_worker,
+        initargs=(contexts,),
+    )
+    try:
+        yield lambda fn, tasks: pool.map(fn, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def run_shards(fn, tasks, contexts, processes=None):
+    """
+    Run ``fn`` over ``tasks`` in a process pool.
+
+    :param fn: module-level function taking a single task tuple; it can
+        read the contexts from ``_contexts``
+    :param list tasks: one task per shard
+    :param tuple contexts: compiled contexts to send to each worker
+    :param int processes: number of processes (default: one per CPU); if
+        1, the tasks are run in this process instead
+    :return: the results of ``fn``, in the same order as ``tasks``
+    """
+    with shard_pool(contexts, processes) as run:
+        return run(fn, tasks)
+
+
+def _simulate_visits_shard(task):
+    random_state, iterations, total = task
+    return vectorized.simulate_visits(
+        _contexts[0],
+        iterations=iterations,
+        total=total,
+        random_state=random_state,
+    )
+
+
+def _accumulate_profile_shard(task):
+    random_state, iterations, total, keep_darts = task
+    return vectorized.accumulate_profile(
+        _contexts[0],
+        iterations=iterations,
+        total=total,
+        random_state=random_state,
+        keep_darts=keep_darts,
+    )
+
+
+def _simulate_match_wins_shard(task):
+    random_state, kwargs = task
+    return vectorized.simulate_match_wins(
+        context_a=_contexts[0],
+        context_b=_contexts[1],
+        random_state=random_state,
+        **kwargs
+    )
+
+
+def simulate_profile(
+        profile,
+        score_shot_types=None,
+        score_points=None,
+        iterations=1000,
+        total=501,
+        random_state=None,
+        processes=None,
+        shard_size=SHARD_SIZE,
+        ):
+    """
+    Simulate a profile across a process pool.
+
+    Takes the same arguments as `~darts.sim.vectorized.simulate_profile`,
+    plus:
+
+    :param random_state: :py:class:`~darts.sim.streams.RandomStream`, or a
+        seed, from which each shard's stream is derived (default: random).
+    :param int processes: number of processes (default: one per CPU).
+    :param int shard_size: number of iterations per shard.
+
+    :rtype: :py:class:`~darts.sim.vectorized.LegBatch`
+    """
+    random_state = as_stream(random_state)
+    context = compile_context(
+        profile,
+        score_shot_types,
+        score_points,
+        max_score=total,
+    )
+    if not iterations:
+        return vectorized.simulate_profile(context, iterations=0, total=total)
+    shards = shard_iterations(iterations, shard_size)
+    results = run_shards(
+        _simulate_visits_shard,
+        [
+            (random_state.child(shard), n, total)
+            for shard, (_, n) in enumerate(shards)
+        ],
+        (context,),
+        processes=processes,
+    )
+    log.info('ran %s legs in %s shards', iterations, len(shards))
+
+    # Leg IDs are numbered from zero within each shard.
+    for (start, _), result in zip(shards, results):
+        result[0][:] += start
+    return vectorized.LegBatch(
+        total,
+        *[np.concatenate(x) for x in zip(*results)]
+    )
+
+
+def accumulate_profile(
+        profile,
+        score_shot_types=None,
+        score_points=None,
+        iterations=1000,
+        total=501,
+        random_state=None,
+        keep_darts=False,
+        processes=None,
+        shard_size=SHARD_SIZE,
+        ):
+    """
+    Simulate a profile across a process pool, keeping only running
+    statistics of the legs.
+
+    Takes the same arguments as `~darts.sim.vectorized.accumulate_profile`,
+    plus ``processes`` and ``shard_size`` as for `simulate_profile`. Each
+    worker returns an accumulator for its shard, and these are merged.
+
+    :rtype: :py:class:`~darts.sim.accumulate.LegAccumulator`
+    """
+    random_state = as_stream(random_state)
+    context = compile_context(
+        profile,
+        score_shot_types,
+        score_points,
+        max_score=total,
+    )
+    shards = shard_iterations(iterations, shard_size)
+    results = run_shards(
+        _accumulate_profile_shard,
+        [
+            (random_state.child(shard), n, total, keep_darts)
+            for shard, (_, n) in enumerate(shards)
+        ],
+        (context,),
+        processes=processes,
+    )
+    log.info('ran %s legs in %s shards', iterations, len(shards))
+
+    accumulator = LegAccumulator(keep_darts)
+    for result in results:
+        accumulator.merge(result)
+    return accumulator
+
+
+def simulate_match(
+        match_type,
+        profile_a,
+        profile_b,
+        score_shot_types=None,
+        score_points=None,
+        iterations=1000,
+        a_first=True,
+        a_handicap=0,
+        b_handicap=0,
+        legs_to_win=7,
+        total_legs=None,
+        total_sets=5,
+        total=501,
+        random_state=None,
+        processes=None,
+        shard_size=SHARD_SIZE,
+        tolerance=None,
+        score_tolerance=None,
+        ):
+    """
+    Simulate lots of matches between two profiles across a process pool.
+
+    Takes the same arguments as `~darts.sim.vectorized.simulate_match`,
+    plus:
+
+    :param random_state: :py:class:`~darts.sim.streams.RandomStream`, or a
+        seed, from which each shard's stream is derived (default: random).
+    :param int processes: number of processes (default: one per CPU).
+    :param int shard_size: number of iterations per shard.
+
+    With a ``tolerance``, the batches of
+    `~darts.sim.adaptive.simulate_until_precise` are as large as in a
+    serial run, `~darts.sim.adaptive.BATCH_SIZE`, so that it can stop as
+    early; each is split into `SHARDS_PER_BATCH` smaller shards, rather
+    than ``shard_size`` ones, and run across one pool kept for the whole
+    simulation.
+
+    :return: one :py:class:`~darts.sim.twoplayer.MatchStats` per match,
+        without leg details.
+    """
+    random_state = as_stream(random_state)
+    contexts = vectorized.match_contexts(
+        profile_a,
+        profile_b,
+        score_shot_types,
+        score_points,
+        total,
+    )
+    match_kwargs = dict(
+        match_type=match_type,
+        legs_to_win=legs_to_win,
+        total_legs=total_legs,
+        total_sets=total_sets,
+        total=total,
+    )
+
+    def simulate_batch(
+            run,
+            n,
+            batch_a_first,
+            batch_random_state,
+            batch_shard_size=shard_size,
+            ):
+        shards = shard_iterations(n, batch_shard_size)
+        results = run(
+            _simulate_match_wins_shard,
+            [
+                (batch_random_state.child(shard), dict(
+                    match_kwargs,
+                    iterations=shard_n,
+                    # Keep the first thrower alternating across shards.
+                    a_first=batch_a_first == (start % 2 == 0),
+                ))
+                for shard, (start, shard_n) in enumerate(shards)
+            ],
+        )
+        log.info('ran %s matches in %s shards', n, len(shards))
+        return vectorized.match_stats(
+            np.concatenate(results),
+            profile_a,
+            profile_b,
+            a_handicap,
+            b_handicap,
+        )
+
+    with shard_pool(contexts, processes) as run:
+        if tolerance is None:
+            return simulate_batch(run, iterations, a_first, random_state)
+        # The number of shards per batch, not of processes, fixes the
+        # shards, so the results still depend only on the seed.
+        batch_shard_size = -(-adaptive.BATCH_SIZE // SHARDS_PER_BATCH)
+        return adaptive.simulate_until_precise(
+            lambda n, batch_a_first, batch_random_state: simulate_batch(
+                run,
+                n,
+                batch_a_first,
+                batch_random_state,
+                batch_shard_size,
+            ),
+            iterations,
+            tolerance,
+            score_tolerance,
+            a_first=a_first,
+            random_state=random_state,
+            batch_size=adaptive.BATCH_SIZE,
+        )
@@ -0,0 +1,208 @@
+"""
+Round-robin simulations: every profile in a group against every other.
+
+The lookups are compiled once and shared by every profile's context, and
+all the contexts are sent to each worker process once. Each pairing is
+then simulated as one task, spread across the process pool, with its own
+child of the simulation's random stream.
+"""
+from collections import Counter
+import itertools
+import logging
+
+from . import parallel, vectorized
+from .context import compile_context, CompiledSimContext
+from .streams import as_stream
+
+
+log = logging.getLogger(__name__)
+
+
+def _simulate_pairing(task):
+    i, j, random_state, kwargs = task
+    contexts = parallel.worker_contexts()
+    return vectorized.simulate_match_wins(
+        context_a=contexts[i],
+        context_b=contexts[j],
+        random_state=random_state,
+        **kwargs
+    )
+
+
+def pairing_stats(wins):
+    """
+    Summarise the matches of one pairing.
+
+    :param wins: array of legs (or sets) won by each player, as returned by
+        `~darts.sim.vectorized.simulate_match_wins`
+    :return: the probabilities of A winning, B winning and a draw, and a
+        dict mapping each 'A score-B score' to its probability.
+    """
+    n = float(len(wins))
+    a_wins = int((wins[:, 0] > wins[:, 1]).sum())
+    b_wins = int((wins[:, 1] > wins[:, 0]).sum())
+    score_counter = Counter(map(tuple, wins.tolist()))
+    score_probs = {
+        '{}-{}'.format(*score): count / n
+        for score, count in score_counter.items()
+    }
+    return a_wins / n, b_wins / n, (n - a_wins - b_wins) / n, score_probs
+
+
+class MatchMatrix:
+
+    """
+    Head-to-head results of every pairing of a group of profiles.
+
+    Entry ``[i][j]`` of each matrix is from profile i's point of view
+    against profile j; the diagonal is None.
+
+    :param list profile_ids: IDs of the profiles, in matrix order
+    :param list names: names of the profiles, in matrix order
+    :param list win_probs: probability of profile i beating profile j
+    :param list draw_probs: probability of a draw
+    :param list score_probs: dict mapping each 'i score-j score' to its
+        probability
+    """
+
+    def __init__(self, profile_ids, names, win_probs, draw_probs, score_probs):
+        self.profile_ids = profile_ids
+        self.names = names
+        self.win_probs = win_probs
+        self.draw_probs = draw_probs
+        self.score_probs = score_probs
+
+    @classmethod
+    def from_pairings(cls, profiles, pairings):
+        """
+        Build the matrix from one result per unordered pair.
+
+        :param list profiles: the profiles, in matrix order
+        :param dict pairings: mapping from (i, j), with i < j, to the
+            output of `pairing_stats`
+        """
+        n = len(profiles)
+        win_probs = [[None] * n for _ in xrange(n)]
+        draw_probs = [[None] * n for _ in xrange(n)]
+        score_probs = [[None] * n for _ in xrange(n)]
+        for (i, j), (i_wins, j_wins, draws, scores) in pairings.items():
+            win_probs[i][j], win_probs[j][i] = i_wins, j_wins
+            draw_probs[i][j] = draw_probs[j][i] = draws
+            score_probs[i][j] = scores
+            score_probs[j][i] = {
+                '-'.join(reversed(score.split('-'))): p
+                for score, p in scores.items()
+            }
+        return cls(
+            [getattr(profile, 'id', None) for profile in profiles],
+            [str(profile) for profile in profiles],
+            win_probs,
+            draw_probs,
+            score_probs,
+        )
+
+    @classmethod
+    def from_dict(cls, matrix):
+        return cls(
+            matrix['profile_ids'],
+            matrix['names'],
+            matrix['win_probs'],
+            matrix['draw_probs'],
+            matrix['score_probs'],
+        )
+
+    def win_totals(self):
+        """
+        Return each profile's mean win probability across its pairings.
+        """
+        n = len(self.names)
+        if n < 2:
+            return [None] * n
+        return [
+            sum(p for p in row if p is not None) / (n - 1)
+            for row in self.win_probs
+        ]
+
+    def as_dict(self):
+        return dict(
+            profile_ids=self.profile_ids,
+            names=self.names,
+            win_probs=self.win_probs,
+            draw_probs=self.draw_probs,
+            score_probs=self.score_probs,
+        )
+
+
+def simulate_round_robin(
+        match_type,
+        profiles,
+        score_shot_types=None,
+        score_points=None,
+        iterations=1000,
+        legs_to_win=7,
+        total_legs=None,
+        total_sets=5,
+        total=501,
+        random_state=None,
+        processes=None,
+        ):
+    """
+    Simulate every pairing of a group of profiles.
+
+    Each pairing is simulated once, with the first thrower alternating
+    between matches, and its results are used from both sides.
+
+    :param str match_type: 'match_play', 'set_play' or 'premier_league'
+    :param list profiles: the profiles (or compiled contexts)
+    :param dict score_shot_types: mapping from (score, dart_number) to
+        shot types, as returned by `~load_lookups`
+    :param dict score_points: mapping from (score, dart ID) to score tuple,
+        as returned by `load_lookups`.
+    :param int iterations: Number of matches to simulate per pairing.
+    :param int legs_to_win: legs required to win a match play match.
+    :param int total_legs: maximum legs in a match play match; overrides
+        ``legs_to_win``.
+    :param int total_sets: sets required to win a set play match.
+    :param int total: Total required to win a leg of darts (default: 501).
+    :param random_state: :py:class:`~darts.sim.streams.RandomStream`, or a
+        seed, from which each pairing's stream is derived (default: random).
+    :param int processes: number of processes (default: one per CPU).
+
+    :rtype: MatchMatrix
+    """
+    random_state = as_stream(random_state)
+    first = compile_context(
+        profiles[0],
+        score_shot_types,
+        score_points,
+        max_score=total,
+    )
+    contexts = tuple([first] + [
+        profile if isinstance(profile, CompiledSimContext)
+        else first.for_profile(profile)
+        for profile in profiles[1:]
+    ])
+    pairs = list(itertools.combinations(xrange(len(profiles)), 2))
+    kwargs = dict(
+        match_type=match_type,
+        iterations=iterations,
+        legs_to_win=legs_to_win,
+        total_legs=total_legs,
+        total_sets=total_sets,
+        total=total,
+    )
+    results = parallel.run_shards(
+        _simulate_pairing,
+        [
+            (i, j, random_state.child(index), kwargs)
+            for index, (i, j) in enumerate(pairs)
+        ],
+        contexts,
+        processes=processes,
+    )
+    log.info('ran %s pairings of %s matches', len(pairs), iterations)
+
+    return MatchMatrix.from_pairings(
+        [getattr(p, 'profile', p) for p in profiles],
+        {pair: pairing_stats(wins) for pair, wins in zip(pairs, results)},
+    )
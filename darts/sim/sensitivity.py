@@ -0,0 +1,263 @@
+"""
+Sensitivity of a profile's results to its percentages.
+
+Each percentage in `PARAMETERS` is moved up and down by a small step, and
+every variant of the profile is solved exactly (see `~darts.sim.exact`),
+sharing one set of compiled lookups and, for the match win probability,
+one solution of the opponent's leg. The derivatives are central
+differences, so they carry no sampling noise; their uncertainty is the
+truncation error, estimated by comparing the differences over a full and
+a half step.
+"""
+from collections import namedtuple
+import logging
+
+from .context import compile_context, profile_key
+from .knockout import WinProbabilityTable
+
+
+log = logging.getLogger(__name__)
+
+
+PARAMETERS = [
+    ('treble_hit_pct', 'treble_miss_pct'),
+    ('treble_big_miss_pct', 'treble_miss_pct'),
+    ('double_hit_pct', 'double_miss_inside_pct'),
+    ('double_miss_outside_pct', 'double_miss_inside_pct'),
+    ('bullseye_hit_pct', 'bullseye_miss_pct'),
+    ('outer_bull_hit_pct', 'outer_bull_miss_pct'),
+]
+"""
+Profile percentages that affect how a profile throws, each with the
+percentage that absorbs a change to it so that the shot's percentages
+still add up to 100
+"""
+
+METRICS = [
+    'three_dart_average',
+    'expected_darts',
+    'avg_180s',
+    'win_prob',
+]
+"Results whose derivatives are found; win_prob needs an opponent"
+
+DEFAULT_STEP = 1.0
+"Default step, in percentage points"
+
+
+class PerturbedProfile:
+
+    """
+    A copy of a profile's percentages with one moved by ``delta``
+    percentage points, and its balancing percentage moved the other way.
+    """
+
+    def __init__(self, profile, parameter, balance, delta):
+        for column, _ in PARAMETERS:
+            setattr(self, column, float(getattr(profile, column)))
+        for _, column in PARAMETERS:
+            setattr(self, column, float(getattr(profile, column)))
+        setattr(self, parameter, getattr(self, parameter) + delta)
+        setattr(self, balance, getattr(self, balance) - delta)
+        self.name = '{} ({} {:+g})'.format(profile, parameter, delta)
+
+    @property
+    def valid(self):
+        return all(
+            0 <= getattr(self, column) <= 100
+            for pair in PARAMETERS
+            for column in pair
+        )
+
+    def __str__(self):
+        return self.name
+
+
+Derivative = namedtuple('Derivative', [
+    'parameter',
+    'metric',
+    'value',
+    'derivative',
+    'error',
+    'method',
+])
+"""
+The derivative of a metric with respect to a parameter, per percentage
+point, and an estimate of its error. ``method`` is 'central', or
+'forward' or 'backward' where the parameter is too near 0 or 100 to step
+both ways.
+"""
+
+
+class SensitivityResult:
+
+    """
+    The derivatives of every metric with respect to every parameter.
+
+    :param dict values: the value of each metric for the profile itself
+    :param list derivatives: `Derivative` tuples
+    :param float step: step used, in percentage points
+    """
+
+    def __init__(self, values, derivatives, step=DEFAULT_STEP):
+        self.values = values
+        self.derivatives = derivatives
+        self.step = step
+
+    @property
+    def metrics(self):
+        return [metric for metric in METRICS if metric in self.values]
+
+    def ranked(self, metric='three_dart_average'):
+        """
+        Return the derivatives of a metric, largest in magnitude first.
+        """
+        return sorted(
+            (d for d in self.derivatives if d.metric == metric),
+            key=lambda d: -abs(d.derivative),
+        )
+
+    @classmethod
+    def from_dict(cls, result):
+        return cls(
+            result['values'],
+            [Derivative(**d) for d in result['derivatives']],
+            result['step'],
+        )
+
+    def as_dict(self):
+        return dict(
+            values=self.values,
+            derivatives=[dict(d._asdict()) for d in self.derivatives],
+            step=self.step,
+        )
+
+
+def _difference(evaluate, profile, parameter, balance, step):
+    """
+    Return the differences of every metric over a step of ``step`` and of
+    ``step / 2``, and the method used.
+    """
+    def variant(delta):
+        perturbed = PerturbedProfile(profile, parameter, balance, delta)
+        return perturbed if perturbed.valid else None
+
+    up, down = variant(step), variant(-step)
+    if up is not None and down is not None:
+        method, deltas = 'central', (step, -step, step / 2, -step / 2)
+    elif up is not None:
+        method, deltas = 'forward', (step, 0, step / 2, 0)
+    elif down is not None:
+        method, deltas = 'backward', (0, -step, 0, -step / 2)
+    else:
+        return None, None, None
+
+    hi, lo, half_hi, half_lo = [
+        evaluate(variant(delta) if delta else profile) for delta in deltas
+    ]
+    full = {
+        metric: (hi[metric] - lo[metric]) / (deltas[0] - deltas[1])
+        for metric in hi
+    }
+    half = {
+        metric: (half_hi[metric] - half_lo[metric]) / (deltas[2] - deltas[3])
+        for metric in hi
+    }
+    return full, half, method
+
+
+def analyse_profile(
+        profile,
+        score_shot_types=None,
+        score_points=None,
+        opponent=None,
+        match_type='match_play',
+        legs_to_win=7,
+        total_legs=None,
+        total_sets=5,
+        total=501,
+        step=DEFAULT_STEP,
+        ):
+    """
+    Find the derivative of each of a profile's results with respect to each
+    of its percentages.
+
+    The derivative reported is the difference over half a step, and its
+    error the change from the difference over a full step.
+
+    :param profile: shot profile
+    :type profile: :py:class:`~darts.models.Profile`
+    :param dict score_shot_types: mapping from (score, dart_number) to
+        shot types, as returned by `~darts.sim.load_lookups`
+    :param dict score_points: mapping from (score, dart ID) to score tuple,
+        as returned by `~darts.sim.load_lookups`.
+    :param opponent: profile to find the match win probability against
+        (optional); each player is equally likely to throw first.
+    :param str match_type: 'match_play', 'set_play' or 'premier_league'
+    :param int legs_to_win: legs required to win a match play match.
+    :param int total_legs: maximum legs in a match play match; overrides
+        ``legs_to_win``.
+    :param int total_sets: sets required to win a set play match.
+    :param int total: Total required to win a leg of darts (default: 501).
+    :param float step: step, in percentage points.
+
+    :rtype: SensitivityResult
+    """
+    base = compile_context(
+        profile,
+        score_shot_types,
+        score_points,
+        max_score=total,
+    )
+    table = WinProbabilityTable(
+        match_type,
+        legs_to_win=legs_to_win,
+        total_legs=total_legs,
+        total_sets=total_sets,
+        total=total,
+    )
+    if opponent is not None:
+        opponent = base.for_profile(opponent)
+    solved = {}
+
+    def evaluate(variant):
+        context = base.for_profile(variant)
+        key = profile_key(context)
+        if key not in solved:
+            leg = table.leg_solution(context)
+            metrics = dict(
+                three_dart_average=leg.three_dart_average,
+                expected_darts=leg.expected_darts,
+                avg_180s=leg.avg_180s,
+            )
+            if opponent is not None:
+                metrics['win_prob'] = table.win_prob(context, opponent)
+            solved[key] = metrics
+        return solved[key]
+
+    values = evaluate(profile)
+    derivatives = []
+    for parameter, balance in PARAMETERS:
+        full, half, method = _difference(
+            evaluate,
+            profile,
+            parameter,
+            balance,
+            step,
+        )
+        if method is None:
+            continue
+        derivatives.extend(
+            Derivative(
+                parameter,
+                metric,
+                float(getattr(profile, parameter)),
+                half[metric],
+                abs(half[metric] - full[metric]),
+                method,
+            )
+            for metric in METRICS if metric in values
+        )
+
+    log.info('solved %s variants of %s', len(solved), profile)
+    return SensitivityResult(values, derivatives, step)
@@ -0,0 +1,503 @@
+"""
+Profile-specific checkout strategies.
+
+The score lookups say what to aim at from each score and dart, and are
+shared by every profile, even though a profile that rarely hits a double
+would do better to aim differently. `solve_strategy` finds, for one
+profile, the shot at each (score, dart) that minimises the expected number
+of darts needed to finish a leg, choosing from the shots that appear in
+the lookups (plus every single and double), and returns it as lookups of
+its own.
+
+Darts are counted as thrown: a visit that doesn't finish the leg costs
+three darts, busts included, so the strategy can't save darts by busting.
+A leg must be finished by hitting a double or the bull; reaching zero any
+other way is a bust, so the strategy never plans to check out on a single
+or a treble.
+
+The simulators and `~darts.sim.exact.solve_leg` don't apply that rule:
+any dart that reaches zero finishes a leg there. So a strategy's
+``expected_darts`` is what it would take under the double-out rule, not
+what simulating it gives, which is usually a little less, as a miss that
+happens to reach zero still finishes.
+
+The value of a (score, dart) depends on the score at the start of the
+visit, which a bust returns to, but the lookups can't: so the strategy is
+improved by policy iteration, weighing each visit start score by how often
+it leads to that (score, dart) in a leg. Every evaluation is exact.
+
+Solved strategies are stored in the ``profile_score_lookups`` table, and
+deleted by the listeners at the bottom of this module when the profile or
+the shared lookups change; `~darts.jobs.solve_profile_lookups` solves them
+again.
+"""
+from collections import Counter, defaultdict
+import hashlib
+import logging
+
+import numpy as np
+
+from darts import models
+from darts.models import DartEnum, ShotTypeEnum
+
+from .cache import lookups_hash, register_invalidation
+from .context import (
+    DEFAULT_POINTS,
+    DEFAULT_SHOT_TYPE,
+    SHOT_TYPE_IDS,
+    profile_thresholds,
+)
+from .exact import shot_outcomes
+
+
+log = logging.getLogger(__name__)
+
+
+MAX_ITERATIONS = 20
+"Default limit on the number of policy improvement steps"
+
+TOLERANCE = 1e-9
+"Expected darts a shot must save to replace the current one"
+
+
+def candidate_shots(score_shot_types, score_points):
+    """
+    Return the shots a strategy may choose from: every target aimed for in
+    the lookups, the default shot, and every single and double.
+
+    A target is a shot type and the points for hitting it. The lookups
+    may give one target different miss points at different scores, so
+    each target is paired with the points tuple the lookups give it most
+    often, rather than with points taken from another score's context.
+
+    :param dict score_shot_types: mapping from (score, dart_number) to
+        shot types, as returned by `~darts.sim.load_lookups`
+    :param dict score_points: mapping from (score, dart ID) to score tuple,
+        as returned by `~darts.sim.load_lookups`.
+    :return: sorted list of (shot type, points tuple).
+    """
+    counts = defaultdict(Counter)
+    for key, shot_type in score_shot_types.items():
+        points = tuple(score_points[key])
+        counts[(shot_type, points[0])][points] += 1
+    targets = {
+        target: max(sorted(points), key=points.get)
+        for target, points in counts.items()
+    }
+    targets.setdefault((DEFAULT_SHOT_TYPE, DEFAULT_POINTS[0]), DEFAULT_POINTS)
+    for n in xrange(1, 21):
+        targets.setdefault((ShotTypeEnum.Single, n), (n, None, None))
+        targets.setdefault((ShotTypeEnum.Double, 2 * n), (2 * n, n, 0))
+    return sorted(
+        ((shot_type, points) for (shot_type, _), points in targets.items()),
+        key=lambda shot: (shot[0].value, shot[1]),
+    )
+
+
+class CheckoutStrategy:
+
+    """
+    The shot to aim for at each (score, dart), and its expected darts.
+
+    :param list shots: (shot type, points tuple) of each candidate shot
+    :param policy: integer array of shape (total + 1, 4) holding the index
+        of the shot aimed for at each score and dart ID
+    :param expected_darts: expected darts to finish from the start of a
+        visit at each score, under the double-out rule (see the module
+        docstring)
+    """
+
+    def __init__(self, shots, policy, expected_darts):
+        self.shots = shots
+        self.policy = policy
+        self.expected_darts = expected_darts
+
+    @property
+    def total(self):
+        return len(self.expected_darts) - 1
+
+    def lookups(self):
+        """
+        Return the strategy in the form returned by
+        `~darts.sim.load_lookups`.
+        """
+        # Imported here as darts.sim imports this module.
+        from darts.sim import QuietDict
+        score_shot_types = QuietDict()
+        score_points = QuietDict()
+        for score in xrange(2, self.total + 1):
+            for dart in DartEnum:
+                shot_type, points = self.shots[self.policy[score, int(dart)]]
+                score_shot_types[(score, dart)] = shot_type
+                score_points[(score, dart)] = points
+        return score_shot_types, score_points
+
+    def rows(self, profile_id):
+        """
+        Return the strategy as
+        :py:class:`~darts.models.ProfileScoreLookup` rows.
+        """
+        score_shot_types, score_points = self.lookups()
+        return [
+            models.ProfileScoreLookup(
+                profile_id=profile_id,
+                score=score,
+                dart=dart,
+                shot_type=shot_type.value,
+                hit_points=score_points[(score, dart)][0],
+                miss_points=score_points[(score, dart)][1],
+                big_miss_points=score_points[(score, dart)][2],
+            )
+            for (score, dart), shot_type in sorted(score_shot_types.items())
+        ]
+
+
+def _shot_table(shots, thresholds):
+    """
+    Return the points, probability and whether it may finish a leg of
+    each outcome of each shot, as arrays of shape (shots, outcomes).
+    """
+    shot_types = np.array([SHOT_TYPE_IDS[t] for t, _ in shots])
+    points = np.array([[p or 0 for p in pts] for _, pts in shots])
+    outcome_points, outcome_probs = shot_outcomes(
+        shot_types,
+        points,
+        thresholds,
+    )
+    # Only hitting a double or the bull checks out; reaching zero any
+    # other way is a bust.
+    checkouts = np.zeros(outcome_points.shape, dtype=bool)
+    checkouts[:, 0] = [
+        shot_type == ShotTypeEnum.Double or
+        (shot_type == ShotTypeEnum.Bull and pts[0] == 50)
+        for shot_type, pts in shots
+    ]
+    return outcome_points, outcome_probs, checkouts
+
+
+def _initial_policy(shots, score_shot_types, score_points, total):
+    index = {
+        (shot_type, points[0]): i
+        for i, (shot_type, points) in enumerate(shots)
+    }
+    policy = np.empty((total + 1, 4), dtype=np.int32)
+    policy[:] = index[(DEFAULT_SHOT_TYPE, DEFAULT_POINTS[0])]
+    for key, shot_type in score_shot_types.items():
+        score, dart = key
+        if score <= total:
+            policy[score, int(dart)] = index[
+                (shot_type, score_points[key][0])
+            ]
+    return policy
+
+
+def _sweep(
+        outcome_points,
+        outcome_probs,
+        checkouts,
+        total,
+        policy,
+        start_values=None,
+        ):
+    """
+    Evaluate a policy, or improve it, working up from the lowest scores.
+
+    Within a visit that started from ``v``, the expected darts still to
+    come from score ``s`` before dart ``d`` is ``a[d, s] + b[d, s] * V(v)``,
+    where ``b`` is the probability of busting and ``V`` the expected darts
+    from the start of a visit. Outcomes scoring nothing leave the score at
+    ``s``, so until ``V(s)`` is known they're carried separately in ``c``.
+
+    :param policy: the policy to evaluate, which is updated in place if
+        ``start_values`` is given
+    :param start_values: array of shape (4, total + 1) holding the mean
+        value of the start of the visit at each (dart, score) to weigh
+        busts by when choosing a shot for darts 2 and 3; the first dart
+        is chosen exactly.
+    :return: expected darts from the start of a visit at each score.
+    """
+    values = np.zeros(total + 1)
+    a = np.zeros((5, total + 1))
+    b = np.zeros((5, total + 1))
+    improve = start_values is not None
+
+    for score in xrange(2, total + 1):
+        new_scores = score - outcome_points
+        finish = (new_scores == 0) & checkouts
+        bust = (new_scores < 2) & ~finish
+        stay = new_scores == score
+        lower = ~(finish | bust | stay)
+        index = np.where(lower, new_scores, 0)
+        bust_probs = np.where(bust, outcome_probs, 0).sum(axis=-1)
+        stay_probs = np.where(stay, outcome_probs, 0)
+        lower_probs = np.where(lower, outcome_probs, 0)
+
+        c = np.zeros(4)
+        for dart in (3, 2, 1):
+            if dart == 3:
+                shot_a = 1 + (lower_probs * values[index]).sum(axis=-1)
+                shot_b = bust_probs
+                shot_c = stay_probs.sum(axis=-1)
+            else:
+                shot_a = (
+                    1 + (3 - dart) * bust_probs +
+                    (lower_probs * a[dart + 1][index]).sum(axis=-1) +
+                    stay_probs.sum(axis=-1) * a[dart + 1, score]
+                )
+                shot_b = (
+                    bust_probs +
+                    (lower_probs * b[dart + 1][index]).sum(axis=-1) +
+                    stay_probs.sum(axis=-1) * b[dart + 1, score]
+                )
+                shot_c = stay_probs.sum(axis=-1) * c[dart + 1]
+
+            if improve:
+                if dart == 1:
+                    cost = shot_a / np.maximum(1 - shot_b - shot_c, 1e-12)
+                else:
+                    cost = shot_a + (
+                        shot_b * start_values[dart, score] +
+                        shot_c * start_values[0, score]
+                    )
+                # Keep the current shot unless another is strictly better,
+                # so that ties don't stop the iteration converging.
+                best = np.argmin(cost)
+                if cost[best] < cost[policy[score, dart]] - TOLERANCE:
+                    policy[score, dart] = best
+            shot = policy[score, dart]
+            a[dart, score] = shot_a[shot]
+            b[dart, score] = shot_b[shot]
+            c[dart] = shot_c[shot]
+
+        values[score] = a[1, score] / (1 - b[1, score] - c[1])
+        a[2:4, score] += c[2:4] * values[score]
+
+    return values
+
+
+def _start_values(
+        outcome_points,
+        outcome_probs,
+        checkouts,
+        total,
+        policy,
+        values,
+        ):
+    """
+    Return the mean value of the start of the visit at each (dart, score)
+    in a leg from ``total`` under a policy, in the form `_sweep` takes.
+    Row 0 holds the values themselves, which are used for any (dart,
+    score) the leg never reaches.
+    """
+    size = (total + 1) ** 2
+    start = np.arange(2, total + 1)
+    score = start.copy()
+    prob = np.ones(start.size)
+    reached = [None] * 4
+    end_keys, end_probs = [], []
+    for dart in (1, 2, 3):
+        reached[dart] = (start, score, prob)
+        shot = policy[score, dart]
+        start = np.repeat(start, outcome_points.shape[-1])
+        new_score = np.repeat(score, outcome_points.shape[-1])
+        new_score -= outcome_points[shot].ravel()
+        prob = (prob[:, np.newaxis] * outcome_probs[shot]).ravel()
+        # Busts return to the start of the visit; a finish ends the leg.
+        bust = (new_score < 2) & ~(
+            (new_score == 0) & checkouts[shot].ravel()
+        )
+        end_keys.append(start[bust] * (total + 1) + start[bust])
+        end_probs.append(prob[bust])
+        playing = (new_score > 1) & (prob > 0)
+        totals = np.bincount(
+            start[playing] * (total + 1) + new_score[playing],
+            weights=prob[playing],
+            minlength=size,
+        )
+        keys = np.flatnonzero(totals)
+        start, score = np.divmod(keys, total + 1)
+        prob = totals[keys]
+    end_keys.append(start * (total + 1) + score)
+    end_probs.append(prob)
+
+    # Expected number of visits starting from each score.
+    transitions = np.bincount(
+        np.concatenate(end_keys),
+        weights=np.concatenate(end_probs),
+        minlength=size,
+    ).reshape(total + 1, total + 1)
+    visits = np.zeros(total + 1)
+    incoming = np.zeros(total + 1)
+    incoming[total] = 1
+    for v in xrange(total, 1, -1):
+        visits[v] = incoming[v] / (1 - transitions[v, v])
+        incoming[:v] += visits[v] * transitions[v, :v]
+
+    start_values = np.empty((4, total + 1))
+    start_values[:] = values
+    for dart in (2, 3):
+        start, score, prob = reached[dart]
+        weights = visits[start] * prob
+        weight = np.bincount(score, weights, minlength=total + 1)
+        value = np.bincount(score, weights * values[start], total + 1)
+        seen = weight > 0
+        start_values[dart, seen] = value[seen] / weight[seen]
+    return start_values
+
+
+def solve_strategy(
+        profile,
+        score_shot_types,
+        score_points,
+        total=501,
+        max_iterations=MAX_ITERATIONS,
+        ):
+    """
+    Find the checkout strategy that minimises a profile's expected darts to
+    finish a leg from ``total``.
+
+    Starts from the targets the lookups aim for, so the result is never
+    worse than them.
+
+    :param profile: shot profile or compiled context
+    :type profile: :py:class:`~darts.models.Profile` or
+        :py:class:`~darts.sim.context.CompiledSimContext`
+    :param dict score_shot_types: mapping from (score, dart_number) to
+        shot types, as returned by `~darts.sim.load_lookups`
+    :param dict score_points: mapping from (score, dart ID) to score tuple,
+        as returned by `~darts.sim.load_lookups`.
+    :param int total: highest score to solve for (default: 501).
+    :param int max_iterations: limit on the number of improvement steps.
+
+    :rtype: CheckoutStrategy
+    """
+    thresholds = getattr(profile, 'thresholds', None)
+    if thresholds is None:
+        thresholds = profile_thresholds(profile)
+    shots = candidate_shots(score_shot_types, score_points)
+    outcome_points, outcome_probs, checkouts = _shot_table(shots, thresholds)
+    policy = _initial_policy(shots, score_shot_types, score_points, total)
+    values = _sweep(outcome_points, outcome_probs, checkouts, total, policy)
+    best = CheckoutStrategy(shots, policy.copy(), values)
+
+    for iteration in xrange(max_iterations):
+        start_values = _start_values(
+            outcome_points,
+            outcome_probs,
+            checkouts,
+            total,
+            policy,
+            values,
+        )
+        previous = policy.copy()
+        values = _sweep(
+            outcome_points,
+            outcome_probs,
+            checkouts,
+            total,
+            policy,
+            start_values,
+        )
+        if values[total] < best.expected_darts[total]:
+            best = CheckoutStrategy(shots, policy.copy(), values)
+        if (policy == previous).all():
+            break
+
+    log.info(
+        'solved strategy in %s iterations: %.3f expected darts',
+        iteration + 1,
+        best.expected_darts[total],
+    )
+    return best
+
+
+def lookups_version(score_shot_types, score_points):
+    """
+    Return the version of the lookups to cache match results under when
+    each profile throws with its own strategy; see
+    `~darts.sim.cache.MatchCache`.
+
+    A profile's strategy depends only on the profile and the shared
+    lookups, so this depends only on the shared lookups.
+    """
+    return hashlib.sha1(
+        'strategy:' + lookups_hash(score_shot_types, score_points)
+    ).hexdigest()
+
+
+def load_strategy_lookups(session, profile, score_shot_types, score_points):
+    """
+    Fetch a profile's own lookups from the database, solving and storing
+    them first if they aren't there.
+
+    New rows are added to the session but not committed.
+
+    :param session: database session
+    :param profile: shot profile
+    :type profile: :py:class:`~darts.models.Profile`
+    :param dict score_shot_types: the shared lookups to solve from, as
+        returned by `~darts.sim.load_lookups`
+    :param dict score_points: the shared lookups to solve from, as
+        returned by `~darts.sim.load_lookups`
+
+    :return: the profile's lookups, in the form returned by
+        `~darts.sim.load_lookups`.
+    """
+    # Imported here as darts.sim imports this module.
+    from darts.sim import QuietDict
+    rows = (
+        session.query(models.ProfileScoreLookup)
+        .filter(models.ProfileScoreLookup.profile_id == profile.id)
+        .all()
+    )
+    if not rows:
+        log.info('no strategy stored for %r, solving it', profile)
+        return save_strategy(
+            session,
+            profile,
+            solve_strategy(profile, score_shot_types, score_points),
+        )
+
+    profile_shot_types = QuietDict()
+    profile_points = QuietDict()
+    for row in rows:
+        key = (row.score, row.dart)
+        profile_shot_types[key] = ShotTypeEnum(row.shot_type)
+        profile_points[key] = (
+            row.hit_points,
+            row.miss_points,
+            row.big_miss_points,
+        )
+    return profile_shot_types, profile_points
+
+
+def save_strategy(session, profile, strategy):
+    """
+    Replace a profile's stored lookups with a solved strategy.
+
+    The rows are added to the session but not committed.
+
+    :return: the strategy's lookups, as returned by
+        `CheckoutStrategy.lookups`.
+    """
+    (
+        session.query(models.ProfileScoreLookup)
+        .filter(models.ProfileScoreLookup.profile_id == profile.id)
+        .delete(synchronize_session=False)
+    )
+    session.add_all(strategy.rows(profile.id))
+    return strategy.lookups()
+
+
+def _delete_profile_entries(connection, profile):
+    table = models.ProfileScoreLookup.__table__
+    connection.execute(
+        table.delete().where(table.c.profile_id == profile.id)
+    )
+
+
+def _delete_all_entries(connection):
+    connection.execute(models.ProfileScoreLookup.__table__.delete())
+
+
+register_invalidation(_delete_profile_entries, _delete_all_entries)
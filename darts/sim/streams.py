@@ -0,0 +1,122 @@
+"""
+Reproducible, splittable random streams for the simulators.
+
+Every simulator takes an explicit `RandomStream` rather than drawing from
+the global :py:mod:`random` module, so a simulation can be replayed from its
+seed, and independent child streams can be handed to parallel workers.
+"""
+import numpy as np
+
+
+BLOCK_SIZE = 4096
+"Number of uniform random numbers drawn at a time for scalar draws"
+
+MAX_SEED = 2 ** 31 - 1
+"Largest seed returned by `new_seed`"
+
+
+def new_seed():
+    """
+    Return a new random seed, suitable for storing with a simulation.
+    """
+    return int(np.random.randint(MAX_SEED))
+
+
+class RandomStream:
+
+    """
+    A seeded stream of random numbers.
+
+    A stream is identified by its seed and a path of child indices; the
+    underlying :py:class:`numpy.random.RandomState` is seeded from both, so
+    children of the same stream are independent of each other and of their
+    parent, and can be recreated from just their seed and path.
+
+    Scalar draws (`random`, `choice` without a size) are served from blocks
+    of `BLOCK_SIZE` numbers rather than one call per draw. Array draws
+    (`random_sample`, `choice` with a size) go straight to the underlying
+    state, so a stream can be used anywhere a RandomState is expected.
+
+    :param int seed: seed for the stream (default: a new random seed)
+    :param tuple path: child indices identifying the stream
+    """
+
+    def __init__(self, seed=None, path=()):
+        self.seed = new_seed() if seed is None else int(seed)
+        self.path = tuple(path)
+        self.n_children = 0
+        self._random_state = None
+        self._block = iter(())
+
+    @property
+    def random_state(self):
+        if self._random_state is None:
+            self._random_state = np.random.RandomState(
+                [self.seed] + list(self.path)
+            )
+        return self._random_state
+
+    def child(self, index):
+        """
+        Return the child stream with the given index.
+        """
+        return RandomStream(self.seed, self.path + (index,))
+
+    def spawn(self, n):
+        """
+        Return ``n`` new child streams.
+
+        Repeated calls return different children, in a reproducible order.
+        """
+        children = [
+            self.child(index)
+            for index in xrange(self.n_children, self.n_children + n)
+        ]
+        self.n_children += n
+        return children
+
+    def random(self):
+        """
+        Return a uniform random float in [0, 1).
+        """
+        try:
+            return next(self._block)
+        except StopIteration:
+            self._block = iter(
+                self.random_state.random_sample(BLOCK_SIZE).tolist()
+            )
+            return next(self._block)
+
+    def random_sample(self, size=None):
+        return self.random_state.random_sample(size)
+
+    def choice(self, a, size=None):
+        if size is None:
+            return a[int(self.random() * len(a))]
+        return self.random_state.choice(a, size)
+
+    def __getstate__(self):
+        # Don't send the generator state or any buffered numbers to other
+        # processes; the stream can be recreated from its seed and path.
+        return dict(seed=self.seed, path=self.path, n_children=0)
+
+    def __setstate__(self, state):
+        self.__init__(state['seed'], state['path'])
+
+    def __repr__(self):
+        return '<RandomStream(seed=%s, path=%s)>' % (self.seed, self.path)
+
+
+def as_stream(random_state=None):
+    """
+    Return a `RandomStream` for the given argument.
+
+    :param random_state: a `RandomStream`, which is returned as is; a
+        :py:class:`numpy.random.RandomState` to draw a seed from; a seed; or
+        None for a new random seed.
+    """
+    if isinstance(random_state, RandomStream):
+        return random_state
+    if isinstance(random_state, np.random.RandomState):
+        return RandomStream(random_state.randint(MAX_SEED))
+    return RandomStream(random_state)
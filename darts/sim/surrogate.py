@@ -0,0 +1,343 @@
+"""
+A precomputed grid of profile results, for looking up any profile's
+expected results without solving or simulating anything.
+
+The grid spans the percentages in `AXES`; at each point the leg is solved
+exactly (see `~darts.sim.exact`) and the results in `STATISTICS` are
+stored. A profile's results are then interpolated multilinearly between
+the grid points surrounding it, which takes microseconds.
+
+Building the grid takes a few minutes across a process pool, so it is
+done offline and saved to a compressed array file::
+
+    python -m darts.sim.surrogate --output surrogate_grid.npz
+
+The file records the hash of the lookups it was built with (see
+`~darts.sim.cache.lookups_hash`), so that a stale grid can be spotted.
+"""
+import argparse
+import bisect
+import itertools
+import logging
+import os
+import sys
+
+import numpy as np
+
+from darts import models, settings
+from . import exact, parallel
+from .cache import lookups_hash
+from .context import compile_context
+
+
+log = logging.getLogger(__name__)
+
+
+AXES = [
+    ('treble_hit_pct', np.linspace(10, 60, 11)),
+    ('treble_big_miss_pct', np.array([0, 10, 20, 30])),
+    ('double_hit_pct', np.linspace(10, 55, 10)),
+    ('double_miss_outside_pct', np.array([10, 20, 30])),
+    ('bullseye_hit_pct', np.array([5, 20, 35])),
+]
+"""
+Default grid: the profile percentages it spans, and the values of each.
+The treble, double and bullseye miss percentages make up each shot's
+percentages to 100, and the outer bull hit percentage follows the
+bullseye's (see `OUTER_BULL_MARGIN`).
+"""
+
+OUTER_BULL_MARGIN = 20
+"""
+How much more often than the bullseye a grid profile hits the outer bull,
+in percentage points
+"""
+
+QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+"Quantiles of the darts per leg stored at each grid point"
+
+STATISTICS = [
+    'three_dart_average',
+    'avg_180s',
+    'checkout_percent',
+    'expected_darts',
+] + ['darts_q{:d}'.format(int(100 * q)) for q in QUANTILES]
+"Results stored at each grid point, all per leg"
+
+CHUNK_SIZE = 50
+"Number of grid points solved per task"
+
+DEFAULT_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+    'surrogate_grid.npz',
+)
+"Default path of the grid file, used unless settings.SURROGATE_GRID_PATH"
+
+
+def grid_percentages(point):
+    """
+    Return every profile percentage at a point of the grid.
+
+    :param dict point: mapping from some of the profile percentage columns
+        to values; any of `AXES` missing take the first value of their axis
+    """
+    pcts = {column: float(axis[0]) for column, axis in AXES}
+    pcts.update(point)
+    pcts['treble_miss_pct'] = (
+        100 - pcts['treble_hit_pct'] - pcts['treble_big_miss_pct']
+    )
+    pcts['double_miss_inside_pct'] = (
+        100 - pcts['double_hit_pct'] - pcts['double_miss_outside_pct']
+    )
+    pcts['bullseye_miss_pct'] = 100 - pcts['bullseye_hit_pct']
+    pcts['outer_bull_hit_pct'] = min(
+        pcts['bullseye_hit_pct'] + OUTER_BULL_MARGIN,
+        100,
+    )
+    pcts['outer_bull_miss_pct'] = 100 - pcts['outer_bull_hit_pct']
+    return pcts
+
+
+def point_statistics(context, total=501):
+    """
+    Return the `STATISTICS` of a profile, solved exactly.
+
+    :param context: compiled context, as returned by
+        `~darts.sim.context.compile_context`
+    :param int total: Total required to win a leg of darts (default: 501).
+    """
+    leg = exact.solve_leg(context, total=total)
+    attempts = exact.checkout_attempts(context, total=total)
+    cumulative = np.cumsum(leg.darts_probs)
+    return [
+        leg.three_dart_average,
+        leg.avg_180s,
+        100.0 / attempts[total],
+        leg.expected_darts,
+    ] + [
+        float(np.searchsorted(cumulative, q)) for q in QUANTILES
+    ]
+
+
+def _solve_points(task):
+    columns, points, total = task
+    context = parallel.worker_contexts()[0]
+    return [
+        point_statistics(
+            context.for_profile(
+                models.Profile(**grid_percentages(dict(zip(columns, point))))
+            ),
+            total=total,
+        )
+        for point in points
+    ]
+
+
+class SurrogateGrid:
+
+    """
+    Results solved at every point of a grid of profiles.
+
+    :param list axes: (profile percentage column, values) pairs, as in
+        `AXES`
+    :param values: array of results, with one axis per grid axis and a
+        last axis indexed like ``statistics``
+    :param list statistics: names of the results (default: `STATISTICS`)
+    :param str lookups_version: hash of the lookups the grid was built
+        with, as returned by `~darts.sim.cache.lookups_hash`
+    :param int total: Total required to win a leg of darts (default: 501).
+    """
+
+    def __init__(
+            self,
+            axes,
+            values,
+            statistics=None,
+            lookups_version=None,
+            total=501,
+            ):
+        self.columns = [column for column, _ in axes]
+        self.axes = [np.asarray(axis, dtype=float) for _, axis in axes]
+        self.values = values
+        self.statistics = list(statistics or STATISTICS)
+        self.lookups_version = lookups_version
+        self.total = total
+        # Plain lists, as bisecting them is cheaper than searching arrays
+        # one value at a time.
+        self._axis_lists = [axis.tolist() for axis in self.axes]
+        self._corners = np.array(
+            list(itertools.product((0, 1), repeat=len(self.axes)))
+        )
+
+    def interpolate(self, point):
+        """
+        Interpolate the results at a point, in the order of
+        ``statistics``. Points outside the grid take the results at its
+        nearest edge.
+
+        :param point: the value of each of ``columns``
+        :return: 1-d array
+        """
+        lows, fractions = [], []
+        for axis, x in zip(self._axis_lists, point):
+            i = min(max(bisect.bisect_right(axis, x) - 1, 0), len(axis) - 2)
+            t = (x - axis[i]) / (axis[i + 1] - axis[i])
+            lows.append(i)
+            fractions.append(min(max(t, 0.0), 1.0))
+        indices = self._corners + lows
+        weights = np.where(
+            self._corners,
+            fractions,
+            np.subtract(1, fractions),
+        ).prod(axis=1)
+        return weights.dot(self.values[tuple(indices.T)])
+
+    def predict(self, profile):
+        """
+        Return a profile's expected results, interpolated from the grid.
+
+        Only the percentages in ``columns`` are used.
+
+        :param profile: shot profile
+        :type profile: :py:class:`~darts.models.Profile`
+        :return: mapping from each of ``statistics`` to its value
+        """
+        values = self.interpolate([
+            float(getattr(profile, column)) for column in self.columns
+        ])
+        return dict(zip(self.statistics, values.tolist()))
+
+    def save(self, path):
+        """
+        Save the grid to a compressed ``.npz`` file.
+        """
+        arrays = {
+            'axis_{}'.format(i): axis for i, axis in enumerate(self.axes)
+        }
+        with open(path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                columns=np.array(self.columns),
+                statistics=np.array(self.statistics),
+                values=self.values.astype(np.float32),
+                lookups_version=np.array(self.lookups_version or ''),
+                total=np.array(self.total),
+                **arrays
+            )
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a grid saved by `save`.
+        """
+        data = np.load(path)
+        columns = data['columns'].tolist()
+        return cls(
+            [
+                (column, data['axis_{}'.format(i)])
+                for i, column in enumerate(columns)
+            ],
+            data['values'].astype(float),
+            statistics=data['statistics'].tolist(),
+            lookups_version=str(data['lookups_version']) or None,
+            total=int(data['total']),
+        )
+
+    def __repr__(self):
+        return '<SurrogateGrid(columns=%r, points=%s)>' % (
+            self.columns,
+            self.values[..., 0].size,
+        )
+
+
+def build_grid(
+        score_shot_types,
+        score_points,
+        axes=AXES,
+        total=501,
+        processes=None,
+        ):
+    """
+    Solve every point of a grid of profiles, across a process pool.
+
+    :param dict score_shot_types: mapping from (score, dart_number) to
+        shot types, as returned by `~darts.sim.load_lookups`
+    :param dict score_points: mapping from (score, dart ID) to score tuple,
+        as returned by `~darts.sim.load_lookups`.
+    :param list axes: (profile percentage column, values) pairs.
+    :param int total: Total required to win a leg of darts (default: 501).
+    :param int processes: number of processes (default: one per CPU).
+
+    :rtype: SurrogateGrid
+    """
+    columns = [column for column, _ in axes]
+    points = list(itertools.product(*[axis for _, axis in axes]))
+    context = compile_context(
+        models.Profile(**grid_percentages({})),
+        score_shot_types,
+        score_points,
+        max_score=total,
+    )
+    results = parallel.run_shards(
+        _solve_points,
+        [
+            (columns, points[i:i + CHUNK_SIZE], total)
+            for i in xrange(0, len(points), CHUNK_SIZE)
+        ],
+        (context,),
+        processes=processes,
+    )
+    values = np.array(list(itertools.chain.from_iterable(results)))
+    log.info('solved %s grid points', len(points))
+    return SurrogateGrid(
+        axes,
+        values.reshape([len(axis) for _, axis in axes] + [-1]),
+        lookups_version=lookups_hash(score_shot_types, score_points),
+        total=total,
+    )
+
+
+_grids = {}
+"Grids loaded by this process, by path"
+
+
+def load_grid(path=None):
+    """
+    Return the grid saved at a path (default: settings.SURROGATE_GRID_PATH,
+    or `DEFAULT_PATH`), or None if there's no grid there.
+
+    Each grid is read once per process.
+    """
+    path = path or settings.SURROGATE_GRID_PATH or DEFAULT_PATH
+    if path not in _grids:
+        if not os.path.exists(path):
+            return None
+        _grids[path] = SurrogateGrid.load(path)
+    return _grids[path]
+
+
+def main(argv=None):
+    from darts import sim
+
+    parser = argparse.ArgumentParser(prog='python -m darts.sim.surrogate')
+    parser.add_argument('--output', default=DEFAULT_PATH)
+    parser.add_argument(
+        '--lookups',
+        default=sim.LOOKUPS_CSV,
+        help='CSV of score lookups (default: the shipped lookups)',
+    )
+    parser.add_argument('--total', type=int, default=501)
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+
+    grid = build_grid(
+        *sim.load_lookups_csv(args.lookups),
+        total=args.total,
+        processes=args.processes
+    )
+    grid.save(args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,19 +3,96 @@ import logging
 import math
 
 from . import oneplayer
+from .adaptive import simulate_until_precise
+from .streams import as_stream
 
 
 log = logging.getLogger(__name__)
 
 
+DETAIL_LEVELS = ['scores', 'legs', 'darts']
+"""
+How much of each match the simulators keep, least first:
+
+- 'scores': only the result; no legs are kept and no darts recorded.
+- 'legs': a :py:class:`~darts.sim.oneplayer.LegSummary` of each player's
+    darts, average and 180s in every leg.
+- 'darts': a :py:class:`~darts.sim.oneplayer.LegStats`, with every dart,
+    for each player in every leg.
+"""
+
+
+def _score_leg(
+        profile_a,
+        profile_b,
+        score_shot_types=None,
+        score_points=None,
+        a_first=True,
+        total=501,
+        random_state=None,
+        detail='scores',
+        ):
+    # Visits are thrown with oneplayer.score_visit, which records nothing.
+    profiles = (profile_a, profile_b)
+    scores = [total, total]
+    n_darts = [0, 0]
+    num_180s = [0, 0]
+    thrower = 0 if a_first else 1
+
+    while True:
+        score, darts = oneplayer.score_visit(
+            scores[thrower],
+            profiles[thrower],
+            score_shot_types,
+            score_points,
+            random_state,
+        )
+        n_darts[thrower] += darts
+        num_180s[thrower] += scores[thrower] - score == 180
+        scores[thrower] = score
+        if score <= 0:
+            break
+        thrower = 1 - thrower
+
+    winner = 'a' if thrower == 0 else 'b'
+    if detail == 'scores':
+        return (winner, None, None)
+    return (
+        winner,
+        oneplayer.LegSummary(total, n_darts[0], num_180s[0]),
+        oneplayer.LegSummary(total, n_darts[1], num_180s[1]),
+    )
+
+
 def simulate_leg(
         profile_a,
         profile_b,
-        score_shot_types,
-        score_points,
+        score_shot_types=None,
+        score_points=None,
         a_first=True,
         total=501,
+        random_state=None,
+        detail='darts',
         ):
+    """
+    Simulate a leg between two players.
+
+    Returns a tuple containing the winner ('a' or 'b') and each player's
+    stats for the leg, at the given detail level (see `DETAIL_LEVELS`);
+    at 'scores', the stats are None.
+    """
+    random_state = as_stream(random_state)
+    if detail != 'darts':
+        return _score_leg(
+            profile_a,
+            profile_b,
+            score_shot_types,
+            score_points,
+            a_first,
+            total,
+            random_state,
+            detail,
+        )
 
     all_pa_stats, all_pb_stats = [], []
     pa_score, pb_score = total, total
@@ -25,6 +102,7 @@ def simulate_leg(
         profile=p,
         score_shot_types=score_shot_types,
         score_points=score_points,
+        random_state=random_state,
     ) for p in (profile_a, profile_b)]
 
     while pa_score > 0 and pb_score > 0:
@@ -50,7 +128,6 @@ def simulate_leg(
             if pa_score <= 0:
                 winner = 'a'
                 break
-        a_first = not a_first
 
     return (
         winner,
@@ -59,7 +136,10 @@ def simulate_leg(
     )
 
 
-class MatchStats:
+class MatchStats(object):
+
+    # Long simulations keep one of these per match, so keep them small.
+    __slots__ = ('profiles', 'wins', 'scores', 'winner', 'all_legs')
 
     def __init__(self, profiles, wins, scores, all_legs):
         self.profiles = profiles
@@ -87,21 +167,28 @@ class MatchStats:
 def simulate_match_play(
         profile_a,
         profile_b,
-        score_shot_types,
-        score_points,
+        score_shot_types=None,
+        score_points=None,
         legs_to_win=7,
         a_first=True,
         a_handicap=0,
         b_handicap=0,
         total_legs=None,
         premier_league=False,
+        random_state=None,
+        detail='darts',
         ):
     """
     Note - if total_legs = 12, this is 'Premier League' play.
+
+    :param str detail: how much of each leg to keep; see `DETAIL_LEVELS`.
     """
+    random_state = as_stream(random_state)
 
-    # List of (winner, LegStats - profile A, LegStats - profile B) tuples
+    # List of (winner, LegStats - profile A, LegStats - profile B) tuples,
+    # unless only the score is wanted.
     legs = []
+    n_legs = 0
     if total_legs is not None:
         legs_to_win = math.ceil(total_legs/2.0)
     if premier_league:
@@ -116,15 +203,20 @@ def simulate_match_play(
             score_shot_types,
             score_points,
             a_first,
+            random_state=random_state,
+            detail=detail,
         )
         log.debug('Leg winner: {}'.format(leg[0]))
-        legs.append(leg)
+        n_legs += 1
+        if detail != 'scores':
+            legs.append(leg)
         if leg[0] == 'a':
             a_wins += 1
         else:
             b_wins += 1
-        if total_legs is not None and len(legs) >= total_legs:
+        if total_legs is not None and n_legs >= total_legs:
             break
+        a_first = not a_first
 
     a_score = a_wins + a_handicap
     b_score = b_wins + b_handicap
@@ -133,7 +225,8 @@ def simulate_match_play(
         profiles=(profile_a, profile_b),
         wins=(a_wins, b_wins),
         scores=(a_score, b_score),
-        all_legs=legs,
+        # Every match can share the empty tuple, unlike an empty list.
+        all_legs=legs or (),
     )
 
 
@@ -149,11 +242,15 @@ class SetStats:
 def simulate_set(
         profile_a,
         profile_b,
-        score_shot_types,
-        score_points,
+        score_shot_types=None,
+        score_points=None,
         a_first=True,
+        random_state=None,
+        detail='darts',
         ):
-    # List of (winner, LegStats - profile A, LegStats - profile B) tuples
+    random_state = as_stream(random_state)
+    # List of (winner, LegStats - profile A, LegStats - profile B) tuples,
+    # unless only the score is wanted.
     legs = []
     LEGS_TO_WIN = 3
 
@@ -166,9 +263,12 @@ def simulate_set(
             score_shot_types,
             score_points,
             a_first,
+            random_state=random_state,
+            detail=detail,
         )
         log.debug('Leg winner: {}'.format(leg[0]))
-        legs.append(leg)
+        if detail != 'scores':
+            legs.append(leg)
         if leg[0] == 'a':
             a_wins += 1
         else:
@@ -185,14 +285,19 @@ def simulate_set(
 def simulate_set_play(
         profile_a,
         profile_b,
-        score_shot_types,
-        score_points,
+        score_shot_types=None,
+        score_points=None,
         total_sets=5,
         a_first=True,
         a_handicap=0,
         b_handicap=0,
+        random_state=None,
+        detail='darts',
         ):
-
+    """
+    :param str detail: how much of each leg to keep; see `DETAIL_LEVELS`.
+    """
+    random_state = as_stream(random_state)
     sets = []
     a_sets, b_sets = 0, 0
 
@@ -202,9 +307,13 @@ def simulate_set_play(
             profile_b,
             score_shot_types,
             score_points,
+            a_first,
+            random_state,
+            detail,
         )
         log.debug('Set winner: {}'.format(s.winner))
-        sets.append(s)
+        if detail != 'scores':
+            sets.append(s)
         if s.winner == profile_a:
             a_sets += 1
         else:
@@ -219,14 +328,38 @@ def simulate_set_play(
         (profile_a, profile_b),
         (a_sets, b_sets),
         (a_score, b_score),
-        sets,
+        sets or (),
     )
 
 
-def simulate_match(match_type, iterations=1000, **kwargs):
+def simulate_match(
+        match_type,
+        iterations=1000,
+        random_state=None,
+        tolerance=None,
+        score_tolerance=None,
+        detail='darts',
+        **kwargs
+        ):
     """
     Simulate a match between two players represented by the given profiles.
 
+    The profiles may be :py:class:`~darts.sim.context.CompiledSimContext`
+    objects, in which case the lookups can be omitted. All the matches draw
+    from ``random_state``, a :py:class:`~darts.sim.streams.RandomStream`
+    (default: a new, randomly seeded stream).
+
+    If a ``tolerance`` is given, matches are simulated in batches until the
+    95% confidence interval half-width on player A's win probability (and
+    on every score probability, if ``score_tolerance`` is given) is within
+    it, with ``iterations`` as a maximum; see
+    `~darts.sim.adaptive.simulate_until_precise`.
+
+    ``detail`` sets how much of each match is kept (see `DETAIL_LEVELS`).
+    At 'scores', nothing is kept per leg or per dart, and matches with the
+    same result share its tuples, so the matches take a few dozen bytes
+    each.
+
     Returns an object containing the stats and darts thrown in the match.
     """
 
@@ -244,11 +377,40 @@ def simulate_match(match_type, iterations=1000, **kwargs):
         kwargs.pop('total_sets', None)
 
     matches = []
+    random_state = as_stream(random_state)
 
     a_first = kwargs.pop('a_first', True)
 
+    if tolerance is not None:
+        def simulate_batch(n, batch_a_first, batch_random_state):
+            return simulate_match(
+                match_type,
+                iterations=n,
+                random_state=batch_random_state,
+                a_first=batch_a_first,
+                detail=detail,
+                **kwargs
+            )
+        return simulate_until_precise(
+            simulate_batch,
+            iterations,
+            tolerance,
+            score_tolerance,
+            a_first=a_first,
+            random_state=random_state,
+        )
+
+    shared = {}
     for i in xrange(iterations):
-        match = match_fn(a_first=a_first, **kwargs)
+        match = match_fn(
+            a_first=a_first,
+            random_state=random_state,
+            detail=detail,
+            **kwargs
+        )
+        for name in ('profiles', 'wins', 'scores'):
+            value = getattr(match, name)
+            setattr(match, name, shared.setdefault(value, value))
         a_first = not a_first
         matches.append(match)
         if i % 100 == 0 and i > 0:
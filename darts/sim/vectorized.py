@@ -0,0 +1,745 @@
+"""
+Vectorized simulations of legs and matches.
+
+Rather than throwing one dart at a time, the scores of every leg (or match)
+in a batch are held in a single array and dart N of every unfinished leg is
+thrown at once. Shot selection, result sampling, busts and checkouts are all
+handled with masked array operations.
+"""
+import logging
+import math
+
+import numpy as np
+
+from .accumulate import LegAccumulator
+from .adaptive import simulate_until_precise
+from .columns import DartColumns, SHOT_TYPE_VALUES
+from .context import (
+    BIG_MISS_CHOICES,
+    CompiledSimContext,
+    compile_context,
+)
+from .streams import as_stream
+from .twoplayer import MatchStats
+from .visits import VisitTable
+
+
+log = logging.getLogger(__name__)
+
+
+def dart_results(
+        scores,
+        dart_number,
+        shot_types,
+        points,
+        thresholds,
+        draws,
+        players=None,
+        ):
+    """
+    Work out the result of one dart at each of the given scores, given a
+    uniform random number in [0, 1) for each.
+
+    Returns the same as `throw_darts`, except that big misses whose lookup
+    value is 6 score 6; the caller replaces them with one of
+    `~darts.sim.context.BIG_MISS_CHOICES`.
+
+    See `throw_darts` for the other arguments.
+    """
+    shot_type = shot_types[scores, dart_number]
+    if players is None:
+        hit, miss = thresholds[shot_type].T
+    else:
+        hit, miss = thresholds[players, shot_type].T
+    result = 100 * draws
+    result = (result > hit).astype(np.int8) + (result > miss)
+    return shot_type, result, points[scores, dart_number, result]
+
+
+def throw_darts(
+        scores,
+        dart_number,
+        shot_types,
+        points,
+        thresholds,
+        random_state,
+        players=None,
+        ):
+    """
+    Simulate throwing one dart at each of the given scores.
+
+    Returns a 3-tuple of arrays, each the same length as ``scores``,
+    containing the shot type IDs, the shot results and the points scored.
+
+    :param scores: array of current scores (before throwing the dart)
+    :param int dart_number: dart ID (1, 2, 3)
+    :param shot_types: shot type array, as returned by
+        `~darts.sim.context.lookup_arrays`
+    :param points: points array, as returned by
+        `~darts.sim.context.lookup_arrays`
+    :param thresholds: result thresholds, as returned by
+        `~darts.sim.context.profile_thresholds`, or a stack of them if
+        ``players`` is given
+    :param random_state: :py:class:`~darts.sim.streams.RandomStream` (or
+        :py:class:`numpy.random.RandomState`) to draw from
+    :param players: optional array of indices into ``thresholds``, giving
+        the profile throwing at each score
+    """
+    shot_type, result, points_scored = dart_results(
+        scores,
+        dart_number,
+        shot_types,
+        points,
+        thresholds,
+        random_state.random_sample(scores.size),
+        players=players,
+    )
+    big_misses = np.flatnonzero((result == 2) & (points_scored == 6))
+    if big_misses.size:
+        points_scored[big_misses] = random_state.choice(
+            BIG_MISS_CHOICES,
+            big_misses.size,
+        )
+    return shot_type, result, points_scored
+
+
+def throw_visits(
+        scores,
+        shot_types,
+        points,
+        thresholds,
+        random_state,
+        players=None,
+        ):
+    """
+    Simulate a visit of up to three darts at each of the given scores.
+
+    A visit stops early once it checks out or busts; busted visits revert
+    to the score they started on and count as throwing no darts.
+
+    Returns a 5-tuple of arrays containing:
+
+    - the new scores
+    - the number of darts thrown in each visit
+    - the shot type IDs, shape (len(scores), 3)
+    - the shot results, shape (len(scores), 3)
+    - the points scored, shape (len(scores), 3)
+
+    Darts that weren't thrown are left as zeros.
+
+    :param scores: array of current scores (before throwing the darts)
+    :param shot_types: shot type array, as returned by
+        `~darts.sim.context.lookup_arrays`
+    :param points: points array, as returned by
+        `~darts.sim.context.lookup_arrays`
+    :param thresholds: result thresholds, as returned by
+        `~darts.sim.context.profile_thresholds`, or a stack of them if
+        ``players`` is given
+    :param random_state: :py:class:`~darts.sim.streams.RandomStream` (or
+        :py:class:`numpy.random.RandomState`) to draw from
+    :param players: optional array of indices into ``thresholds``, giving
+        the profile throwing at each score
+    """
+    n_visits = scores.size
+    new_scores = scores.copy()
+    visit_shot_types = np.zeros((n_visits, 3), dtype=np.int8)
+    visit_results = np.zeros((n_visits, 3), dtype=np.int8)
+    visit_points = np.zeros((n_visits, 3), dtype=np.int16)
+    n_darts = np.zeros(n_visits, dtype=np.int8)
+
+    throwing = np.arange(n_visits)
+    for dart_id in (1, 2, 3):
+        shot_type, result, points_scored = throw_darts(
+            new_scores[throwing],
+            dart_id,
+            shot_types,
+            points,
+            thresholds,
+            random_state,
+            players=None if players is None else players[throwing],
+        )
+        visit_shot_types[throwing, dart_id - 1] = shot_type
+        visit_results[throwing, dart_id - 1] = result
+        visit_points[throwing, dart_id - 1] = points_scored
+        n_darts[throwing] = dart_id
+        new_scores[throwing] -= points_scored
+        throwing = throwing[new_scores[throwing] > 1]
+        if not throwing.size:
+            break
+
+    bust = (new_scores == 1) | (new_scores < 0)
+    new_scores[bust] = scores[bust]
+    n_darts[bust] = 0
+
+    return new_scores, n_darts, visit_shot_types, visit_results, visit_points
+
+
+class LegBatch:
+
+    """
+    The darts thrown in a batch of simulated legs.
+
+    Every thrown dart is stored in `darts`, a
+    :py:class:`~darts.sim.columns.DartColumns`. Busted visits are kept as
+    visits with no darts.
+    """
+
+    def __init__(self, total, leg_ids, n_darts, shot_types, results, points):
+        order = np.argsort(leg_ids, kind='mergesort')
+        n_darts = n_darts[order]
+        thrown = np.arange(3) < n_darts[:, np.newaxis]
+
+        self.total = total
+        self.n_legs = int(leg_ids.max()) + 1 if leg_ids.size else 0
+        self.visit_offsets = np.concatenate((
+            [0],
+            np.cumsum(np.bincount(leg_ids, minlength=self.n_legs)),
+        ))
+        self.dart_offsets = np.concatenate(([0], np.cumsum(n_darts)))
+        leg_visits = (
+            np.arange(len(n_darts)) -
+            np.repeat(self.visit_offsets[:-1], np.diff(self.visit_offsets))
+        )
+        self.darts = DartColumns(
+            shot_types[order][thrown],
+            results[order][thrown],
+            points[order][thrown],
+            np.repeat(leg_visits, n_darts),
+            self.dart_offsets[self.visit_offsets],
+        )
+
+        self.three_dart_totals = (points[order] * thrown).sum(axis=1)
+        visit_legs = np.repeat(
+            np.arange(self.n_legs),
+            np.diff(self.visit_offsets),
+        )
+        self.num_180s = np.bincount(
+            visit_legs,
+            weights=self.three_dart_totals == 180,
+            minlength=self.n_legs,
+        ).astype(int)
+        n_leg_darts = np.bincount(
+            visit_legs,
+            weights=n_darts,
+            minlength=self.n_legs,
+        )
+        self.three_dart_averages = 3.0 * total / n_leg_darts
+
+        self._rows = None
+
+    def __len__(self):
+        return self.n_legs
+
+    def __getitem__(self, leg_id):
+        if not 0 <= leg_id < self.n_legs:
+            raise IndexError(leg_id)
+        return BatchLegStats(self, leg_id)
+
+    def __iter__(self):
+        for leg_id in xrange(self.n_legs):
+            yield BatchLegStats(self, leg_id)
+
+    @property
+    def rows(self):
+        """
+        Every thrown dart as a (shot type, result, points) tuple.
+
+        Built on first access and shared by all legs in the batch.
+        """
+        if self._rows is None:
+            self._rows = list(zip(
+                [SHOT_TYPE_VALUES[x] for x in self.darts.shot_types.tolist()],
+                self.darts.results.tolist(),
+                self.darts.points.tolist(),
+            ))
+        return self._rows
+
+
+class BatchLegStats:
+
+    """
+    Stats for a single leg of a `LegBatch`.
+
+    Has the same attributes and `as_dict` output as
+    :py:class:`~darts.sim.oneplayer.LegStats`.
+    """
+
+    def __init__(self, batch, leg_id):
+        self.batch = batch
+        self.leg_id = leg_id
+        self.start = batch.visit_offsets[leg_id]
+        self.end = batch.visit_offsets[leg_id + 1]
+
+    @property
+    def three_dart_totals(self):
+        return self.batch.three_dart_totals[self.start:self.end].tolist()
+
+    @property
+    def num_180s(self):
+        return int(self.batch.num_180s[self.leg_id])
+
+    @property
+    def three_dart_average(self):
+        return float(self.batch.three_dart_averages[self.leg_id])
+
+    @property
+    def darts(self):
+        return self.batch.darts[self.leg_id]
+
+    @property
+    def all_darts(self):
+        rows = self.batch.rows
+        offsets = self.batch.dart_offsets[self.start:self.end + 1].tolist()
+        return [rows[a:b] for a, b in zip(offsets, offsets[1:])]
+
+    def as_dict(self):
+        return dict(
+            three_dart_totals=self.three_dart_totals,
+            three_dart_average=self.three_dart_average,
+            num_180s=self.num_180s,
+            all_darts=self.all_darts,
+        )
+
+
+def simulate_visits(context, iterations=1000, total=501, random_state=None):
+    """
+    Simulate lots of legs in lockstep, returning every visit thrown.
+
+    Every visit, each unfinished leg throws up to three darts, as described
+    in `throw_visits`, or draws its visit from the context's table if it is
+    a :py:class:`~darts.sim.visits.VisitTable`.
+
+    Returns a 5-tuple of arrays, with one entry per visit in the order they
+    were thrown, containing the leg ID, the number of darts counted, and the
+    shot types, results and points of the three darts. These are the
+    arguments to `LegBatch` after ``total``.
+
+    :param context: compiled context, as returned by
+        `~darts.sim.context.compile_context`
+    :param int iterations: Number of legs to simulate (default: 1000).
+    :param int total: Total required to win a leg of darts (default: 501).
+    :param random_state: :py:class:`~darts.sim.streams.RandomStream` to
+        draw from (default: a new, randomly seeded stream).
+    """
+    random_state = as_stream(random_state)
+    if not iterations:
+        return (
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.int8),
+            np.zeros((0, 3), dtype=np.int8),
+            np.zeros((0, 3), dtype=np.int8),
+            np.zeros((0, 3), dtype=np.int16),
+        )
+
+    shot_types, points = context.shot_types, context.points
+    thresholds = context.thresholds
+
+    legs = np.arange(iterations)
+    scores = np.empty(iterations, dtype=np.int32)
+    scores[:] = total
+
+    visits = []
+    while legs.size:
+        if isinstance(context, VisitTable):
+            visit = context.throw_visits(scores, random_state)
+        else:
+            visit = throw_visits(
+                scores,
+                shot_types,
+                points,
+                thresholds,
+                random_state,
+            )
+        scores, n_darts, visit_shot_types, visit_results, visit_points = visit
+        visits.append((
+            legs,
+            n_darts,
+            visit_shot_types,
+            visit_results,
+            visit_points,
+        ))
+
+        playing = scores != 0
+        legs = legs[playing]
+        scores = scores[playing]
+
+    log.info('ran %s legs in %s visits', iterations, len(visits))
+
+    return tuple(np.concatenate(x) for x in zip(*visits))
+
+
+def simulate_profile(
+        profile,
+        score_shot_types=None,
+        score_points=None,
+        iterations=1000,
+        total=501,
+        random_state=None,
+        ):
+    """
+    Simulate a profile by simulating lots of legs in lockstep.
+
+    A drop-in replacement for `~darts.sim.oneplayer.simulate_profile`; see
+    `simulate_visits`.
+
+    :param profile: shot profile, or a compiled context in which case the
+        lookups are ignored
+    :type profile: :py:class:`~darts.models.Profile` or
+        :py:class:`~darts.sim.context.CompiledSimContext`
+
+    :param dict score_shot_types: mapping from (score, dart_number) to
+        shot types, as returned by `~load_lookups`
+    :param dict score_points: mapping from (score, dart ID) to score tuple,
+        as returned by `load_lookups`.
+    :param int iterations: Number of iterations to run (default: 1000).
+    :param int total: Total required to win a leg of darts (default: 501).
+    :param random_state: :py:class:`~darts.sim.streams.RandomStream` to
+        draw from (default: a new, randomly seeded stream).
+
+    :rtype: LegBatch
+    """
+    context = compile_context(
+        profile,
+        score_shot_types,
+        score_points,
+        max_score=total,
+    )
+    return LegBatch(total, *simulate_visits(
+        context,
+        iterations=iterations,
+        total=total,
+        random_state=random_state,
+    ))
+
+
+BATCH_SIZE = 10000
+"Default number of legs simulated at a time by `iter_batches`"
+
+
+def iter_batches(
+        profile,
+        score_shot_types=None,
+        score_points=None,
+        iterations=1000,
+        total=501,
+        random_state=None,
+        batch_size=BATCH_SIZE,
+        ):
+    """
+    Simulate a profile in batches of at most ``batch_size`` legs, yielding
+    each :py:class:`LegBatch` as soon as it has been thrown.
+
+    Takes the same arguments as `simulate_profile`. Leg IDs are numbered
+    from zero within each batch.
+    """
+    context = compile_context(
+        profile,
+        score_shot_types,
+        score_points,
+        max_score=total,
+    )
+    random_state = as_stream(random_state)
+    for start in xrange(0, iterations, batch_size):
+        yield LegBatch(total, *simulate_visits(
+            context,
+            iterations=min(batch_size, iterations - start),
+            total=total,
+            random_state=random_state,
+        ))
+
+
+def accumulate_profile(
+        profile,
+        score_shot_types=None,
+        score_points=None,
+        iterations=1000,
+        total=501,
+        random_state=None,
+        keep_darts=False,
+        batch_size=BATCH_SIZE,
+        ):
+    """
+    Simulate a profile, keeping only running statistics of the legs.
+
+    A drop-in replacement for `~darts.sim.oneplayer.accumulate_profile`.
+    Only one batch of legs (see `iter_batches`) is held at a time, so
+    memory use doesn't depend on ``iterations`` unless ``keep_darts`` is
+    set.
+
+    :rtype: :py:class:`~darts.sim.accumulate.LegAccumulator`
+    """
+    accumulator = LegAccumulator(keep_darts)
+    for batch in iter_batches(
+            profile,
+            score_shot_types,
+            score_points,
+            iterations,
+            total,
+            random_state,
+            batch_size,
+            ):
+        accumulator.add_batch(batch)
+    return accumulator
+
+
+LEGS_PER_SET = 3
+"Legs required to win a set in set play"
+
+
+def match_contexts(
+        profile_a,
+        profile_b,
+        score_shot_types=None,
+        score_points=None,
+        total=501,
+        ):
+    """
+    Compile both players' contexts, sharing one set of lookups.
+    """
+    context_a = compile_context(
+        profile_a,
+        score_shot_types,
+        score_points,
+        max_score=total,
+    )
+    if isinstance(profile_b, CompiledSimContext):
+        context_b = profile_b
+    else:
+        context_b = context_a.for_profile(profile_b)
+    return context_a, context_b
+
+
+def simulate_match_wins(
+        match_type,
+        context_a,
+        context_b,
+        iterations=1000,
+        a_first=True,
+        legs_to_win=7,
+        total_legs=None,
+        total_sets=5,
+        total=501,
+        random_state=None,
+        ):
+    """
+    Simulate lots of matches between two profiles in lockstep.
+
+    Every step, the player due to throw in each unfinished match throws a
+    visit, drawn from the players' visit tables if both contexts are
+    :py:class:`~darts.sim.visits.VisitTable` objects. Matches that finish a
+    leg have their scores reset and the next leg's thrower chosen, and
+    finished matches drop out of the batch.
+
+    Returns an integer array of shape (iterations, 2) holding the legs (or
+    sets, for set play) won by each player in each match, before handicaps.
+    See `simulate_match` for the arguments.
+    """
+    random_state = as_stream(random_state)
+
+    set_play = match_type == 'set_play'
+    if match_type == 'premier_league':
+        # Always 12 legs in a Premier League match.
+        legs_to_win, total_legs = 7, 12
+    elif total_legs is not None:
+        legs_to_win = int(math.ceil(total_legs / 2.0))
+
+    shot_types, points = context_a.shot_types, context_a.points
+    thresholds = np.stack([context_a.thresholds, context_b.thresholds])
+    tables = None
+    if isinstance(context_a, VisitTable) and isinstance(
+            context_b, VisitTable):
+        tables = (context_a, context_b)
+
+    # Players are 0 (A) and 1 (B).
+    matches = np.arange(iterations)
+    first = (matches + (0 if a_first else 1)) % 2
+    set_thrower = first.copy()
+    leg_thrower = first.copy()
+    thrower = first.copy()
+    scores = np.empty((iterations, 2), dtype=np.int32)
+    scores[:] = total
+    legs = np.zeros((iterations, 2), dtype=np.int32)
+    sets = np.zeros((iterations, 2), dtype=np.int32)
+    legs_played = np.zeros(iterations, dtype=np.int32)
+
+    while matches.size:
+        players = thrower[matches]
+        if tables is None:
+            new_scores = throw_visits(
+                scores[matches, players],
+                shot_types,
+                points,
+                thresholds,
+                random_state,
+                players=players,
+            )[0]
+        else:
+            new_scores = scores[matches, players]
+            draws = random_state.random_sample(matches.size)
+            for player, table in enumerate(tables):
+                throwing = players == player
+                new_scores[throwing] = table.sequences['end'][table.sample(
+                    new_scores[throwing],
+                    draws[throwing],
+                )]
+        scores[matches, players] = new_scores
+        thrower[matches] = 1 - players
+
+        checked_out = new_scores == 0
+        if not checked_out.any():
+            continue
+
+        # Start a new leg in every match where a leg was won.
+        ended = matches[checked_out]
+        winners = players[checked_out]
+        legs[ended, winners] += 1
+        legs_played[ended] += 1
+        scores[ended] = total
+        leg_thrower[ended] = 1 - leg_thrower[ended]
+
+        if set_play:
+            won_set = legs[ended, winners] == LEGS_PER_SET
+            set_ended, set_winners = ended[won_set], winners[won_set]
+            sets[set_ended, set_winners] += 1
+            legs[set_ended] = 0
+            set_thrower[set_ended] = 1 - set_thrower[set_ended]
+            leg_thrower[set_ended] = set_thrower[set_ended]
+            finished = sets[ended].max(axis=1) >= total_sets
+        else:
+            finished = legs[ended].max(axis=1) >= legs_to_win
+            if total_legs is not None:
+                finished |= legs_played[ended] >= total_legs
+
+        thrower[ended] = leg_thrower[ended]
+        matches = np.setdiff1d(matches, ended[finished], assume_unique=True)
+
+    log.info('ran %s matches', iterations)
+
+    return sets if set_play else legs
+
+
+def match_stats(wins, profile_a, profile_b, a_handicap=0, b_handicap=0):
+    """
+    Convert an array of match wins into MatchStats, applying handicaps.
+
+    :param wins: array of legs (or sets) won, as returned by
+        `simulate_match_wins`
+    :return: one :py:class:`~darts.sim.twoplayer.MatchStats` per match,
+        without leg details.
+    """
+    profiles = (profile_a, profile_b)
+    return [
+        MatchStats(
+            profiles=profiles,
+            wins=tuple(w),
+            scores=(w[0] + a_handicap, w[1] + b_handicap),
+            all_legs=[],
+        )
+        for w in wins.tolist()
+    ]
+
+
+def simulate_match(
+        match_type,
+        profile_a,
+        profile_b,
+        score_shot_types=None,
+        score_points=None,
+        iterations=1000,
+        a_first=True,
+        a_handicap=0,
+        b_handicap=0,
+        legs_to_win=7,
+        total_legs=None,
+        total_sets=5,
+        total=501,
+        random_state=None,
+        tolerance=None,
+        score_tolerance=None,
+        ):
+    """
+    Simulate lots of matches between two profiles in lockstep.
+
+    A drop-in replacement for `~darts.sim.twoplayer.simulate_match`; see
+    `simulate_match_wins`.
+
+    As with `~darts.sim.twoplayer.simulate_match`, the player throwing first
+    alternates between iterations, starting with player A if ``a_first``.
+
+    :param str match_type: 'match_play', 'set_play' or 'premier_league'
+    :param profile_a: player A's shot profile or compiled context
+    :type profile_a: :py:class:`~darts.models.Profile` or
+        :py:class:`~darts.sim.context.CompiledSimContext`
+    :param profile_b: player B's shot profile or compiled context
+    :type profile_b: :py:class:`~darts.models.Profile` or
+        :py:class:`~darts.sim.context.CompiledSimContext`
+    :param dict score_shot_types: mapping from (score, dart_number) to
+        shot types, as returned by `~load_lookups`
+    :param dict score_points: mapping from (score, dart ID) to score tuple,
+        as returned by `load_lookups`.
+    :param int iterations: Number of matches to simulate (default: 1000).
+    :param bool a_first: whether player A throws first in the first match.
+    :param int a_handicap: legs (or sets) added to player A's final score.
+    :param int b_handicap: legs (or sets) added to player B's final score.
+    :param int legs_to_win: legs required to win a match play match.
+    :param int total_legs: maximum legs in a match play match; overrides
+        ``legs_to_win``.
+    :param int total_sets: sets required to win a set play match.
+    :param int total: Total required to win a leg of darts (default: 501).
+    :param random_state: :py:class:`~darts.sim.streams.RandomStream` to
+        draw from (default: a new, randomly seeded stream).
+    :param float tolerance: if given, simulate in batches until the 95%
+        confidence interval half-width on player A's win probability is at
+        most this, treating ``iterations`` as a maximum; see
+        `~darts.sim.adaptive.simulate_until_precise`.
+    :param float score_tolerance: with ``tolerance``, also require this
+        half-width on every score probability.
+
+    :return: one :py:class:`~darts.sim.twoplayer.MatchStats` per match,
+        without leg details.
+    """
+    context_a, context_b = match_contexts(
+        profile_a,
+        profile_b,
+        score_shot_types,
+        score_points,
+        total,
+    )
+    if tolerance is not None:
+        def simulate_batch(n, batch_a_first, batch_random_state):
+            return simulate_match(
+                match_type,
+                context_a,
+                context_b,
+                iterations=n,
+                a_first=batch_a_first,
+                a_handicap=a_handicap,
+                b_handicap=b_handicap,
+                legs_to_win=legs_to_win,
+                total_legs=total_legs,
+                total_sets=total_sets,
+                total=total,
+                random_state=batch_random_state,
+            )
+        return simulate_until_precise(
+            simulate_batch,
+            iterations,
+            tolerance,
+            score_tolerance,
+            a_first=a_first,
+            random_state=as_stream(random_state),
+        )
+
+    wins = simulate_match_wins(
+        match_type,
+        context_a,
+        context_b,
+        iterations=iterations,
+        a_first=a_first,
+        legs_to_win=legs_to_win,
+        total_legs=total_legs,
+        total_sets=total_sets,
+        total=total,
+        random_state=random_state,
+    )
+    return match_stats(wins, profile_a, profile_b, a_handicap, b_handicap)
@@ -0,0 +1,328 @@
+"""
+Visit-level outcome tables, for sampling a whole visit with one draw.
+
+For a given profile and lookups, every possible sequence of darts in a
+visit from each score, and its probability, can be listed in advance: at
+most six outcomes per dart (a hit, a miss, and a big miss or the four
+random big misses), and the visit stops at a checkout or a bust. A
+`VisitTable` holds these sequences together with a Walker alias table for
+each start score, so that one uniform draw picks an entire visit, darts
+and all, in constant time.
+
+A `VisitTable` is a :py:class:`~darts.sim.context.CompiledSimContext`, and
+can be passed to any simulator in place of one. The one player and
+vectorized simulators then throw visits from the table rather than one
+dart at a time; since each sequence records its darts, the visit's trace
+is the same as if its darts had been thrown one by one.
+"""
+from collections import namedtuple
+import hashlib
+
+import numpy as np
+
+from darts import settings
+from .cache import LRUCache
+from .context import (
+    CompiledSimContext,
+    SHOT_RESULTS,
+    SHOT_TYPES,
+    compile_context,
+    profile_key,
+)
+from .exact import dart_outcomes
+
+
+OUTCOME_RESULTS = np.array([0, 1, 2, 2, 2, 2], dtype=np.int8)
+"Shot result of each outcome of `~darts.sim.exact.dart_outcomes`"
+
+Dart = namedtuple('Dart', ['shot_type', 'shot_result', 'points_scored'])
+"A dart thrown in a visit sampled by `VisitTable.throw_visit`"
+
+
+def alias_table(probs):
+    """
+    Build a Walker alias table for a discrete distribution, with Vose's
+    method.
+
+    To sample, pick a column ``i`` uniformly, then keep it with
+    probability ``accept[i]`` or take ``alias[i]`` otherwise.
+
+    :param probs: 1-d array of probabilities summing to 1; zeros are
+        allowed.
+    :return: the acceptance probabilities and aliases of each column.
+    """
+    n = len(probs)
+    scaled = (np.asarray(probs, dtype=float) * n).tolist()
+    accept = [1.0] * n
+    alias = range(n)
+    small = [i for i, p in enumerate(scaled) if p < 1]
+    large = [i for i, p in enumerate(scaled) if p >= 1]
+    while small and large:
+        i, j = small.pop(), large.pop()
+        accept[i] = scaled[i]
+        alias[i] = j
+        scaled[j] -= 1 - scaled[i]
+        (small if scaled[j] < 1 else large).append(j)
+    # Whatever is left is 1 up to rounding error, and keeps accept = 1.
+    return np.array(accept), np.array(alias)
+
+
+def visit_sequences(context, total=501):
+    """
+    List every possible sequence of darts in a visit from each score.
+
+    Returns a dict of equal-length arrays, one entry per sequence, sorted
+    by start score:
+
+    - ``start``: the score at the start of the visit
+    - ``end``: the score at the end of the visit (the start score, after a
+        bust)
+    - ``n_darts``: the number of darts counted (none, after a bust)
+    - ``n_thrown``: the number of darts thrown
+    - ``shot_types``, ``results``, ``points``: shape (n, 3), the darts
+        thrown; darts that weren't thrown are zeros
+    - ``probs``: the probability of the sequence, given the start score
+
+    :param context: compiled context, as returned by
+        `~darts.sim.context.compile_context`
+    :param int total: highest start score to list sequences for.
+    """
+    outcome_points, outcome_probs = dart_outcomes(context)
+    n_outcomes = outcome_probs.shape[-1]
+
+    start = np.arange(2, total + 1)
+    score = start.copy()
+    probs = np.ones(start.size)
+    darts = np.zeros((start.size, 3, 3), dtype=np.int16)
+
+    done = []
+    for dart_id in (1, 2, 3):
+        shot_types = context.shot_types[score, dart_id]
+        start = np.repeat(start, n_outcomes)
+        probs = (probs[:, np.newaxis] * outcome_probs[score, dart_id]).ravel()
+        points = outcome_points[score, dart_id].ravel()
+        score = np.repeat(score, n_outcomes) - points
+        darts = np.repeat(darts, n_outcomes, axis=0)
+        darts[:, dart_id - 1, 0] = np.repeat(shot_types, n_outcomes)
+        darts[:, dart_id - 1, 1] = np.tile(OUTCOME_RESULTS, shot_types.size)
+        darts[:, dart_id - 1, 2] = points
+
+        possible = probs > 0
+        start, score, probs, darts = (
+            start[possible],
+            score[possible],
+            probs[possible],
+            darts[possible],
+        )
+
+        over = (score <= 1) | (dart_id == 3)
+        done.append((start[over], score[over], probs[over], darts[over]))
+        start, score, probs, darts = (
+            start[~over],
+            score[~over],
+            probs[~over],
+            darts[~over],
+        )
+
+    start, end, probs, darts = [np.concatenate(x) for x in zip(*done)]
+    n_thrown = np.concatenate([
+        np.full(len(d[0]), dart_id, dtype=np.int8)
+        for dart_id, d in enumerate(done, 1)
+    ])
+    bust = (end == 1) | (end < 0)
+    end[bust] = start[bust]
+    n_darts = np.where(bust, 0, n_thrown).astype(np.int8)
+
+    order = np.argsort(start, kind='mergesort')
+    return dict(
+        start=start[order],
+        end=end[order],
+        n_darts=n_darts[order],
+        n_thrown=n_thrown[order],
+        shot_types=darts[order, :, 0].astype(np.int8),
+        results=darts[order, :, 1].astype(np.int8),
+        points=darts[order, :, 2],
+        probs=probs[order],
+    )
+
+
+class VisitTable(CompiledSimContext):
+
+    """
+    A compiled context with a table of its profile's visit outcomes.
+
+    Build one with `compile_visits` rather than directly.
+
+    :ivar width: number of columns in each start score's alias table: the
+        most visit sequences from any score
+    :ivar accept: array of shape (total + 1, width) of alias acceptance
+        probabilities
+    :ivar alias: array of shape (total + 1, width) of aliases
+    :ivar sequence: array of shape (total + 1, width) mapping each column
+        of a start score's alias table to a visit sequence
+    """
+
+    def __init__(self, context, total=501):
+        self.__dict__.update(context.__dict__)
+        self.context = context
+        self.total = total
+        self.sequences = visit_sequences(context, total=total)
+
+        starts = self.sequences['start']
+        bounds = np.searchsorted(starts, np.arange(total + 2))
+        self.width = int(np.diff(bounds).max())
+        self.accept = np.ones((total + 1, self.width))
+        self.alias = np.zeros((total + 1, self.width), dtype=np.int32)
+        self.sequence = np.zeros((total + 1, self.width), dtype=np.int32)
+        for score in xrange(2, total + 1):
+            a, b = bounds[score], bounds[score + 1]
+            probs = np.zeros(self.width)
+            probs[:b - a] = self.sequences['probs'][a:b]
+            accept, alias = alias_table(probs / probs.sum())
+            self.accept[score] = accept
+            self.alias[score] = alias
+            # Unused columns are never picked, but point at a real sequence.
+            self.sequence[score] = a + np.minimum(
+                np.arange(self.width),
+                b - a - 1,
+            )
+
+        # Nested lists for `throw_visit`, as with the context's tables.
+        self.accept_table = self.accept.tolist()
+        self.alias_table = self.alias.tolist()
+        self.sequence_table = self.sequence.tolist()
+
+    def for_profile(self, profile):
+        """
+        Return a visit table for another profile, sharing this one's
+        lookups.
+        """
+        return compile_visits(
+            self.context.for_profile(profile),
+            total=self.total,
+        )
+
+    def sample(self, scores, draws):
+        """
+        Pick a visit sequence from each of the given scores.
+
+        :param scores: array of current scores
+        :param draws: array of uniform random numbers in [0, 1), one per
+            score
+        :return: array of indices into ``sequences``
+        """
+        u = draws * self.width
+        column = np.minimum(u.astype(np.intp), self.width - 1)
+        keep = u - column < self.accept[scores, column]
+        column = np.where(keep, column, self.alias[scores, column])
+        return self.sequence[scores, column]
+
+    def throw_visits(self, scores, random_state):
+        """
+        Simulate a visit at each of the given scores, with one draw each.
+
+        Returns the same as `~darts.sim.vectorized.throw_visits`.
+        """
+        chosen = self.sample(scores, random_state.random_sample(scores.size))
+        return (
+            self.sequences['end'][chosen],
+            self.sequences['n_darts'][chosen],
+            self.sequences['shot_types'][chosen],
+            self.sequences['results'][chosen],
+            self.sequences['points'][chosen],
+        )
+
+    def _choose(self, current_score, random_state):
+        u = random_state.random() * self.width
+        column = min(int(u), self.width - 1)
+        if u - column >= self.accept_table[current_score][column]:
+            column = self.alias_table[current_score][column]
+        return self.sequence_table[current_score][column]
+
+    def score_visit(self, current_score, random_state):
+        """
+        Simulate one visit, with one draw, keeping only its totals.
+
+        The equivalent of `~darts.sim.oneplayer.score_visit`: returns the
+        new score and the number of darts counted.
+        """
+        chosen = self._choose(current_score, random_state)
+        return (
+            int(self.sequences['end'][chosen]),
+            int(self.sequences['n_darts'][chosen]),
+        )
+
+    def throw_visit(self, current_score, random_state):
+        """
+        Simulate one visit, with one draw.
+
+        The equivalent of `~darts.sim.oneplayer.throw_three_darts`: returns
+        the new score and the `Dart` tuples thrown, with none after a bust.
+        """
+        chosen = self._choose(current_score, random_state)
+        end = int(self.sequences['end'][chosen])
+        if not self.sequences['n_darts'][chosen]:
+            return end, []
+        return end, [
+            Dart(SHOT_TYPES[shot_type], SHOT_RESULTS[result], points)
+            for shot_type, result, points in zip(
+                self.sequences['shot_types'][chosen].tolist(),
+                self.sequences['results'][chosen].tolist(),
+                self.sequences['points'][chosen].tolist(),
+            )[:self.sequences['n_thrown'][chosen]]
+        ]
+
+    def __repr__(self):
+        return '<VisitTable(profile=%r, sequences=%s)>' % (
+            self.profile,
+            self.sequences['start'].size,
+        )
+
+
+_tables = LRUCache(int(settings.VISIT_TABLE_CACHE_SIZE))
+"Visit tables built by this process, by profile and lookups"
+
+
+def compile_visits(
+        profile,
+        score_shot_types=None,
+        score_points=None,
+        total=501,
+        ):
+    """
+    Return a visit table for a profile.
+
+    Tables are kept per process, so asking again for the same profile and
+    lookups doesn't rebuild the table.
+
+    :param profile: shot profile, or a compiled context in which case the
+        lookups are ignored
+    :type profile: :py:class:`~darts.models.Profile` or
+        :py:class:`~darts.sim.context.CompiledSimContext`
+    :param dict score_shot_types: mapping from (score, dart_number) to
+        shot types, as returned by `~darts.sim.load_lookups`
+    :param dict score_points: mapping from (score, dart ID) to score tuple,
+        as returned by `~darts.sim.load_lookups`.
+    :param int total: Total required to win a leg of darts (default: 501).
+
+    :rtype: VisitTable
+    """
+    if isinstance(profile, VisitTable) and profile.total == total:
+        return profile
+    context = compile_context(
+        profile,
+        score_shot_types,
+        score_points,
+        max_score=total,
+    )
+    key = (
+        profile_key(context),
+        hashlib.sha1(context.shot_types.tobytes()).hexdigest(),
+        hashlib.sha1(context.points.tobytes()).hexdigest(),
+        total,
+    )
+    table = _tables.get(key)
+    if table is None:
+        table = VisitTable(context, total=total)
+        _tables.put(key, table)
+    return table